@@ -6,6 +6,16 @@ from routes.ner_controller_route import ner_controller
 from routes.code_generation_route import code_generation_controller
 from routes.generative_qa_route import generative_qa_controller
 from routes.rag_based_qa_controller_route import rag_based_qa_controller
+from routes.documents_route import documents_controller
+from routes.cache_route import cache_controller
+from routes.metrics_route import metrics_controller
+from routes.jobs_route import jobs_controller
+from routes.routing_route import routing_controller
+from routes.corpus_route import corpus_controller
+from routes.admission_route import admission_controller
+from routes.errors_route import errors_controller
+from controllers.startup import preload, is_pool_child, PRELOAD_EMBEDDINGS, PRELOAD_WARM_UP
+from controllers.job_queue import resume_jobs
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -28,5 +38,40 @@ generative_qa_controller(app)
 # RAG based Q&A
 rag_based_qa_controller(app)
 
+# Uploaded document sessions
+documents_controller(app)
+
+# Persistent multi-document corpus index
+corpus_controller(app)
+
+# Cache statistics
+cache_controller(app)
+
+# Provider routing statistics
+routing_controller(app)
+
+# JSON errors for bad requests, unknown models, shed provider calls and failed chunked work
+errors_controller(app)
+
+# Background summarization and indexing jobs
+jobs_controller(app)
+
+# Prometheus metrics and Server-Timing headers
+metrics_controller(app)
+
+# Rate limits per API key and per provider; after the metrics hooks so refused requests are still timed
+admission_controller(app)
+
+# Nothing below runs in the extraction pool's worker processes, which import this file again
+if not is_pool_child(__name__):
+    # Load the document pipeline and embedding model at startup instead of on the first document
+    # request; under gunicorn (gunicorn.conf.py) this runs once in the master before workers fork
+    if PRELOAD_EMBEDDINGS:
+        preload()
+
+    # Pick up jobs an earlier process left unfinished; a gunicorn master starts no threads, its workers do this after the fork
+    if PRELOAD_WARM_UP != "worker":
+        resume_jobs()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
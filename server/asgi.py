@@ -0,0 +1,35 @@
+import time
+import logging
+from quart import Quart
+from quart_cors import cors
+from routes.async_routes import async_controller
+from controllers.startup import preload, report_ready, PRELOAD_EMBEDDINGS
+from controllers.llm_provider import aclose_clients
+from controllers.executor import run_blocking, shutdown_executor
+from controllers.extraction import shutdown_process_pool
+from controllers.job_queue import resume_jobs
+
+# Async serving mode: uvicorn asgi:app --host 0.0.0.0 --port 5000
+started = time.perf_counter()
+app = Quart(__name__)
+app = cors(app, allow_origin="*")
+# Match Flask, which does not cap upload size by default or cut off long streamed responses
+app.config["MAX_CONTENT_LENGTH"] = None
+app.config["RESPONSE_TIMEOUT"] = None
+
+# All existing routes, with async provider calls
+async_controller(app)
+
+@app.before_serving
+async def startup():
+    # Load the document pipeline and embedding model at startup instead of on the first document request
+    if PRELOAD_EMBEDDINGS:
+        await run_blocking(preload)
+    await run_blocking(resume_jobs)
+    report_ready(started, logging.getLogger("uvicorn.error"))
+
+@app.after_serving
+async def shutdown():
+    await aclose_clients()
+    shutdown_executor()
+    shutdown_process_pool()
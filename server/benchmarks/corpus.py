@@ -0,0 +1,127 @@
+import io
+import random
+import textwrap
+
+# Synthetic documents for the load tests: readable English-like text, rendered as TXT, DOCX and PDF
+
+WORDS = (
+    "the company report revenue growth quarter market customer product service team data system "
+    "model analysis result increase decrease cost price sales region europe asia america board "
+    "director strategy plan project research development network cloud security policy risk "
+    "investment share value profit loss forecast year month week employee manager office factory "
+    "supply chain delivery order contract partner agreement legal patent technology software "
+    "hardware platform user experience design quality standard process operation performance "
+    "energy climate water health science history education government city country river "
+    "mountain forest ocean animal plant food travel culture music language book article paper "
+    "is are was were will can should must may has have had increased reduced improved expanded "
+    "announced reported expected delivered launched approved reviewed measured compared "
+    "significant strong weak stable rapid slow new old large small global local annual early late "
+    "and or but because while although after before during with without within across between"
+).split()
+
+NAMES = ("Alice Martin", "Rahul Sharma", "Chen Wei", "Maria Garcia", "John Smith", "Fatima Khan", "Lukas Meyer")
+PLACES = ("Berlin", "Mumbai", "Tokyo", "Nairobi", "Toronto", "Sydney", "Lisbon", "Denver")
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    # Sprinkle in names, places and figures so NER and summaries have something to find
+    roll = rng.random()
+    if roll < 0.15:
+        words.insert(rng.randrange(len(words)), rng.choice(NAMES))
+    elif roll < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(PLACES))
+    elif roll < 0.4:
+        words.insert(rng.randrange(len(words)), f"{rng.randint(2, 98)} percent")
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + "."
+
+def make_text(characters, seed=0):
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < characters:
+        paragraph = " ".join(sentence(rng) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 1
+    return "\n".join(paragraphs)
+
+def make_txt(text):
+    return text.encode("utf-8")
+
+def make_docx(text):
+    from docx import Document
+
+    document = Document()
+    for paragraph in text.split("\n"):
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+# Minimal PDF writer (Helvetica, one text stream per page) so no PDF library is needed
+def make_pdf(text, lines_per_page=60, line_width=95):
+    lines = []
+    for paragraph in text.split("\n"):
+        lines.extend(textwrap.wrap(paragraph, line_width) or [""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for page in pages:
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td\n" + "".join(f"({_pdf_escape(line)}) Tj T*\n" for line in page) + "ET"
+        stream = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_number = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number)
+        page_numbers.append(len(objects))
+    kids = " ".join(f"{number} 0 R" for number in page_numbers).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_numbers))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+RENDERERS = {"txt": make_txt, "docx": make_docx, "pdf": make_pdf}
+
+class SyntheticDocument:
+    def __init__(self, kind, characters, seed=0):
+        self.kind = kind
+        self.characters = characters
+        self.seed = seed
+        self.text = make_text(characters, seed)
+        self.data = RENDERERS[kind](self.text)
+
+    @property
+    def label(self):
+        return f"{self.kind}-{self.characters // 1000}k"
+
+    @property
+    def filename(self):
+        return f"{self.label}.{self.kind}"
+
+    # A copy whose every line differs, so no cache (index, chunk store, results) can serve it
+    def unique(self, salt):
+        copy = object.__new__(SyntheticDocument)
+        copy.kind, copy.characters, copy.seed = self.kind, self.characters, self.seed
+        copy.text = "\n".join(f"[{salt}] {line}" for line in self.text.split("\n"))
+        copy.data = RENDERERS[self.kind](copy.text)
+        return copy
+
+def build_corpus(kinds=("txt", "docx", "pdf"), sizes=(10_000, 100_000, 1_000_000)):
+    return [SyntheticDocument(kind, size, seed=index) for index, size in enumerate(sizes) for kind in kinds]
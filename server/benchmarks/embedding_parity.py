@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.text_splitter import CharacterTextSplitter
+from controllers.embeddings import EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS
+from controllers.onnx_embeddings import OnnxEmbeddings, EMBEDDING_ONNX_FILE
+from controllers.rag_based_qa import CHUNK_SEPARATOR, CHUNK_SIZE, CHUNK_OVERLAP
+from controllers.tokens import count_tokens
+
+# Checks that the ONNX backend retrieves the same chunks as the HuggingFace backend:
+#   python -m benchmarks.embedding_parity --corpus docs/*.txt --queries queries.txt
+
+SAMPLE_CORPUS = [
+    "The quarterly report shows revenue grew twelve percent, driven by strong demand in the cloud division.",
+    "Operating expenses rose because of new hiring in research and development and higher marketing spend.",
+    "The board approved a share buyback program of two billion dollars over the next eighteen months.",
+    "Customer churn fell to its lowest level in three years after the launch of the loyalty programme.",
+    "Supply chain disruptions in Asia delayed shipments of hardware products during the second month.",
+    "The company expects full-year earnings per share between four and four point two dollars.",
+    "A new data centre in Frankfurt will open next spring to serve European customers with lower latency.",
+    "The legal team settled the patent dispute with a competitor for an undisclosed amount.",
+    "Employee satisfaction surveys highlighted concerns about remote work policies and career growth.",
+    "The chief financial officer will retire at the end of the year after fifteen years with the firm.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose molecules.",
+    "The mitochondria produce most of the cell's supply of adenosine triphosphate.",
+    "Rainforests hold more than half of the world's plant and animal species.",
+    "Glaciers in the Alps have lost a large share of their volume since the nineteenth century.",
+    "The Treaty of Westphalia in 1648 ended the Thirty Years' War in the Holy Roman Empire.",
+    "The printing press spread literacy across Europe in the fifteenth and sixteenth centuries.",
+    "Python lists are dynamic arrays, while tuples are immutable sequences of fixed length.",
+    "A binary search tree keeps keys in sorted order so lookups take logarithmic time on average.",
+    "HTTP keep-alive reuses one TCP connection for several requests to avoid repeated handshakes.",
+    "Vector databases index embeddings so that nearest neighbours can be found quickly.",
+]
+
+SAMPLE_QUERIES = [
+    "How much did revenue grow?",
+    "Who is retiring?",
+    "What happened with the patent lawsuit?",
+    "Where is the new data centre?",
+    "What do cells use for energy?",
+    "Which war ended in 1648?",
+    "How does keep-alive help HTTP performance?",
+    "What is the difference between a list and a tuple?",
+    "Why were shipments delayed?",
+    "What did employees complain about?",
+]
+
+def load_corpus(paths):
+    if not paths:
+        return SAMPLE_CORPUS
+    # The same token-sized chunks the app builds
+    splitter = CharacterTextSplitter(separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=count_tokens)
+    chunks = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            chunks.extend(splitter.split_text(f.read()))
+    return chunks
+
+def load_queries(path):
+    if not path:
+        return SAMPLE_QUERIES
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def embed(embeddings, texts):
+    started = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - started
+
+def top_k(query_vectors, chunk_vectors, k):
+    scores = query_vectors @ chunk_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX embeddings against the HuggingFace backend.")
+    parser.add_argument("--corpus", nargs="*", help="text files to chunk and index (default: built-in sample)")
+    parser.add_argument("--queries", help="file with one query per line (default: built-in sample)")
+    parser.add_argument("--onnx-file", default=EMBEDDING_ONNX_FILE)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--min-recall", type=float, default=0.9, help="required mean overlap of top-k results")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="required mean cosine between backends")
+    args = parser.parse_args()
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    chunks = load_corpus(args.corpus)
+    queries = load_queries(args.queries)
+    k = min(args.k, len(chunks))
+
+    reference = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"}, encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE})
+    candidate = OnnxEmbeddings(EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS, onnx_file=args.onnx_file)
+
+    # Warm both runtimes so load time is not counted as throughput
+    reference.embed_documents(chunks[:2])
+    candidate.embed_documents(chunks[:2])
+
+    reference_chunks, reference_seconds = embed(reference, chunks)
+    candidate_chunks, candidate_seconds = embed(candidate, chunks)
+    reference_queries = np.asarray([reference.embed_query(query) for query in queries], dtype=np.float32)
+    candidate_queries = np.asarray([candidate.embed_query(query) for query in queries], dtype=np.float32)
+
+    cosine = float(np.mean(np.sum(reference_chunks * candidate_chunks, axis=1)))
+    reference_top = top_k(reference_queries, reference_chunks, k)
+    candidate_top = top_k(candidate_queries, candidate_chunks, k)
+    recall = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(reference_top, candidate_top)]))
+    first_match = float(np.mean(reference_top[:, 0] == candidate_top[:, 0]))
+
+    print(f"chunks: {len(chunks)}  queries: {len(queries)}  k: {k}  onnx file: {args.onnx_file}")
+    print(f"huggingface: {len(chunks) / reference_seconds:.1f} chunks/s")
+    print(f"onnx:        {len(chunks) / candidate_seconds:.1f} chunks/s")
+    print(f"mean cosine between backends: {cosine:.4f}")
+    print(f"top-{k} overlap: {recall:.3f}  top-1 match: {first_match:.3f}")
+
+    if recall < args.min_recall or cosine < args.min_cosine:
+        print("FAIL: ONNX retrieval does not match the HuggingFace backend")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+import io
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import resource
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import build_corpus, make_text
+
+# Drives every endpoint of the Flask app with the fake LLM backend and reports throughput, latency
+# percentiles, peak RSS and where the time went per stage (from /metrics).
+#   python -m benchmarks.load_test --requests 50 --concurrency 8 --output results.json
+#   python -m benchmarks.load_test --baseline results.json --max-regression 0.2 --thresholds limits.json
+# --url benchmarks a running server instead (start it with LLM_BACKEND=fake and EMBEDDING_BACKEND=fake).
+
+MODEL = "LLama 3.3 Meta"
+
+class Reply:
+    def __init__(self, status, seconds, ttfb, body):
+        self.status = status
+        self.seconds = seconds
+        self.ttfb = ttfb
+        self.body = body
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body)
+
+# The Flask app in this process, one test client per thread
+class InProcessClient:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, json=None, form=None, file=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        data = dict(form or {})
+        if file is not None:
+            data["file"] = (io.BytesIO(file.data), file.filename)
+
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=json, data=data or None, buffered=False)
+        ttfb = None
+        body = []
+        for chunk in response.iter_encoded():
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            body.append(chunk)
+        response.close()
+        seconds = time.perf_counter() - started
+        return Reply(response.status_code, seconds, ttfb or seconds, b"".join(body))
+
+    def peak_rss_mb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# A server started separately (Flask, gunicorn or uvicorn)
+class HttpClient:
+    def __init__(self, url, pid=None):
+        import httpx
+
+        self.pid = pid
+        self.client = httpx.Client(base_url=url, timeout=600, limits=httpx.Limits(max_connections=256, max_keepalive_connections=256))
+
+    def request(self, method, path, json=None, form=None, file=None):
+        files = {"file": (file.filename, file.data)} if file is not None else None
+        started = time.perf_counter()
+        ttfb = None
+        body = []
+        with self.client.stream(method, path, json=json, data=form, files=files) as response:
+            for chunk in response.iter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                body.append(chunk)
+        seconds = time.perf_counter() - started
+        return Reply(response.status_code, seconds, ttfb or seconds, b"".join(body))
+
+    def peak_rss_mb(self):
+        if self.pid is None:
+            return None
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+        return None
+
+class Scenario:
+    # build(i, state) returns the request to send; setup(client) prepares state shared by all requests
+    def __init__(self, name, build, setup=None):
+        self.name = name
+        self.build = build
+        self.setup = setup
+
+    def call(self, client, i, state):
+        return client.request(**self.build(i, state))
+
+# Submits a job and polls it until it finishes: latency covers the whole job, ttfb the 202
+class JobScenario(Scenario):
+    def call(self, client, i, state):
+        started = time.perf_counter()
+        submitted = client.request(**self.build(i, state))
+        if not submitted.ok:
+            return submitted
+        job_id = submitted.json()["id"]
+        while True:
+            reply = client.request("GET", f"/jobs/{job_id}")
+            if not reply.ok or reply.json()["status"] in ("done", "failed", "cancelled"):
+                break
+            time.sleep(0.02)
+        status = reply.status if not reply.ok or reply.json()["status"] == "done" else 500
+        return Reply(status, time.perf_counter() - started, submitted.seconds, reply.body)
+
+def create_document(client, document):
+    reply = client.request("POST", "/documents", file=document)
+    if not reply.ok:
+        raise RuntimeError(f"Could not create benchmark document {document.label}: {reply.body[:200]!r}")
+    return reply.json()["document_id"]
+
+# Index every benchmark document into the corpus; re-adding an id replaces it, so setups can repeat
+def fill_corpus(client, corpus):
+    for document in corpus:
+        reply = client.request("POST", "/corpus/documents", form={"document_id": f"bench-{document.label}", "tags": document.label}, file=document)
+        if not reply.ok:
+            raise RuntimeError(f"Could not add benchmark document {document.label} to the corpus: {reply.body[:200]!r}")
+
+def build_scenarios(corpus, requests, unique, use_cache):
+    no_cache = not use_cache
+    smallest = min(corpus, key=lambda document: document.characters)
+    snippets = make_text(200_000, seed=99).split(". ")
+    long_text = make_text(50_000, seed=7)
+
+    def snippet(i):
+        return f"{snippets[i % len(snippets)]} ({i})."
+
+    def document_for(document, i):
+        return document.unique(i) if unique else document
+
+    scenarios = [
+        Scenario("generate-answer", lambda i, _: dict(method="POST", path="/generate-answer", json={"text": f"Question {i}: {snippet(i)}?", "model": MODEL})),
+        Scenario("generate-answer-stream", lambda i, _: dict(method="POST", path="/generate-answer?stream=1", json={"text": f"Question {i}: {snippet(i)}?", "model": MODEL})),
+        Scenario("generate-code", lambda i, _: dict(method="POST", path="/generate-code", json={"text": f"Write a function that {snippet(i)}", "model_choice": MODEL, "language": "python", "no_cache": no_cache})),
+        Scenario("analyze_sentiment", lambda i, _: dict(method="POST", path="/analyze_sentiment", json={"text_input": snippet(i), "model": MODEL, "no_cache": no_cache})),
+        Scenario("analyze_sentiment_batch", lambda i, _: dict(method="POST", path="/analyze_sentiment_batch", json={"texts": [snippet(i * 100 + j) for j in range(100)], "model": MODEL, "no_cache": no_cache})),
+        Scenario("extract_entities", lambda i, _: dict(method="POST", path="/extract_entities", json={"text": snippet(i), "model": MODEL, "no_cache": no_cache})),
+        Scenario("extract_entities_batch", lambda i, _: dict(method="POST", path="/extract_entities_batch", json={"texts": [snippet(i * 100 + j) for j in range(100)], "model": MODEL, "no_cache": no_cache})),
+        Scenario("analyze_sentiment-long", lambda i, _: dict(method="POST", path="/analyze_sentiment", json={"text_input": f"({i}) {long_text}", "model": MODEL, "long": True, "no_cache": no_cache})),
+        Scenario("extract_entities-long", lambda i, _: dict(method="POST", path="/extract_entities", json={"text": f"({i}) {long_text}", "model": MODEL, "long": True, "no_cache": no_cache})),
+        Scenario("summarize-text", lambda i, _: dict(method="POST", path="/summarize-text", json={"text": f"({i}) {smallest.text}", "model": MODEL})),
+        Scenario("answer-query-from-document-stream", lambda i, _: dict(method="POST", path="/answer-query-from-document?stream=1", form={"query": "What was reported about revenue?", "model": MODEL}, file=document_for(smallest, i))),
+    ]
+
+    for document in corpus:
+        scenarios += [
+            Scenario(f"summarize-doc[{document.label}]", lambda i, _, d=document: dict(method="POST", path="/summarize-doc", form={"model": MODEL}, file=document_for(d, i))),
+            Scenario(f"answer-query-from-document[{document.label}]", lambda i, _, d=document: dict(method="POST", path="/answer-query-from-document", form={"query": "What was reported about revenue?", "model": MODEL}, file=document_for(d, i))),
+            Scenario(f"documents[{document.label}]", lambda i, _, d=document: dict(method="POST", path="/documents", file=document_for(d, i))),
+            Scenario(f"documents-query[{document.label}]", lambda i, document_id: dict(method="POST", path=f"/documents/{document_id}/query", json={"query": f"What happened in {snippet(i)[:40]}?", "model": MODEL}), setup=lambda client, d=document: create_document(client, d)),
+            Scenario(f"documents-summarize[{document.label}]", lambda i, document_id: dict(method="POST", path=f"/documents/{document_id}/summarize", json={"model": MODEL}), setup=lambda client, d=document: create_document(client, d)),
+        ]
+
+    scenarios += [
+        Scenario("corpus-documents", lambda i, _: dict(method="POST", path="/corpus/documents", form={"document_id": f"bench-add-{i}"}, file=smallest.unique(i))),
+        Scenario("corpus-search", lambda i, _: dict(method="POST", path="/corpus/search", json={"query": f"What happened in {snippet(i)[:40]}?", "k": 5}), setup=lambda client: fill_corpus(client, corpus)),
+        Scenario("corpus-query", lambda i, _: dict(method="POST", path="/corpus/query", json={"query": f"What happened in {snippet(i)[:40]}?", "model": MODEL}), setup=lambda client: fill_corpus(client, corpus)),
+        Scenario("corpus-query-stream", lambda i, _: dict(method="POST", path="/corpus/query?stream=1", json={"query": f"What happened in {snippet(i)[:40]}?", "model": MODEL}), setup=lambda client: fill_corpus(client, corpus)),
+        Scenario("jobs-submit", lambda i, _: dict(method="POST", path="/jobs/index", file=document_for(smallest, i))),
+        JobScenario("jobs-summarize", lambda i, _: dict(method="POST", path="/jobs/summarize", form={"model": MODEL}, file=document_for(smallest, i))),
+        JobScenario("jobs-index", lambda i, _: dict(method="POST", path="/jobs/index", file=document_for(smallest, i))),
+        Scenario("documents-delete", lambda i, ids: dict(method="DELETE", path=f"/documents/{ids[i]}"), setup=lambda client: [create_document(client, smallest) for _ in range(requests)]),
+        Scenario("cache-stats", lambda i, _: dict(method="GET", path="/cache-stats")),
+        Scenario("metrics", lambda i, _: dict(method="GET", path="/metrics")),
+    ]
+    return scenarios
+
+# Summed stage and LLM time so far, read from the app's own Prometheus histograms
+def read_stage_totals(client):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    totals = {}
+    reply = client.request("GET", "/metrics")
+    for family in text_string_to_metric_families(reply.body.decode("utf-8")):
+        for sample in family.samples:
+            if family.name == "coba_stage_seconds" and sample.name.endswith("_sum"):
+                key = sample.labels["stage"]
+            elif family.name == "coba_llm_seconds" and sample.name.endswith("_sum"):
+                key = "llm"
+            elif family.name == "coba_llm_seconds" and sample.name.endswith("_count"):
+                key = "llm_calls"
+            else:
+                continue
+            totals[key] = totals.get(key, 0) + sample.value
+    return totals
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def run_scenario(client, scenario, requests, concurrency, warmup):
+    state = scenario.setup(client) if scenario.setup else None
+    # documents-delete consumes one id per request, so it cannot be warmed up
+    for i in range(warmup if scenario.name != "documents-delete" else 0):
+        scenario.call(client, requests + i, state)
+
+    before = read_stage_totals(client)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        replies = list(pool.map(lambda i: scenario.call(client, i, state), range(requests)))
+    elapsed = time.perf_counter() - started
+    after = read_stage_totals(client)
+
+    latencies = [reply.seconds * 1000 for reply in replies]
+    ttfbs = [reply.ttfb * 1000 for reply in replies]
+    errors = [reply for reply in replies if not reply.ok]
+    stages = {name: (after[name] - before.get(name, 0)) / requests for name in after if after[name] != before.get(name, 0)}
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "error_rate": len(errors) / requests,
+        "first_error": f"{errors[0].status} {errors[0].body[:200].decode('utf-8', 'replace')}" if errors else None,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "ttfb_p50_ms": percentile(ttfbs, 0.50),
+        "peak_rss_mb": client.peak_rss_mb(),
+        # Per request; under concurrency and map-reduce these are summed over parallel work
+        "stages_ms": {name: value * 1000 for name, value in stages.items() if name != "llm_calls"},
+        "llm_calls": stages.get("llm_calls", 0),
+    }
+
+def print_result(name, result):
+    rss = f"{result['peak_rss_mb']:.0f}MB" if result["peak_rss_mb"] is not None else "n/a"
+    print(f"{name:<44} {result['rps']:>8.1f}/s  p50 {result['p50_ms']:>8.1f}ms  p95 {result['p95_ms']:>8.1f}ms  "
+          f"p99 {result['p99_ms']:>8.1f}ms  ttfb {result['ttfb_p50_ms']:>7.1f}ms  rss {rss}  errors {result['errors']}")
+    if result["stages_ms"]:
+        stages = ", ".join(f"{name} {value:.1f}ms" for name, value in sorted(result["stages_ms"].items(), key=lambda item: -item[1]))
+        print(f"{'':<44} {stages}; {result['llm_calls']:.1f} LLM calls")
+    if result["first_error"]:
+        print(f"{'':<44} first error: {result['first_error']}")
+
+# Limits by scenario name (fnmatch patterns, later patterns override earlier), plus a baseline comparison
+def check_results(results, thresholds, baseline, max_regression):
+    failures = []
+    for name, result in results.items():
+        limits = {"max_error_rate": 0.0}
+        for pattern, values in thresholds.items():
+            if fnmatch.fnmatch(name, pattern):
+                limits.update(values)
+
+        if result["error_rate"] > limits["max_error_rate"]:
+            failures.append(f"{name}: error rate {result['error_rate']:.2%} > {limits['max_error_rate']:.2%}")
+        for key in ("p50_ms", "p95_ms", "p99_ms", "ttfb_p50_ms"):
+            if key in limits and result[key] > limits[key]:
+                failures.append(f"{name}: {key} {result[key]:.1f} > {limits[key]}")
+        if "min_rps" in limits and result["rps"] < limits["min_rps"]:
+            failures.append(f"{name}: {result['rps']:.1f} req/s < {limits['min_rps']}")
+        if "max_rss_mb" in limits and result["peak_rss_mb"] is not None and result["peak_rss_mb"] > limits["max_rss_mb"]:
+            failures.append(f"{name}: peak RSS {result['peak_rss_mb']:.0f}MB > {limits['max_rss_mb']}MB")
+
+        previous = baseline.get(name)
+        if previous:
+            if result["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+                failures.append(f"{name}: p95 {result['p95_ms']:.1f}ms regressed from {previous['p95_ms']:.1f}ms")
+            if result["rps"] < previous["rps"] * (1 - max_regression):
+                failures.append(f"{name}: throughput {result['rps']:.1f}/s regressed from {previous['rps']:.1f}/s")
+    return failures
+
+# The fake backend echoes the prompt, which fails every chunk of the long-text modes; answer their chunk
+# prompts in the shape they ask for so that parsing and merging are measured too. With --url the long
+# scenarios need a server whose provider follows the prompts.
+def chunk_answers():
+    from controllers import sentiment_analyzer, ner_extractor
+
+    sentiment = sentiment_analyzer.build_chunk_prompt("").split("Text:")[0]
+    entities = ner_extractor.build_chunk_prompt("").split("Text:")[0]
+
+    def respond(model_id, prompt):
+        if prompt.startswith(sentiment):
+            return "neutral 0.1"
+        if prompt.startswith(entities):
+            return json.dumps({"Persons": ["Alice Martin"], "Locations": ["Berlin"]})
+        return f"Fake response from {model_id} to a {len(prompt)} character prompt."
+    return respond
+
+def in_process_client(args):
+    # Set before the app is imported: every module reads its settings at import time
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.llm_tokens_per_second)
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    if not args.keep_caches:
+        cache_dir = tempfile.mkdtemp(prefix="coba-bench-")
+        os.environ["INDEX_CACHE_DIR"] = os.path.join(cache_dir, "faiss")
+        os.environ["CHUNK_STORE_DIR"] = os.path.join(cache_dir, "chunks")
+        os.environ["RESULT_CACHE_DB"] = ""
+    # Documents, jobs and the corpus always start empty and never land in the working tree
+    state_dir = tempfile.mkdtemp(prefix="coba-bench-state-")
+    os.environ["DOCUMENT_DB"] = os.path.join(state_dir, "documents.sqlite3")
+    os.environ["JOBS_DB"] = os.path.join(state_dir, "jobs.sqlite3")
+    os.environ["JOBS_DIR"] = os.path.join(state_dir, "jobs")
+    os.environ["CORPUS_DIR"] = os.path.join(state_dir, "corpus")
+
+    import logging
+    from app import app
+    from controllers.llm_provider import FakeBackend, register_backend
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    register_backend("fake", FakeBackend(response=chunk_answers()))
+    return InProcessClient(app)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test every endpoint with the fake LLM backend.")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in this process")
+    parser.add_argument("--server-pid", type=int, help="with --url, report this process's peak RSS")
+    parser.add_argument("--requests", type=int, default=20, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured requests per scenario")
+    parser.add_argument("--scenarios", nargs="*", default=["*"], help="fnmatch patterns of scenarios to run")
+    parser.add_argument("--kinds", default="txt,docx,pdf")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="document sizes in characters")
+    parser.add_argument("--unique", action="store_true", help="send a different document every request so no cache can serve it")
+    parser.add_argument("--use-cache", action="store_true", help="let the result cache answer repeated requests")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM latency in seconds")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0, help="fake LLM output rate; 0 returns at once")
+    parser.add_argument("--embedding-backend", default="fake", help="fake, huggingface or onnx (in-process only)")
+    parser.add_argument("--keep-caches", action="store_true", help="reuse the configured cache directories")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95/throughput change from the baseline")
+    parser.add_argument("--thresholds", help='JSON limits, e.g. {"generate-answer": {"p95_ms": 150, "min_rps": 40}}')
+    args = parser.parse_args()
+
+    client = HttpClient(args.url, args.server_pid) if args.url else in_process_client(args)
+    corpus = build_corpus(kinds=tuple(args.kinds.split(",")), sizes=tuple(int(size) for size in args.sizes.split(",")))
+    scenarios = [scenario for scenario in build_scenarios(corpus, args.requests, args.unique, args.use_cache)
+                 if any(fnmatch.fnmatch(scenario.name, pattern) for pattern in args.scenarios)]
+
+    print(f"{len(scenarios)} scenarios, {args.requests} requests each, concurrency {args.concurrency}, "
+          f"fake LLM latency {args.llm_latency}s, {'in-process' if not args.url else args.url}")
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(client, scenario, args.requests, args.concurrency, args.warmup)
+        print_result(scenario.name, results[scenario.name])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "scenarios": results}, f, indent=2)
+
+    thresholds = {}
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["scenarios"]
+
+    failures = check_results(results, thresholds, baseline, args.max_regression)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from controllers.metrics import observe_admission_shed, observe_admission_wait, set_admission_queue_depth
+from controllers.tokens import estimate_tokens
+
+load_dotenv()
+# Per client key; 0 turns a limit off. Keys are read from ADMISSION_KEY_HEADER, falling back to the client address.
+ADMISSION_KEY_HEADER = os.getenv("ADMISSION_KEY_HEADER", "X-API-Key")
+ADMISSION_KEY_RPM = float(os.getenv("ADMISSION_KEY_RPM", "0"))
+ADMISSION_KEY_TPM = float(os.getenv("ADMISSION_KEY_TPM", "0"))  # request body tokens, about four bytes each
+ADMISSION_MAX_KEYS = int(os.getenv("ADMISSION_MAX_KEYS", "10000"))
+# Per provider: waiting calls beyond the queue size, or whose turn comes after the deadline, are shed at once
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_COMPLETION_TOKENS = int(os.getenv("ADMISSION_COMPLETION_TOKENS", "512"))  # expected answer size, charged up front
+
+# Requests and tokens per minute a provider accepts, e.g. TOGETHER_RPM=600, GEMINI_TPM=1000000; 0 is unlimited
+def provider_limits(name):
+    return float(os.getenv(f"{name.upper()}_RPM", "0")), float(os.getenv(f"{name.upper()}_TPM", "0"))
+
+class AdmissionError(Exception):
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    # Whole seconds for the Retry-After header
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+# The client's own limit ran out
+class RateLimitedError(AdmissionError):
+    status_code = 429
+
+# The service is saturated: a provider's queue is full or would not get to the call in time
+class OverloadedError(AdmissionError):
+    status_code = 503
+
+# A bucket refilling continuously at per_minute / 60 per second, holding at most one minute's worth.
+# Takes may overdraw it: the deficit is the time the taker has to wait, so waiters are served in
+# the order they arrived.
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until amount would be available
+    def wait_for(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def available(self, now):
+        self._refill(now)
+        return max(0.0, self.level)
+
+# Request and token buckets that are charged together; a missing one is unlimited
+class Limiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+
+    def wait_for(self, tokens, now):
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_for(1, now))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_for(tokens, now))
+        return max(waits)
+
+    def take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def stats(self, now):
+        return {
+            "available_requests": round(self.requests.available(now), 2) if self.requests else None,
+            "available_tokens": round(self.tokens.available(now)) if self.tokens else None
+        }
+
+# Provider calls reserve their share of the provider's buckets and wait out any deficit. At most
+# queue_size calls wait per provider; a call that would wait past the deadline is refused before
+# it waits at all, so overload turns into fast 503s instead of piling up threads.
+class ProviderAdmission:
+    def __init__(self, name, queue_size=ADMISSION_QUEUE_SIZE, timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limiter = Limiter(*provider_limits(name))
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self):
+        return self.limiter.requests is not None or self.limiter.tokens is not None
+
+    def _reserve(self, tokens):
+        with self._lock:
+            wait = self.limiter.wait_for(tokens, time.monotonic())
+            if wait > 0 and self.waiting >= self.queue_size:
+                observe_admission_shed(self.name, "queue_full")
+                raise OverloadedError(f"{self.name} is at capacity, try again shortly", wait)
+            if wait > self.timeout:
+                observe_admission_shed(self.name, "deadline")
+                raise OverloadedError(f"{self.name} is at capacity, try again shortly", wait)
+            self.limiter.take(tokens)
+            if wait > 0:
+                self.waiting += 1
+                set_admission_queue_depth(self.name, self.waiting)
+        observe_admission_wait(self.name, wait)
+        return wait
+
+    def _release(self):
+        with self._lock:
+            self.waiting -= 1
+            set_admission_queue_depth(self.name, self.waiting)
+
+    def acquire(self, tokens):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._release()
+
+    async def aacquire(self, tokens):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._release()
+
+    def stats(self):
+        rpm, tpm = provider_limits(self.name)
+        with self._lock:
+            return dict(self.limiter.stats(time.monotonic()), rpm=rpm or None, tpm=tpm or None, queued=self.waiting)
+
+# Client keys never wait: a key over its limit is answered 429 straight away
+class KeyAdmission:
+    def __init__(self, rpm=ADMISSION_KEY_RPM, tpm=ADMISSION_KEY_TPM, max_keys=ADMISSION_MAX_KEYS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_keys = max_keys
+        self._limiters = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rpm > 0 or self.tpm > 0
+
+    def admit(self, key, tokens):
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = Limiter(self.rpm, self.tpm)
+                # Least recently seen keys are forgotten, which only ever refills their buckets
+                while len(self._limiters) > self.max_keys:
+                    self._limiters.popitem(last=False)
+            self._limiters.move_to_end(key)
+            wait = limiter.wait_for(tokens, time.monotonic())
+            if wait > 0:
+                observe_admission_shed("key", "rate_limited")
+                raise RateLimitedError("Rate limit exceeded for this API key", wait)
+            limiter.take(tokens)
+
+    def stats(self):
+        with self._lock:
+            return {"rpm": self.rpm or None, "tpm": self.tpm or None, "tracked": len(self._limiters)}
+
+key_admission = KeyAdmission()
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def provider_admission(name):
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = ProviderAdmission(name)
+        return _providers[name]
+
+# Called before every provider request, with the prompt about to be sent
+def admit_call(backend_name, prompt):
+    admission = provider_admission(backend_name)
+    if admission.limited:
+        admission.acquire(estimate_tokens(prompt) + ADMISSION_COMPLETION_TOKENS)
+
+async def aadmit_call(backend_name, prompt):
+    admission = provider_admission(backend_name)
+    if admission.limited:
+        await admission.aacquire(estimate_tokens(prompt) + ADMISSION_COMPLETION_TOKENS)
+
+# Checked as each request arrives; body_bytes is the request's Content-Length
+def admit_request(key, body_bytes):
+    if key_admission.enabled:
+        key_admission.admit(key, max(1, (body_bytes or 0) // 4))
+
+def admission_stats():
+    with _providers_lock:
+        providers = dict(_providers)
+    return {
+        "keys": key_admission.stats(),
+        "providers": {name: admission.stats() for name, admission in providers.items()}
+    }
@@ -0,0 +1,116 @@
+import os
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from controllers.tokens import count_tokens
+from controllers.executor import inherit_context, run_blocking
+from controllers.admission import AdmissionError
+
+load_dotenv()
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "3000"))
+BATCH_MAX_ITEMS_PER_PROMPT = int(os.getenv("BATCH_MAX_ITEMS_PER_PROMPT", "40"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_TEXTS = int(os.getenv("BATCH_MAX_TEXTS", "1000"))
+
+_indexed_line = re.compile(r"^\s*\[(\d+)\]\s*(.*?)\s*$")
+
+# Items are packed on one line each, so embedded newlines are folded into spaces
+def flatten(text):
+    return " ".join(text.split())
+
+# Group item indexes greedily, in input order, so each prompt stays within the token budget
+def pack_items(texts, overhead_tokens, budget=BATCH_TOKEN_BUDGET, max_items=BATCH_MAX_ITEMS_PER_PROMPT):
+    packs = []
+    current = []
+    used = overhead_tokens
+    for index, text in enumerate(texts):
+        tokens = count_tokens(flatten(text)) + 4  # index marker and newline
+        if current and (used + tokens > budget or len(current) >= max_items):
+            packs.append(current)
+            current = []
+            used = overhead_tokens
+        current.append(index)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def format_items(texts, indexes):
+    return "\n".join(f"[{position}] {flatten(texts[index])}" for position, index in enumerate(indexes))
+
+# Parse "[position] value" lines; positions are local to the pack
+def parse_indexed_lines(output):
+    values = {}
+    for line in output.splitlines():
+        match = _indexed_line.match(line)
+        if match:
+            values[int(match.group(1))] = match.group(2)
+    return values
+
+def _collect(results, indexes, output, parse_value, error):
+    if error is not None:
+        for index in indexes:
+            results[index] = {"error": str(error)}
+        return
+
+    values = parse_indexed_lines(output)
+    for position, index in enumerate(indexes):
+        if position not in values:
+            results[index] = {"error": "No result returned for this item"}
+            continue
+        try:
+            results[index] = parse_value(values[position])
+        except ValueError as e:
+            results[index] = {"error": str(e)}
+
+# A batch refused outright by admission control is answered with its status instead of one error per text
+def raise_if_all_shed(outcomes):
+    if all(isinstance(error, AdmissionError) for _, error in outcomes):
+        raise outcomes[0][1]
+
+def validate_batch(texts):
+    if not isinstance(texts, list) or not texts:
+        raise ValueError("texts must be a non-empty list")
+    if len(texts) > BATCH_MAX_TEXTS:
+        raise ValueError(f"At most {BATCH_MAX_TEXTS} texts can be sent in one batch")
+    if not all(isinstance(text, str) and text.strip() for text in texts):
+        raise ValueError("Every item in texts must be a non-empty string")
+
+# Pack texts into prompts, send the packs concurrently and return one result or error per text, in input order
+# The instructions around the items count against every pack's budget
+def run_batch(texts, build_prompt, parse_value, call):
+    packs = pack_items(texts, count_tokens(build_prompt("")))
+    results = [None] * len(texts)
+
+    def run_pack(indexes):
+        try:
+            return call(build_prompt(format_items(texts, indexes))), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_CONCURRENCY, len(packs)), initializer=inherit_context()) as pool:
+        outcomes = list(pool.map(run_pack, packs))
+    raise_if_all_shed(outcomes)
+    for indexes, (output, error) in zip(packs, outcomes):
+        _collect(results, indexes, output, parse_value, error)
+    return results
+
+async def arun_batch(texts, build_prompt, parse_value, call):
+    # Packing tokenizes every text, so it runs off the event loop
+    packs = await run_blocking(pack_items, texts, count_tokens(build_prompt("")))
+    results = [None] * len(texts)
+    limit = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def run_pack(indexes):
+        async with limit:
+            try:
+                return await call(build_prompt(format_items(texts, indexes))), None
+            except Exception as e:
+                return None, e
+
+    outcomes = await asyncio.gather(*[run_pack(indexes) for indexes in packs])
+    raise_if_all_shed(outcomes)
+    for indexes, (output, error) in zip(packs, outcomes):
+        _collect(results, indexes, output, parse_value, error)
+    return results
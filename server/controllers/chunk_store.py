@@ -0,0 +1,232 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+from controllers.embeddings import get_embeddings, EMBEDDING_ID
+from controllers.metrics import stage
+from controllers.progress import report_progress, set_progress
+
+load_dotenv()
+CHUNK_STORE_ENABLED = os.getenv("CHUNK_STORE_ENABLED", "true").lower() == "true"
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", os.path.join(".cache", "chunks"))
+CHUNK_STORE_MAX_ROWS = int(os.getenv("CHUNK_STORE_MAX_ROWS", "2000000"))
+
+# Chunks are embedded in slices so long documents report progress and can be cancelled in between
+EMBED_SLICE_SIZE = 512
+
+KEY_BYTES = 16
+KEY_DTYPE = f"S{KEY_BYTES}"
+
+def embed_texts(embeddings, texts):
+    vectors = []
+    for start in range(0, len(texts), EMBED_SLICE_SIZE):
+        batch = texts[start:start + EMBED_SLICE_SIZE]
+        vectors.extend(embeddings.embed_documents(batch))
+        report_progress("chunks_embedded", len(batch))
+    return np.asarray(vectors, dtype=np.float32)
+
+def chunk_key(text, model=EMBEDDING_ID):
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+# Append-only store of chunk embeddings for one model:
+#   keys.bin     16-byte digest per row, in row order
+#   vectors.f32  float32 rows, memory-mapped for reads
+#   meta.json    model name, vector dimension and a generation bumped by every compaction
+# Lookups use a sorted copy of the keys plus a dict of rows appended since it was built.
+class ChunkStore:
+    def __init__(self, directory=CHUNK_STORE_DIR, model=EMBEDDING_ID, max_rows=CHUNK_STORE_MAX_ROWS):
+        self.model = model
+        self.max_rows = max_rows
+        self.directory = os.path.join(directory, hashlib.sha1(model.encode("utf-8")).hexdigest()[:16])
+        self.keys_path = os.path.join(self.directory, "keys.bin")
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.lock_path = os.path.join(self.directory, "lock")
+        self.dim = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset_index()
+
+    def _reset_index(self):
+        self._sorted_keys = np.empty(0, dtype=KEY_DTYPE)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._recent = {}
+        self._vectors = None
+        self._rows = 0
+
+    # Cross-process lock so several workers can append to the same files
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": self.model, "dim": self.dim, "generation": self._generation}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    # Rows are only trusted once both files hold them; a writer may have died between the two writes
+    def _disk_rows(self):
+        if not self.dim or not os.path.exists(self.keys_path) or not os.path.exists(self.vectors_path):
+            return 0
+        return min(os.path.getsize(self.keys_path) // KEY_BYTES, os.path.getsize(self.vectors_path) // (4 * self.dim))
+
+    def _load(self):
+        meta = self._read_meta()
+        self.dim = meta.get("dim")
+        self._generation = meta.get("generation", 0)
+        self._reset_index()
+        rows = self._disk_rows()
+        if rows:
+            keys = np.fromfile(self.keys_path, dtype=KEY_DTYPE, count=rows)
+            order = np.argsort(keys, kind="stable")
+            self._sorted_keys = keys[order]
+            self._sorted_rows = order.astype(np.int64)
+            self._rows = rows
+            self._remap()
+        self._loaded = True
+
+    # Row numbers change when any process compacts, so reload whenever the generation moves
+    def _ensure_loaded(self):
+        if not self._loaded or self._read_meta().get("generation", 0) != self._generation:
+            self._load()
+
+    def _find(self, key):
+        row = self._recent.get(key)
+        if row is not None:
+            return row
+        position = np.searchsorted(self._sorted_keys, key)
+        if position < len(self._sorted_keys) and self._sorted_keys[position] == key:
+            return int(self._sorted_rows[position])
+        return None
+
+    def _remap(self):
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim)) if self._rows else None
+
+    def _append(self, keys, vectors):
+        with self._file_lock():
+            self._ensure_loaded()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta()
+
+            # Another process may have appended since we loaded; pick up at the current end of file
+            start = self._disk_rows()
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(start * self.dim * 4)
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.truncate(start * KEY_BYTES)
+                f.write(b"".join(keys))
+
+        for offset, key in enumerate(keys):
+            self._recent[key] = start + offset
+        self._rows = start + len(keys)
+        self._remap()
+
+    # Vectors for each chunk, embedding only the chunks this model has never seen
+    def embed_chunks(self, chunks, embeddings=None):
+        embeddings = embeddings or get_embeddings()
+        keys = [chunk_key(chunk, self.model) for chunk in chunks]
+        texts = dict(zip(keys, chunks))
+
+        with self._lock:
+            self._ensure_loaded()
+            missing = [key for key in texts if self._find(key) is None]
+        report_progress("chunks_embedded", len(texts) - len(missing))
+
+        # Embedding runs outside the lock; rows are looked up again afterwards because a
+        # compaction in this or another process may have renumbered them meanwhile
+        for _ in range(3):
+            new_vectors = None
+            if missing:
+                new_vectors = embed_texts(embeddings, [texts[key] for key in missing])
+
+            with self._lock:
+                if missing:
+                    self._append(missing, new_vectors)
+                else:
+                    self._ensure_loaded()
+                rows = [self._find(key) for key in keys]
+                if None not in rows:
+                    vectors = [np.array(self._vectors[row]) for row in rows]
+                    needs_compaction = self._rows > self.max_rows * 1.25
+                    break
+                missing = [key for key in texts if self._find(key) is None]
+        else:
+            return list(embed_texts(embeddings, chunks))
+
+        if needs_compaction:
+            self.compact()
+        return vectors
+
+    # Rewrite the files without duplicate keys, keeping at most max_rows of the newest rows
+    def compact(self):
+        with self._lock, self._file_lock():
+            self._load()
+            if not self._rows:
+                return
+            keys = np.fromfile(self.keys_path, dtype=KEY_DTYPE, count=self._rows)
+            # Keep the last occurrence of each key, then the newest max_rows of those
+            _, last_from_end = np.unique(keys[::-1], return_index=True)
+            keep = np.sort(self._rows - 1 - last_from_end)[-self.max_rows:]
+
+            tmp_keys = self.keys_path + ".tmp"
+            tmp_vectors = self.vectors_path + ".tmp"
+            keys[keep].tofile(tmp_keys)
+            vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+            with open(tmp_vectors, "wb") as f:
+                for start in range(0, len(keep), 65536):
+                    f.write(np.ascontiguousarray(vectors[keep[start:start + 65536]]).tobytes())
+            del vectors
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_keys, self.keys_path)
+            self._generation += 1
+            self._write_meta()
+            self._load()
+
+    @property
+    def rows(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._rows
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_chunk_store(model=EMBEDDING_ID):
+    with _stores_lock:
+        if model not in _stores:
+            _stores[model] = ChunkStore(model=model)
+        return _stores[model]
+
+# Build a FAISS knowledge base from chunks, reusing stored vectors for chunks seen before
+def build_faiss_index(chunks):
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = get_embeddings()
+    set_progress("chunks_total", len(chunks))
+    with stage("embedding"):
+        if CHUNK_STORE_ENABLED:
+            vectors = get_chunk_store().embed_chunks(chunks, embeddings)
+        else:
+            vectors = embed_texts(embeddings, chunks)
+    with stage("faiss_build"):
+        return FAISS.from_embeddings(list(zip(chunks, vectors)), embeddings)
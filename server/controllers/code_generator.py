@@ -1,49 +1,20 @@
-import os
-from together import Together
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-load_dotenv() 
-TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Function to call models
-def call_model(model, query):
-    if model == "LLama 3.3 Meta":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": query}]
-        )
-        return response.choices[0].message.content.strip()
-
-    elif model == "Google Gemini":
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=query
-        )
-        return response.text.strip()
-
-    elif model == "Deepseek":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free",
-            messages=[{"role": "user", "content": query}]
-        )
-        return response.choices[0].message.content.strip()
-    
-# Function to extract code based on user query and selected model and language
-def extract_code(query, model, language='python'):
-    valid_languages = ['python', 'java', 'C++', 'javascript']
+from controllers.metrics import stage
+from controllers.llm_provider import call_model, acall_model, stream_model
+from controllers.result_cache import cached_result, acached_result
+
+VALID_LANGUAGES = ['python', 'java', 'C++', 'javascript']
 
+# Bump when the prompt changes so cached results from the old prompt are not reused
+PROMPT_VERSION = 1
+
+# Create a prompt based on the user's selected language
+@stage("prompt_build")
+def build_prompt(query, language):
     # Validate if the provided language is supported
-    if language not in valid_languages:
-        raise ValueError(f"Invalid language selected. Supported languages are: {', '.join(valid_languages)}")
+    if language not in VALID_LANGUAGES:
+        raise ValueError(f"Invalid language selected. Supported languages are: {', '.join(VALID_LANGUAGES)}")
 
-    if query:
-        # Create a prompt based on the user's selected language
-        prompt = f"""You are a highly skilled {language} code generator. Your task is to produce clean, efficient, and directly executable {language} code based on the user's request.
+    return f"""You are a highly skilled {language} code generator. Your task is to produce clean, efficient, and directly executable {language} code based on the user's request.
 
         Instructions:
         1. Understand the user's request precisely.
@@ -53,6 +24,25 @@ def extract_code(query, model, language='python'):
         
         User Request: {query}
         """
-        
+
+# Function to extract code based on user query and selected model and language
+def extract_code(query, model, language='python', use_cache=True):
+    prompt = build_prompt(query, language)
+
+    if query:
         # Call the appropriate model and get the response
-        return call_model(model, prompt)
\ No newline at end of file
+        return cached_result("code", query, model, PROMPT_VERSION,
+                             lambda: call_model(model, prompt).strip(), language=language, use_cache=use_cache)
+
+async def aextract_code(query, model, language='python', use_cache=True):
+    prompt = build_prompt(query, language)
+
+    async def compute():
+        return (await acall_model(model, prompt)).strip()
+
+    if query:
+        return await acached_result("code", query, model, PROMPT_VERSION, compute, language=language, use_cache=use_cache)
+
+# Same code, yielded token by token as the provider produces it
+def stream_code(query, model, language='python'):
+    return stream_model(model, build_prompt(query, language))
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+import json
+from dotenv import load_dotenv
+from controllers.metrics import stage, observe_prompt_tokens
+from controllers.tokens import count_tokens, tokenizer_name
+
+load_dotenv()
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # models missing from CONTEXT_TOKEN_BUDGETS
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "20"))  # candidates retrieved before packing
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1 ranks by relevance only, lower favours diversity
+CONTEXT_MIN_OVERLAP = 32  # characters shared before two chunks count as overlapping
+
+# Whole-prompt token budget per model: question, instructions and context together
+DEFAULT_CONTEXT_BUDGETS = {
+    "LLama 3.3 Meta": 4000,
+    "Deepseek": 4000,
+    "Google Gemini": 8000
+}
+CONTEXT_TOKEN_BUDGETS = json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "") or "null") or DEFAULT_CONTEXT_BUDGETS
+
+CONTEXT_SEPARATOR = "\n\n"
+
+def token_budget(model):
+    return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+# Length of the longest suffix of left that is also a prefix of right
+def _overlap(left, right):
+    probe = right[:CONTEXT_MIN_OVERLAP]
+    if len(probe) < CONTEXT_MIN_OVERLAP:
+        return 0
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+# The part of text not already in the selected chunks: duplicates are dropped and the overlap the
+# splitter leaves between neighbouring chunks is cut from either end
+def novel_text(text, selected):
+    for other in selected:
+        if text in other:
+            return ""
+    start, end = 0, len(text)
+    for other in selected:
+        start = max(start, _overlap(other, text))
+        end = min(end, len(text) - _overlap(text, other))
+    return text[start:end].strip() if start < end else ""
+
+# Maximal marginal relevance with a token budget: repeatedly take the candidate most relevant to the
+# query and least similar to what is already taken, keeping it only if its new text still fits.
+# vectors are L2-normalized rows, relevance the query's similarity to each; without vectors candidates
+# are taken in relevance order.
+@stage("context_pack")
+def pack_chunks(texts, vectors, relevance, budget, lambda_mult=CONTEXT_MMR_LAMBDA):
+    import numpy as np
+
+    remaining = list(range(len(texts)))
+    taken = []
+    pieces = []
+    used = 0
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    while remaining and used < budget:
+        scores = lambda_mult * relevance[remaining]
+        if taken and vectors is not None:
+            redundancy = (vectors[remaining] @ vectors[taken].T).max(axis=1)
+            scores = scores - (1 - lambda_mult) * redundancy
+        index = remaining.pop(int(np.argmax(scores)))
+
+        piece = novel_text(texts[index], [texts[other] for other in taken])
+        if not piece:
+            continue
+        tokens = count_tokens(piece) + (separator_tokens if pieces else 0)
+        if used + tokens > budget:
+            continue
+        taken.append(index)
+        pieces.append(piece)
+        used += tokens
+    return pieces, taken
+
+# Candidates from a LangChain FAISS store with their vectors, most similar first
+def retrieve_candidates(knowledgebase, query, fetch_k=CONTEXT_FETCH_K):
+    import numpy as np
+
+    with stage("similarity_search"):
+        query_vector = np.asarray(knowledgebase.embeddings.embed_query(query), dtype=np.float32)
+        _, ids = knowledgebase.index.search(query_vector[None, :], min(fetch_k, knowledgebase.index.ntotal))
+        ids = [int(i) for i in ids[0] if i != -1]
+        texts = [knowledgebase.docstore.search(knowledgebase.index_to_docstore_id[i]).page_content for i in ids]
+        vectors = np.vstack([knowledgebase.index.reconstruct(i) for i in ids]) if ids else np.zeros((0, len(query_vector)), dtype=np.float32)
+
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    return texts, vectors, vectors @ query_vector
+
+# Fill the model's budget, less the rest of the prompt, with the best chunks; returns the context and
+# a usage report for the response
+def build_context(knowledgebase, query, model, render):
+    budget = token_budget(model)
+    texts, vectors, relevance = retrieve_candidates(knowledgebase, query)
+    context_budget = max(0, budget - count_tokens(render("")))
+    pieces, taken = pack_chunks(texts, vectors, relevance, context_budget)
+    return CONTEXT_SEPARATOR.join(pieces), {
+        "budget_tokens": budget,
+        "chunks_considered": len(texts),
+        "chunks_used": len(taken)
+    }
+
+# Token report for a finished prompt, also exported as a histogram
+def prompt_usage(prompt, model, usage):
+    prompt_tokens = count_tokens(prompt)
+    observe_prompt_tokens(model, prompt_tokens)
+    return dict(usage, prompt_tokens=prompt_tokens, tokenizer=tokenizer_name())
@@ -0,0 +1,505 @@
+import os
+import json
+import math
+import time
+import uuid
+import fcntl
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+import faiss
+from dotenv import load_dotenv
+from controllers.embeddings import get_embeddings, EMBEDDING_ID
+from controllers.tokens import count_tokens
+from controllers.chunk_store import get_chunk_store, embed_texts, CHUNK_STORE_ENABLED
+from controllers.metrics import stage
+from controllers.progress import set_progress
+
+load_dotenv()
+CORPUS_DIR = os.getenv("CORPUS_DIR", os.path.join(".cache", "corpus"))
+CORPUS_TRAIN_MIN = int(os.getenv("CORPUS_TRAIN_MIN", "20000"))  # chunks searched exactly until the first IVF-PQ index
+CORPUS_TRAIN_SAMPLE = int(os.getenv("CORPUS_TRAIN_SAMPLE", "32768"))
+CORPUS_DELTA_MAX = int(os.getenv("CORPUS_DELTA_MAX", "50000"))  # chunks added or removed since the last merge
+CORPUS_RETRAIN_GROWTH = float(os.getenv("CORPUS_RETRAIN_GROWTH", "8"))  # retrain once the corpus is this many times the trained size
+CORPUS_NLIST = int(os.getenv("CORPUS_NLIST", "0"))  # 0 picks ~4*sqrt(chunks)
+CORPUS_PQ_M = int(os.getenv("CORPUS_PQ_M", "0"))  # 0 picks one sub-quantizer per 8 dimensions
+CORPUS_NPROBE = int(os.getenv("CORPUS_NPROBE", "32"))
+CORPUS_RERANK_FACTOR = int(os.getenv("CORPUS_RERANK_FACTOR", "8"))  # PQ candidates per result, rescored exactly
+CORPUS_MAX_K = int(os.getenv("CORPUS_MAX_K", "50"))
+
+# Chunk sizes are in tokens of the local tokenizer, as for single documents (rag_based_qa.py)
+CHUNK_SEPARATOR = "\n"
+CHUNK_SIZE = 250
+CHUNK_OVERLAP = 50
+ADD_BATCH_SIZE = 65536
+
+# Names of the current files until a merge writes the next ones
+DEFAULT_FILES = {"vectors_file": "vectors.f32", "index_file": "index.faiss"}
+
+logger = logging.getLogger(__name__)
+
+def normalize_rows(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+def default_pq_m(dim):
+    if CORPUS_PQ_M:
+        return CORPUS_PQ_M
+    # The largest sub-quantizer count that divides the dimension with at least 8 dimensions each
+    return next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+
+# Multi-document index persisted on disk, for one embedding model:
+#   corpus.sqlite3  documents, their tags and chunk texts; a chunk's id is its vector row and FAISS id
+#   vectors.f32     float32 unit vectors, append-only, memory-mapped for exact rescoring and retraining
+#   index.faiss     IVF-PQ index over chunks [0, indexed_upto), opened memory-mapped and read-only
+# Chunks added since the last merge are scored exactly from vectors.f32, and chunks removed since
+# then are excluded with an id selector. Once either passes CORPUS_DELTA_MAX a background merge
+# rewrites index.faiss. Every process opens the same files and reloads after a merge elsewhere.
+# A merge writes new files (vectors.<generation>.f32, index.<generation>.faiss) and names them in
+# meta in the same commit that moves indexed_upto and renumbers chunks, so a crash at any point
+# leaves ids, vectors and index in step.
+class CorpusIndex:
+    def __init__(self, directory=CORPUS_DIR, model=EMBEDDING_ID):
+        self.model = model
+        self.directory = os.path.join(directory, hashlib.sha1(model.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        self.db_path = os.path.join(self.directory, "corpus.sqlite3")
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, filename TEXT, characters INTEGER NOT NULL, chunks INTEGER NOT NULL, created REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS tags (document_id TEXT NOT NULL, tag TEXT NOT NULL, PRIMARY KEY (document_id, tag));
+            CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+            CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, document_id TEXT NOT NULL, position INTEGER NOT NULL, text TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_id);
+            CREATE TABLE IF NOT EXISTS removed (id INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('model', ?)", (model,))
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._index = None
+        self._generation = None
+        self._indexed_upto = 0
+        self._vectors = None
+        self._merging = False
+        self._readers = threading.local()
+
+    # "data" guards appends to vectors.f32 and the tables across processes; "merge" lets one merge run at a time
+    @contextmanager
+    def _file_lock(self, name="data"):
+        with open(os.path.join(self.directory, f"{name}.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    # Searches read through a connection of their own per thread, so they need self._lock only to
+    # snapshot the index; WAL lets them run alongside writes from any process
+    def _reader(self):
+        reader = getattr(self._readers, "conn", None)
+        if reader is None or self._readers.pid != os.getpid():
+            reader = sqlite3.connect(self.db_path, timeout=30)
+            self._readers.conn, self._readers.pid = reader, os.getpid()
+        return reader
+
+    # The current vectors or index file, as named in meta
+    def _path(self, name):
+        return os.path.join(self.directory, self._meta(name, DEFAULT_FILES[name]))
+
+    def _rows(self, dim):
+        path = self._path("vectors_file")
+        return os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+
+    # Called with self._lock held: reopen the vectors and the index after a merge and map new vector
+    # rows. The data lock keeps a merge from swapping files between these reads.
+    def _refresh(self):
+        with self._file_lock():
+            dim = self._meta("dim")
+            if dim is None:
+                return None
+            generation = self._meta("generation", 0)
+            if generation != self._generation:
+                # The merge may have compacted vectors.f32 under new chunk ids
+                self._vectors = None
+                self._index = None
+                # The chunks index.faiss covers, written in the same commit as the generation
+                self._indexed_upto = self._meta("indexed_upto", 0)
+                if os.path.exists(self._path("index_file")):
+                    self._index = faiss.read_index(self._path("index_file"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                    faiss.extract_index_ivf(self._index).nprobe = CORPUS_NPROBE
+                self._generation = generation
+            rows = self._rows(dim)
+            if self._vectors is None or len(self._vectors) < rows:
+                self._vectors = np.memmap(self._path("vectors_file"), dtype=np.float32, mode="r", shape=(rows, dim)) if rows else None
+        return dim
+
+    def _split(self, text):
+        from langchain.text_splitter import CharacterTextSplitter
+
+        splitter = CharacterTextSplitter(separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=count_tokens)
+        with stage("split"):
+            return splitter.split_text(text)
+
+    def _embed(self, chunks):
+        embeddings = get_embeddings()
+        set_progress("chunks_total", len(chunks))
+        with stage("embedding"):
+            if CHUNK_STORE_ENABLED:
+                vectors = np.asarray(get_chunk_store().embed_chunks(chunks, embeddings), dtype=np.float32)
+            else:
+                vectors = embed_texts(embeddings, chunks)
+        return normalize_rows(vectors)
+
+    # Add a document, replacing any earlier version with the same id
+    def add(self, text, filename=None, tags=(), document_id=None):
+        chunks = self._split(text)
+        if not chunks:
+            raise ValueError("The document has no text to index.")
+        vectors = self._embed(chunks)
+        document_id = document_id or uuid.uuid4().hex
+        tags = sorted({tag.strip() for tag in tags if tag and tag.strip()})
+
+        # Vector rows are appended before the rows that point at them are committed
+        with self._lock, self._file_lock():
+            dim = self._meta("dim")
+            if dim is None:
+                dim = vectors.shape[1]
+                self._set_meta("dim", dim)
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the corpus ({dim}).")
+            start = self._rows(dim)
+            with open(self._path("vectors_file"), "ab") as f:
+                f.write(vectors.tobytes())
+            self._remove_rows(document_id)
+            self._conn.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?)", (document_id, filename, len(text), len(chunks), time.time()))
+            self._conn.executemany("INSERT INTO tags VALUES (?, ?)", [(document_id, tag) for tag in tags])
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", [(start + i, document_id, i, chunk) for i, chunk in enumerate(chunks)])
+            self._conn.commit()
+        self._maybe_merge()
+        return {"document_id": document_id, "filename": filename, "characters": len(text), "chunks": len(chunks), "tags": tags}
+
+    # Removed ids stay excluded from index.faiss searches until a merge drops them from the index
+    def _remove_rows(self, document_id):
+        self._conn.execute("INSERT OR IGNORE INTO removed SELECT id FROM chunks WHERE document_id = ?", (document_id,))
+        self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        self._conn.execute("DELETE FROM tags WHERE document_id = ?", (document_id,))
+        return self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount
+
+    def remove(self, document_id):
+        with self._lock, self._file_lock():
+            removed = self._remove_rows(document_id)
+            self._conn.commit()
+        self._maybe_merge()
+        return bool(removed)
+
+    def documents(self, tag=None, limit=100, offset=0):
+        query = "SELECT id, filename, characters, chunks, created FROM documents"
+        args = []
+        if tag:
+            query += " WHERE id IN (SELECT document_id FROM tags WHERE tag = ?)"
+            args.append(tag)
+        query += " ORDER BY created DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._conn.execute(query, args + [limit, offset]).fetchall()
+            tags = {}
+            for document_id, value in self._conn.execute(
+                f"SELECT document_id, tag FROM tags WHERE document_id IN ({', '.join('?' for _ in rows)})", [row[0] for row in rows]
+            ):
+                tags.setdefault(document_id, []).append(value)
+        keys = ("document_id", "filename", "characters", "chunks", "created")
+        return [dict(zip(keys, row), tags=sorted(tags.get(row[0], []))) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            documents, chunks = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM documents").fetchone()
+            removed = self._conn.execute("SELECT COUNT(*) FROM removed").fetchone()[0]
+            pending = self._conn.execute("SELECT COUNT(*) FROM chunks WHERE id >= ?", (self._meta("indexed_upto", 0),)).fetchone()[0]
+            dim = self._refresh()
+            index = self._index
+            return {
+                "documents": documents,
+                "chunks": chunks,
+                "pending_additions": pending,
+                "pending_removals": removed,
+                "index": None if index is None else {
+                    "vectors": index.ntotal,
+                    "nlist": faiss.extract_index_ivf(index).nlist,
+                    "nprobe": CORPUS_NPROBE,
+                    "trained_on": self._meta("trained_rows")
+                },
+                "dim": dim,
+                "merging": self._merging
+            }
+
+    # Chunk ids allowed by the filters, or None when nothing is filtered
+    def _allowed_ids(self, conn, document_ids, tags):
+        clauses, args = [], []
+        if document_ids:
+            clauses.append(f"document_id IN ({', '.join('?' for _ in document_ids)})")
+            args += list(document_ids)
+        if tags:
+            clauses.append(f"document_id IN (SELECT document_id FROM tags WHERE tag IN ({', '.join('?' for _ in tags)}))")
+            args += list(tags)
+        if not clauses:
+            return None
+        rows = conn.execute(f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", args).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    # Top-k chunks across the corpus: IVF-PQ candidates for merged chunks plus exact scores for the
+    # delta, all rescored exactly against the stored vectors. The lock is held only to take a
+    # consistent snapshot of the index, the vectors and the chunks the index covers; a merge or reload
+    # swaps in new objects and leaves the snapshot intact.
+    def search(self, query, k=3, document_ids=None, tags=None):
+        k = max(1, min(int(k), CORPUS_MAX_K))
+        with stage("embedding"):
+            vector = normalize_rows(np.asarray([get_embeddings().embed_query(query)], dtype=np.float32))
+
+        with stage("similarity_search"):
+            conn = self._reader()
+            while True:
+                with self._lock:
+                    dim = self._refresh()
+                    generation, index, vectors, indexed_upto = self._generation, self._index, self._vectors, self._indexed_upto
+                if dim is None or vectors is None:
+                    return []
+                # All reads come from one transaction of the same generation as the snapshot: a merge
+                # that compacted the vectors renumbers the chunks, so a newer generation means retrying
+                conn.execute("BEGIN")
+                try:
+                    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+                    if (json.loads(row[0]) if row else 0) == generation:
+                        return self._search(conn, vector, k, document_ids, tags, index, vectors, indexed_upto)
+                finally:
+                    conn.rollback()
+
+    def _search(self, conn, vector, k, document_ids, tags, index, vectors, indexed_upto):
+        allowed = self._allowed_ids(conn, document_ids, tags)
+        if allowed is not None and not len(allowed):
+            return []
+
+        candidates = []
+        if index is not None:
+            if allowed is not None:
+                selector = faiss.IDSelectorBatch(allowed[allowed < indexed_upto])
+            else:
+                removed = np.array([row[0] for row in conn.execute("SELECT id FROM removed")], dtype=np.int64)
+                selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(removed)) if len(removed) else None
+            params = faiss.SearchParametersIVF(nprobe=CORPUS_NPROBE, sel=selector) if selector is not None else None
+            _, ids = index.search(vector, k * CORPUS_RERANK_FACTOR, params=params)
+            candidates.append(ids[0][ids[0] >= 0])
+
+        if allowed is not None:
+            candidates.append(allowed[allowed >= indexed_upto])
+        else:
+            delta = conn.execute("SELECT id FROM chunks WHERE id >= ?", (indexed_upto,)).fetchall()
+            candidates.append(np.array([row[0] for row in delta], dtype=np.int64))
+
+        ids = np.unique(np.concatenate(candidates))
+        # Rows appended after the snapshot are scored by the next search
+        ids = ids[ids < len(vectors)]
+        if not len(ids):
+            return []
+        scores = vectors[ids] @ vector[0]
+        top = np.argsort(-scores)[:k]
+        best = {int(ids[i]): float(scores[i]) for i in top}
+
+        rows = conn.execute(
+            f"SELECT chunks.id, chunks.document_id, documents.filename, chunks.position, chunks.text FROM chunks "
+            f"JOIN documents ON documents.id = chunks.document_id WHERE chunks.id IN ({', '.join('?' for _ in best)})",
+            list(best)
+        ).fetchall()
+        results = [
+            {"chunk_id": row[0], "document_id": row[1], "filename": row[2], "position": row[3], "text": row[4], "score": round(best[row[0]], 4)}
+            for row in rows
+        ]
+        return sorted(results, key=lambda result: -result["score"])
+
+    # Rows of vectors.f32 no chunk points at any more, from replaced and removed documents, are
+    # dropped once they outnumber the live ones
+    def _needs_compaction(self, rows, live):
+        return rows - live >= max(live, CORPUS_DELTA_MAX)
+
+    def _maybe_merge(self):
+        with self._lock:
+            dim = self._meta("dim")
+            if dim is None or self._merging:
+                return
+            indexed_upto = self._meta("indexed_upto", 0)
+            trained = self._meta("trained_rows", 0)
+            rows = self._rows(dim)
+            removed = self._conn.execute("SELECT COUNT(*) FROM removed").fetchone()[0]
+            live = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            if not trained:
+                due = live >= CORPUS_TRAIN_MIN
+            else:
+                due = rows - indexed_upto >= CORPUS_DELTA_MAX or removed >= CORPUS_DELTA_MAX or live >= trained * CORPUS_RETRAIN_GROWTH
+            if not (due or self._needs_compaction(rows, live)):
+                return
+            self._merging = True
+        threading.Thread(target=self._merge_in_background, name="corpus-merge", daemon=True).start()
+
+    def _merge_in_background(self):
+        try:
+            self.merge()
+        except Exception:
+            logger.exception("Corpus index merge failed")
+            return
+        finally:
+            with self._lock:
+                self._merging = False
+        # Adds and removals made while the merge ran may already call for the next one
+        self._maybe_merge()
+
+    # Fold pending additions and removals into index.faiss. The index is trained (again) when there
+    # is none yet or the corpus has outgrown the one it was trained on; otherwise only its PQ codes are
+    # loaded, a small fraction of the size of the vectors. Adds, removals and searches go on meanwhile.
+    # A retrain, or a merge once dead rows outnumber live ones, also compacts vectors.f32: live chunks
+    # are renumbered 0..n-1 and the index is rebuilt over them, so disk and the mapping stay bounded.
+    def merge(self, retrain=False):
+        with self._file_lock("merge"):
+            with self._lock, self._file_lock():
+                dim = self._meta("dim")
+                if dim is None:
+                    return
+                rows = self._rows(dim)
+                vectors_path, index_path = self._path("vectors_file"), self._path("index_file")
+                generation = self._meta("generation", 0) + 1
+                indexed_upto = self._meta("indexed_upto", 0)
+                trained = self._meta("trained_rows", 0)
+                removed = np.array([row[0] for row in self._conn.execute("SELECT id FROM removed")], dtype=np.int64)
+                live = self._live_ids(0, rows)
+                if not len(live):
+                    return
+                # Below CORPUS_TRAIN_MIN chunks there is no index, only compaction
+                build = retrain or trained or len(live) >= CORPUS_TRAIN_MIN
+                retrain = build and (retrain or not trained or not os.path.exists(index_path) or len(live) >= trained * CORPUS_RETRAIN_GROWTH)
+                compact = len(live) < rows and (retrain or self._needs_compaction(rows, len(live)))
+                if not build and not compact:
+                    return
+                new_ids = live if retrain or compact else live[live >= indexed_upto]
+                if not retrain and not compact and not len(new_ids) and not len(removed):
+                    return
+
+            started = time.perf_counter()
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+            compact_path = os.path.join(self.directory, f"vectors.{generation}.f32")
+            if compact:
+                with open(compact_path, "wb") as f:
+                    for start in range(0, len(live), ADD_BATCH_SIZE):
+                        f.write(np.ascontiguousarray(vectors[live[start:start + ADD_BATCH_SIZE]]).tobytes())
+                del vectors
+                vectors = np.memmap(compact_path, dtype=np.float32, mode="r", shape=(len(live), dim))
+                new_ids = np.arange(len(live), dtype=np.int64)
+
+            index = None
+            if retrain:
+                index = self._train(vectors, new_ids)
+                trained = len(new_ids)
+            elif build:
+                index = faiss.read_index(index_path)
+                if compact:
+                    # Keep the trained quantizer and codebooks, re-add every chunk under its new id
+                    index.reset()
+                else:
+                    stale = removed[removed < indexed_upto]
+                    if len(stale):
+                        index.remove_ids(stale)
+            if index is not None:
+                for start in range(0, len(new_ids), ADD_BATCH_SIZE):
+                    batch = new_ids[start:start + ADD_BATCH_SIZE]
+                    index.add_with_ids(np.ascontiguousarray(vectors[batch]), batch)
+            del vectors
+
+            if index is not None:
+                faiss.write_index(index, os.path.join(self.directory, f"index.{generation}.faiss"))
+            with self._lock, self._file_lock():
+                if compact:
+                    self._compact(dim, vectors_path, compact_path, live, rows)
+                    self._set_meta("vectors_file", os.path.basename(compact_path))
+                    indexed_upto = len(live) if index is not None else 0
+                else:
+                    # Ids removed while the merge ran are still listed and stay excluded
+                    self._conn.executemany("DELETE FROM removed WHERE id = ?", [(int(i),) for i in removed])
+                    indexed_upto = rows
+                if index is not None:
+                    self._set_meta("index_file", f"index.{generation}.faiss")
+                self._set_meta("indexed_upto", indexed_upto)
+                self._set_meta("trained_rows", trained)
+                self._set_meta("generation", generation)
+                self._conn.commit()
+            # Processes still mapping the old files keep them until they reload
+            for path in (vectors_path if compact else None, index_path if index is not None else None):
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+        logger.info(f"Corpus index merged: {len(live)} chunks{' compacted from ' + str(rows) if compact else ''} in {time.perf_counter() - started:.1f}s")
+
+    # Called with both locks held, before the merge commits: copy rows appended since the merge began
+    # into the compacted file and renumber chunks and removals to match it
+    def _compact(self, dim, vectors_path, compact_path, live, rows):
+        row_bytes = dim * 4
+        with open(vectors_path, "rb") as source, open(compact_path, "ab") as target:
+            source.seek(rows * row_bytes)
+            while True:
+                block = source.read(ADD_BATCH_SIZE * row_bytes)
+                if not block:
+                    break
+                target.write(block)
+
+        conn = self._conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS renumber (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+        conn.execute("DELETE FROM renumber")
+        conn.executemany("INSERT INTO renumber VALUES (?, ?)", ((int(old), new) for new, old in enumerate(live)))
+        conn.execute("INSERT INTO renumber SELECT id, id - ? FROM chunks WHERE id >= ?", (rows - len(live), rows))
+        # Removals of rows that were dropped have nothing left to exclude
+        conn.execute("DELETE FROM removed WHERE id NOT IN (SELECT old FROM renumber)")
+        for table in ("chunks", "removed"):
+            # Through negative ids, so no new id collides with an old one mid-update
+            conn.execute(f"UPDATE {table} SET id = -1 - (SELECT new FROM renumber WHERE old = {table}.id)")
+            conn.execute(f"UPDATE {table} SET id = -1 - id")
+        conn.execute("DELETE FROM renumber")
+
+    # Called with self._lock held
+    def _live_ids(self, start, stop):
+        rows = self._conn.execute("SELECT id FROM chunks WHERE id >= ? AND id < ? ORDER BY id", (start, stop)).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def _train(self, vectors, ids):
+        dim = vectors.shape[1]
+        # k-means wants ~39 points per list and the PQ codebooks 256 per sub-quantizer
+        if len(ids) < 256:
+            raise ValueError(f"At least 256 chunks are needed to train the corpus index, got {len(ids)}.")
+        nlist = CORPUS_NLIST or int(4 * math.sqrt(len(ids)))
+        nlist = max(1, min(nlist, len(ids) // 39, 65536))
+        # The sample grows with nlist so large corpora keep the lists they are sized for
+        size = min(len(ids), max(CORPUS_TRAIN_SAMPLE, 39 * nlist))
+        sample = np.sort(np.random.default_rng(0).choice(ids, size=size, replace=False))
+        training = np.ascontiguousarray(vectors[sample])
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, default_pq_m(dim), 8, faiss.METRIC_INNER_PRODUCT)
+        with stage("corpus_train"):
+            index.train(training)
+        return index
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+def get_corpus_index():
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = CorpusIndex()
+        return _corpus
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from controllers.index_cache import knowledgebase_size
+
+load_dotenv()
+DOCUMENT_TTL_SECONDS = int(os.getenv("DOCUMENT_TTL_SECONDS", "1800"))
+DOCUMENT_STORE_MAX_BYTES = int(os.getenv("DOCUMENT_STORE_MAX_BYTES", str(512 * 1024 * 1024)))  # per process, in memory
+DOCUMENT_DB = os.getenv("DOCUMENT_DB", os.path.join(".cache", "documents.sqlite3"))
+
+class DocumentTooLargeError(Exception):
+    status_code = 413
+
+class StoredDocument:
+    def __init__(self, document_id, filename, text, knowledgebase):
+        self.id = document_id
+        self.filename = filename
+        self.text = text
+        self.knowledgebase = knowledgebase
+        self.size = len(text) + knowledgebase_size(knowledgebase)
+
+# The index is rebuilt through the index cache, which finds it on disk when any process built it before
+def _load_knowledgebase(text):
+    from controllers.rag_based_qa import process_text
+
+    return process_text(text)
+
+# Uploaded documents, kept so they can be queried many times without re-uploading. The documents
+# themselves live in SQLite, so every worker process and a restarted server can serve them; each
+# process keeps the ones it has used recently in memory with their index.
+class DocumentStore:
+    def __init__(self, db_path=DOCUMENT_DB, ttl=DOCUMENT_TTL_SECONDS, max_bytes=DOCUMENT_STORE_MAX_BYTES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._documents = OrderedDict()  # least recently used first
+        self._bytes_used = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    # Opened on first use in each process: the connection must not cross a fork
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY, filename TEXT NOT NULL, text TEXT NOT NULL, last_access REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS documents_last_access ON documents (last_access)")
+            self._pid = os.getpid()
+            self._documents.clear()
+            self._bytes_used = 0
+        return self._conn
+
+    def add(self, filename, text, knowledgebase):
+        document = StoredDocument(uuid.uuid4().hex, filename, text, knowledgebase)
+        if document.size > self.max_bytes:
+            raise DocumentTooLargeError("Document is too large to keep in the document store.")
+
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM documents WHERE last_access < ?", (now - self.ttl,))
+            conn.execute("INSERT INTO documents (id, filename, text, last_access) VALUES (?, ?, ?, ?)", (document.id, filename, text, now))
+            self._put_memory(document)
+        return document
+
+    # Every lookup touches the shared row, so a document used in any process stays alive and one
+    # deleted or expired elsewhere is gone here too
+    def get(self, document_id):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            touched = conn.execute(
+                "UPDATE documents SET last_access = ? WHERE id = ? AND last_access >= ?", (now, document_id, now - self.ttl)
+            ).rowcount
+            if not touched:
+                self._pop_memory(document_id)
+                return None
+            document = self._documents.get(document_id)
+            if document is not None:
+                self._documents.move_to_end(document_id)
+                return document
+            row = conn.execute("SELECT filename, text FROM documents WHERE id = ?", (document_id,)).fetchone()
+        if row is None:
+            return None
+
+        # Loaded outside the lock: on a cold index cache this embeds the document again
+        document = StoredDocument(document_id, row[0], row[1], _load_knowledgebase(row[1]))
+        with self._lock:
+            self._put_memory(document)
+        return document
+
+    def remove(self, document_id):
+        with self._lock:
+            removed = self._connection().execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount
+            self._pop_memory(document_id)
+        return bool(removed)
+
+    # Memory tier: LRU bounded by the estimated byte size of text and index
+    def _put_memory(self, document):
+        self._pop_memory(document.id)
+        if document.size > self.max_bytes:
+            return
+        self._documents[document.id] = document
+        self._bytes_used += document.size
+        while self._bytes_used > self.max_bytes:
+            _, evicted = self._documents.popitem(last=False)
+            self._bytes_used -= evicted.size
+
+    def _pop_memory(self, document_id):
+        document = self._documents.pop(document_id, None)
+        if document is not None:
+            self._bytes_used -= document.size
+
+document_store = DocumentStore()
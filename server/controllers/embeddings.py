@@ -0,0 +1,57 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 keeps the runtime default
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface")  # "huggingface", "onnx" or "fake"
+FAKE_EMBEDDING_SIZE = int(os.getenv("FAKE_EMBEDDING_SIZE", "384"))
+
+# Identifies the vectors this process produces; caches of stored vectors are keyed on it
+if EMBEDDING_BACKEND == "onnx":
+    from controllers.onnx_embeddings import EMBEDDING_ONNX_FILE
+    EMBEDDING_ID = f"{EMBEDDING_MODEL}#onnx:{EMBEDDING_ONNX_FILE}"
+elif EMBEDDING_BACKEND == "fake":
+    EMBEDDING_ID = f"fake:{FAKE_EMBEDDING_SIZE}"
+else:
+    EMBEDDING_ID = EMBEDDING_MODEL
+
+_embeddings = None
+_lock = threading.Lock()
+
+def _load_embeddings():
+    if EMBEDDING_BACKEND == "onnx":
+        from controllers.onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS)
+    if EMBEDDING_BACKEND == "fake":
+        # Hash-seeded random vectors for offline runs and benchmarks; no model download
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if EMBEDDING_THREADS > 0:
+        import torch
+        torch.set_num_threads(EMBEDDING_THREADS)
+
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE}
+    )
+
+# Shared embedding model, loaded once per process and reused by every request
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            # Another thread may have finished loading while we waited on the lock
+            if _embeddings is None:
+                _embeddings = _load_embeddings()
+    return _embeddings
+
+# Load the model and run one encode so the first real request does not pay for it
+def warm_up_embeddings():
+    get_embeddings().embed_query("warm up")
@@ -0,0 +1,61 @@
+import os
+import asyncio
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(8, os.cpu_count() or 1))))
+CPU_EXECUTOR_MAX_PENDING = int(os.getenv("CPU_EXECUTOR_MAX_PENDING", str(CPU_EXECUTOR_WORKERS * 4)))
+
+_executor = None
+_pending = None
+_lock = threading.Lock()
+
+# Bounded pool for CPU-bound work (PDF parsing, embedding) so it never blocks the event loop
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu")
+    return _executor
+
+async def run_blocking(fn, *args, **kwargs):
+    global _pending
+    # Cap queued work too, so a burst of uploads waits here instead of piling up inside the pool
+    if _pending is None:
+        _pending = asyncio.Semaphore(CPU_EXECUTOR_MAX_PENDING)
+    async with _pending:
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so per-request state (stage timings) follows the work
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(get_executor(), functools.partial(context.run, fn, *args, **kwargs))
+
+# Initializer for per-request thread pools, so their workers see the caller's context variables
+# (stage timings, job progress)
+def inherit_context():
+    context = contextvars.copy_context()
+
+    def initializer():
+        for variable, value in context.items():
+            variable.set(value)
+    return initializer
+
+def shutdown_executor():
+    global _executor, _pending
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _pending = None
+
+# Drive a blocking iterator (a provider token stream) from async code, one item per executor hop
+async def iterate_blocking(iterator):
+    finished = object()
+    while True:
+        item = await run_blocking(next, iterator, finished)
+        if item is finished:
+            return
+        yield item
@@ -0,0 +1,218 @@
+import io
+import os
+import codecs
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from controllers.metrics import stage
+from controllers.progress import count_progress, set_progress
+
+load_dotenv()
+EXTRACTION_MAX_BYTES = int(os.getenv("EXTRACTION_MAX_BYTES", str(100 * 1024 * 1024)))
+EXTRACTION_MAX_PAGES = int(os.getenv("EXTRACTION_MAX_PAGES", "2000"))
+EXTRACTION_SPOOL_BYTES = int(os.getenv("EXTRACTION_SPOOL_BYTES", str(10 * 1024 * 1024)))
+EXTRACTION_PARALLEL_PAGES = int(os.getenv("EXTRACTION_PARALLEL_PAGES", "64"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+READ_BLOCK_BYTES = 1024 * 1024
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt")
+PROGRESS_KEYS = {"pdf": "pages_parsed", "docx": "paragraphs_parsed", "txt": "blocks_read"}
+
+class ExtractionError(Exception):
+    status_code = 400
+
+class UnsupportedFileTypeError(ExtractionError):
+    status_code = 415
+
+class DocumentLimitError(ExtractionError):
+    status_code = 413
+
+class EmptyDocumentError(ExtractionError):
+    status_code = 400
+
+# An upload held in memory, or spooled to a named temp file once it passes EXTRACTION_SPOOL_BYTES
+class SpooledUpload:
+    def __init__(self, uploaded_file):
+        self.filename = uploaded_file.filename or ""
+        self.size = 0
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._spool(uploaded_file.stream if hasattr(uploaded_file, "stream") else uploaded_file)
+
+    def _spool(self, stream):
+        try:
+            while True:
+                block = stream.read(READ_BLOCK_BYTES)
+                if not block:
+                    break
+                self.size += len(block)
+                if self.size > EXTRACTION_MAX_BYTES:
+                    raise DocumentLimitError(f"File is larger than the {EXTRACTION_MAX_BYTES} byte limit.")
+                if self._file is None and self.size > EXTRACTION_SPOOL_BYTES:
+                    self._file = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+                    self.path = self._file.name
+                    self._file.write(self._buffer.getvalue())
+                    self._buffer = None
+                (self._file or self._buffer).write(block)
+        except BaseException:
+            self.close()
+            raise
+        if self._file is not None:
+            self._file.flush()
+
+    def open(self):
+        if self.path is not None:
+            return open(self.path, "rb")
+        return io.BytesIO(self._buffer.getvalue())
+
+    # What process pool workers receive: a path when spooled, otherwise the bytes themselves
+    def source(self):
+        return self.path if self.path is not None else self._buffer.getvalue()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ""
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_process_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # forkserver/spawn children never inherit the request threads or model state of this process
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+# Runs in a worker process: parse the PDF independently and extract one range of pages
+def _extract_pdf_range(source, start, stop):
+    from pypdf import PdfReader
+
+    reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+def iter_pdf_pages(upload):
+    from pypdf import PdfReader
+    from pypdf.errors import PdfReadError
+
+    with upload.open() as stream:
+        try:
+            reader = PdfReader(stream)
+            page_count = len(reader.pages)
+        except PdfReadError as e:
+            raise ExtractionError(f"Could not read PDF: {str(e)}")
+        if page_count > EXTRACTION_MAX_PAGES:
+            raise DocumentLimitError(f"PDF has {page_count} pages; the limit is {EXTRACTION_MAX_PAGES}.")
+        set_progress("pages_total", page_count)
+
+        if page_count < EXTRACTION_PARALLEL_PAGES or EXTRACTION_WORKERS < 2:
+            for page in reader.pages:
+                yield page.extract_text() or ''
+            return
+
+    # Large PDFs: contiguous page ranges are parsed in worker processes and yielded in order
+    step = -(-page_count // (EXTRACTION_WORKERS * 4))
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    source = upload.source()
+    futures = [get_process_pool().submit(_extract_pdf_range, source, start, stop) for start, stop in ranges]
+    try:
+        for future in futures:
+            for text in future.result():
+                yield text
+    finally:
+        for future in futures:
+            future.cancel()
+
+def iter_docx_paragraphs(upload):
+    from docx import Document
+
+    with upload.open() as stream:
+        try:
+            document = Document(stream)
+        except Exception as e:
+            raise ExtractionError(f"Could not read DOCX: {str(e)}")
+        for paragraph in document.paragraphs:
+            yield paragraph.text
+
+def iter_txt_blocks(upload):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with upload.open() as stream:
+        try:
+            while True:
+                block = stream.read(READ_BLOCK_BYTES)
+                if not block:
+                    break
+                yield decoder.decode(block)
+            yield decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            raise ExtractionError("Text file is not valid UTF-8.")
+
+# Yield the document's text piece by piece: pages for PDF, paragraphs for DOCX, blocks for TXT
+def iter_text(upload):
+    extension = file_extension(upload.filename)
+    if extension == "pdf":
+        return iter_pdf_pages(upload)
+    elif extension == "docx":
+        return iter_docx_paragraphs(upload)
+    elif extension == "txt":
+        return iter_txt_blocks(upload)
+    raise UnsupportedFileTypeError(f"Unsupported file type. Supported types are: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+# Content hash of an upload, so identical documents can share one computation; the stream is
+# rewound for the extraction that follows
+def upload_digest(uploaded_file):
+    stream = uploaded_file.stream if hasattr(uploaded_file, "stream") else uploaded_file
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        block = stream.read(READ_BLOCK_BYTES)
+        if not block:
+            break
+        size += len(block)
+        if size > EXTRACTION_MAX_BYTES:
+            raise DocumentLimitError(f"File is larger than the {EXTRACTION_MAX_BYTES} byte limit.")
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def extract_text_from_file(uploaded_file):
+    # Check the type before reading the upload
+    if file_extension(uploaded_file.filename or "") not in SUPPORTED_EXTENSIONS:
+        raise UnsupportedFileTypeError(f"Unsupported file type. Supported types are: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    with stage("extraction"), SpooledUpload(uploaded_file) as upload:
+        extension = file_extension(upload.filename)
+        separator = "" if extension == "txt" else "\n"
+        text = separator.join(count_progress(iter_text(upload), PROGRESS_KEYS[extension]))
+
+    if not text.strip():
+        raise EmptyDocumentError("No text could be extracted from the document.")
+    return text
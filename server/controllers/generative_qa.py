@@ -1,40 +1,13 @@
-import os
-from together import Together
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-load_dotenv() 
-TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-def call_model(model, query):
-    if model == "LLama 3.3 Meta":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": f"{query}"}]
-        )
-        return response.choices[0].message.content
-
-    elif model == "Google Gemini":
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=f"{query}"
-        )
-        return response.text
-
-    elif model == "Deepseek":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free",
-            messages=[{"role": "user", "content": f"{query}"}]
-        )
-        return response.choices[0].message.content
-    
-# Function to generte answers
-def generate_answer(query, model):
-    prompt = f"""You are a helpful and informative chatbot designed to answer user questions to the best of your ability.
+from controllers.metrics import stage
+from controllers.llm_provider import call_model, acall_model, stream_model, resolve_model
+from controllers.semantic_cache import cached_answer, acached_answer, stream_cached_answer
+
+# Bump when the prompt changes so cached answers from the old prompt are not reused
+PROMPT_VERSION = 1
+
+@stage("prompt_build")
+def build_prompt(query):
+    return f"""You are a helpful and informative chatbot designed to answer user questions to the best of your ability.
 
             Instructions:
 
@@ -47,7 +20,25 @@ def generate_answer(query, model):
 
             Chatbot Response:
         """
+
+# Function to generte answers
+def generate_answer(query, model, use_cache=True):
+    if query:
+        # Unknown models fail before the lookup, so cache partitions and metrics only see real ones
+        resolve_model(model)
+        # Near-duplicate questions are answered from the semantic cache
+        answer = cached_answer(query, model, PROMPT_VERSION,
+                               lambda: call_model(model, build_prompt(query)), use_cache=use_cache)
+        return answer
+
+async def agenerate_answer(query, model, use_cache=True):
     if query:
-        
-        answer = call_model(model, prompt)
-        return answer
\ No newline at end of file
+        resolve_model(model)
+        return await acached_answer(query, model, PROMPT_VERSION,
+                                    lambda: acall_model(model, build_prompt(query)), use_cache=use_cache)
+
+# Same answer, yielded token by token as the provider produces it
+def stream_answer(query, model, use_cache=True):
+    resolve_model(model)
+    return stream_cached_answer(query, model, PROMPT_VERSION,
+                                lambda: stream_model(model, build_prompt(query)), use_cache=use_cache)
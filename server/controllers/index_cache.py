@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from controllers.embeddings import get_embeddings, EMBEDDING_ID
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", os.path.join(".cache", "faiss"))
+INDEX_CACHE_MEMORY_BYTES = int(os.getenv("INDEX_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+INDEX_CACHE_DISK_BYTES = int(os.getenv("INDEX_CACHE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Key a knowledge base on the document text and everything that changes how it is built
+def index_cache_key(text, **settings):
+    settings["embedding_model"] = EMBEDDING_ID
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+# Rough in-memory footprint of a FAISS vector store: float32 vectors plus chunk text
+def knowledgebase_size(knowledgebase):
+    index = knowledgebase.index
+    size = index.ntotal * index.d * 4
+    for doc in knowledgebase.docstore._dict.values():
+        size += len(doc.page_content)
+    return size
+
+def _directory_size(path):
+    total = 0
+    for name in os.listdir(path):
+        total += os.path.getsize(os.path.join(path, name))
+    return total
+
+class IndexCache:
+    def __init__(self, directory=INDEX_CACHE_DIR, memory_budget=INDEX_CACHE_MEMORY_BYTES, disk_budget=INDEX_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._entries = OrderedDict()  # key -> (knowledgebase, size), oldest first
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        knowledgebase = self._get_memory(key)
+        if knowledgebase is not None:
+            return knowledgebase
+
+        knowledgebase = self._load_disk(key)
+        if knowledgebase is None:
+            knowledgebase = build()
+            self._save_disk(key, knowledgebase)
+
+        self._put_memory(key, knowledgebase)
+        return knowledgebase
+
+    # Hot tier: LRU bounded by the estimated byte size of the cached indexes
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put_memory(self, key, knowledgebase):
+        size = knowledgebase_size(knowledgebase)
+        if size > self.memory_budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._memory_used -= self._entries.pop(key)[1]
+            self._entries[key] = (knowledgebase, size)
+            self._memory_used += size
+            while self._memory_used > self.memory_budget:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._memory_used -= evicted_size
+
+    # Cold tier: FAISS save_local/load_local directories, evicted oldest-access first
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load_disk(self, key):
+        from langchain_community.vectorstores import FAISS
+
+        path = self._path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            knowledgebase = FAISS.load_local(path, get_embeddings(), allow_dangerous_deserialization=True)
+            # Access time drives disk eviction order
+            os.utime(path)
+        except FileNotFoundError:
+            # Another process evicted the entry while it was being read: a miss
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable index cache entry {key}: {str(e)}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        return knowledgebase
+
+    def _save_disk(self, key, knowledgebase):
+        if self.disk_budget <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            knowledgebase.save_local(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another worker stored the same key first; its copy is identical
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if ".tmp-" in name or not os.path.isdir(path):
+                continue
+            try:
+                size = _directory_size(path)
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+            total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_budget:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_used = 0
+
+index_cache = IndexCache()
@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import logging
+import threading
+from dotenv import load_dotenv
+from controllers.extraction import extract_text_from_file, file_extension, SUPPORTED_EXTENSIONS, EXTRACTION_MAX_BYTES, READ_BLOCK_BYTES, UnsupportedFileTypeError, DocumentLimitError
+from controllers.progress import track_progress, set_progress
+from controllers.summarizer import summarize
+from controllers.rag_based_qa import process_text
+from controllers.document_store import document_store, DOCUMENT_TTL_SECONDS
+from controllers.admission import AdmissionError
+
+load_dotenv()
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(".cache", "jobs.sqlite3"))
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(".cache", "jobs"))  # uploads waiting to be processed
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # per process
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # runs interrupted by a crash or restart
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "86400"))  # finished jobs are kept this long
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+JOB_EVENTS_INTERVAL = float(os.getenv("JOB_EVENTS_INTERVAL", "0.5"))
+
+TERMINAL_STATUSES = ("done", "failed", "cancelled")
+COLUMNS = "id, kind, status, priority, params, progress, result, error, attempts, created, started, finished"
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    pass
+
+class JobQueueFullError(Exception):
+    status_code = 503
+
+# An upload saved by submit(), shaped like the file objects extract_text_from_file receives from Flask
+class StoredUpload:
+    def __init__(self, path, filename):
+        self.filename = filename
+        self.stream = open(path, "rb")
+
+    def close(self):
+        self.stream.close()
+
+def save_upload(uploaded_file, path):
+    stream = uploaded_file.stream if hasattr(uploaded_file, "stream") else uploaded_file
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            block = stream.read(READ_BLOCK_BYTES)
+            if not block:
+                break
+            size += len(block)
+            if size > EXTRACTION_MAX_BYTES:
+                raise DocumentLimitError(f"File is larger than the {EXTRACTION_MAX_BYTES} byte limit.")
+            f.write(block)
+
+def run_summarize_job(upload, params):
+    set_progress("phase", "extracting")
+    text = extract_text_from_file(upload)
+    set_progress("phase", "summarizing")
+    return {"summary": summarize(text, params["model"], mode=params["mode"])}
+
+# Stores the document like POST /documents does, so any process can serve it
+def run_index_job(upload, params):
+    set_progress("phase", "extracting")
+    text = extract_text_from_file(upload)
+    set_progress("phase", "indexing")
+    document = document_store.add(params["filename"], text, process_text(text))
+    return {
+        "document_id": document.id,
+        "filename": document.filename,
+        "characters": len(document.text),
+        "expires_in": DOCUMENT_TTL_SECONDS
+    }
+
+# Adds the document to the persistent corpus index, which every process shares
+def run_corpus_job(upload, params):
+    from controllers.corpus_index import get_corpus_index
+
+    set_progress("phase", "extracting")
+    text = extract_text_from_file(upload)
+    set_progress("phase", "indexing")
+    return get_corpus_index().add(text, params["filename"], params.get("tags", []), params.get("document_id"))
+
+JOB_HANDLERS = {
+    "summarize": run_summarize_job,
+    "index": run_index_job,
+    "corpus": run_corpus_job
+}
+
+# Progress and cancellation of one job running in this process
+class RunningJob:
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.progress = {}
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._flushed = 0.0
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.progress[key] = self.progress.get(key, 0) + amount
+        self._changed()
+
+    def set(self, key, value):
+        with self._lock:
+            self.progress[key] = value
+        self._changed()
+
+    def checkpoint(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    # Progress is written at most every JOB_PROGRESS_INTERVAL; a cancelled job stops at its next report
+    def _changed(self):
+        now = time.monotonic()
+        if now - self._flushed >= JOB_PROGRESS_INTERVAL:
+            self._flushed = now
+            self.queue._save_progress(self.id, self.snapshot())
+        self.checkpoint()
+
+    def snapshot(self):
+        with self._lock:
+            return json.dumps(self.progress)
+
+# Priority queue of background jobs persisted in SQLite. Every process serving the app runs its own
+# JOB_WORKERS threads; they claim jobs from the shared database, so a job runs exactly once and jobs
+# left behind by a crashed or restarted process are picked up again.
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB, directory=JOBS_DIR, workers=JOB_WORKERS):
+        for path in (os.path.dirname(db_path), directory):
+            if path:
+                os.makedirs(path, exist_ok=True)
+        self.directory = directory
+        self.workers = workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, priority INTEGER NOT NULL,
+            params TEXT NOT NULL, input_path TEXT NOT NULL, progress TEXT NOT NULL, result TEXT, error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, heartbeat REAL, cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL, started REAL, finished REAL, not_before REAL)""")
+        # Databases created before jobs could be deferred
+        if "not_before" not in {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created)")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._running = {}  # job id -> RunningJob
+        self._threads = []
+
+    def _to_job(self, row):
+        keys = [column.strip() for column in COLUMNS.split(",")]
+        job = dict(zip(keys, row))
+        for key in ("params", "progress", "result"):
+            job[key] = json.loads(job[key]) if job[key] is not None else None
+        return job
+
+    def submit(self, kind, uploaded_file, params, priority=0):
+        extension = file_extension(uploaded_file.filename or "")
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise UnsupportedFileTypeError(f"Unsupported file type. Supported types are: {', '.join(SUPPORTED_EXTENSIONS)}")
+        with self._lock:
+            queued = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= JOB_MAX_QUEUED:
+            raise JobQueueFullError("Too many jobs are waiting; try again later.")
+
+        # The upload is written to disk before the job is recorded, so a queued job always has its input
+        job_id = uuid.uuid4().hex
+        input_path = os.path.join(self.directory, job_id, f"input.{extension}")
+        os.makedirs(os.path.dirname(input_path))
+        try:
+            save_upload(uploaded_file, input_path)
+        except BaseException:
+            shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+            raise
+
+        params = dict(params, filename=uploaded_file.filename)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, priority, params, input_path, progress, created) VALUES (?, ?, 'queued', ?, ?, ?, '{}', ?)",
+                (job_id, kind, priority, json.dumps(params), input_path, time.time())
+            )
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    # Queued jobs are cancelled at once; running jobs stop at their next progress report or LLM call
+    def cancel(self, job_id):
+        with self._lock:
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id)
+            ).rowcount
+            if not cancelled:
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        if cancelled:
+            self._remove_input(job_id)
+        running = self._running.get(job_id)
+        if running is not None:
+            running.cancelled.set()
+        return self.get(job_id)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                self._threads.append(threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True))
+            self._threads.append(threading.Thread(target=self._maintain, name="job-maintenance", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    # Take the highest-priority queued job that is not deferred; BEGIN IMMEDIATE keeps two processes
+    # from claiming the same one
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, params, input_path, cancel_requested FROM jobs WHERE status = 'queued' AND (not_before IS NULL OR not_before <= ?) "
+                    "ORDER BY priority DESC, created LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, started = COALESCE(started, ?), attempts = attempts + 1, progress = '{}' WHERE id = ?",
+                        (self.owner, now, now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _work(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error:
+                logger.exception("Could not claim a job")
+                claimed = None
+            if claimed is None:
+                # Jobs submitted by other processes are found on the next poll, deferred ones when they are due
+                with self._wakeup:
+                    self._wakeup.wait(self._idle_wait())
+                continue
+            self._run(*claimed)
+
+    def _idle_wait(self):
+        now = time.time()
+        try:
+            with self._lock:
+                due = self._conn.execute("SELECT MIN(not_before) FROM jobs WHERE status = 'queued' AND not_before > ?", (now,)).fetchone()[0]
+        except sqlite3.Error:
+            due = None
+        return JOB_HEARTBEAT_SECONDS if due is None else min(JOB_HEARTBEAT_SECONDS, due - now)
+
+    def _run(self, job_id, kind, params, input_path, cancel_requested):
+        params = json.loads(params)
+        running = RunningJob(self, job_id)
+        if cancel_requested:
+            running.cancelled.set()
+        self._running[job_id] = running
+        upload = None
+        try:
+            with track_progress(running):
+                running.checkpoint()
+                upload = StoredUpload(input_path, params["filename"])
+                result = JOB_HANDLERS[kind](upload, params)
+                running.checkpoint()
+            self._finish(job_id, "done", running, result=result)
+        except JobCancelled:
+            self._finish(job_id, "cancelled", running)
+        except AdmissionError as e:
+            # The provider is saturated, which is no fault of the job: run it again once it has capacity
+            logger.info(f"Job {job_id} deferred for {e.retry_after:.1f}s: {e}")
+            self._defer(job_id, e.retry_after)
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            self._finish(job_id, "failed", running, error=str(e))
+        finally:
+            if upload is not None:
+                upload.close()
+            self._running.pop(job_id, None)
+
+    def _finish(self, job_id, status, running, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, progress = ?, finished = ?, owner = NULL WHERE id = ? AND status = 'running'",
+                (status, json.dumps(result) if result is not None else None, error, running.snapshot(), time.time(), job_id)
+            )
+        self._remove_input(job_id)
+
+    # Back to the queue without counting the attempt; the input stays for the next run
+    def _defer(self, job_id, delay):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, attempts = attempts - 1, progress = '{}', not_before = ? WHERE id = ? AND status = 'running'",
+                (time.time() + delay, job_id)
+            )
+
+    def _save_progress(self, job_id, progress):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ? AND status = 'running'", (progress, time.time(), job_id))
+
+    def _remove_input(self, job_id):
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    def _maintain(self):
+        while True:
+            try:
+                self.maintain()
+            except sqlite3.Error:
+                logger.exception("Job queue maintenance failed")
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+
+    # Owners on this host can be checked directly; elsewhere a job is orphaned once its heartbeat is stale
+    def _owner_alive(self, owner, heartbeat, now):
+        host, _, pid = (owner or "").rpartition(":")
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return heartbeat is not None and now - heartbeat < JOB_STALE_SECONDS
+
+    # Heartbeat our running jobs, pick up cancellations from other processes, requeue orphaned jobs
+    # and drop finished jobs past their TTL
+    def maintain(self):
+        now = time.time()
+        running = list(self._running.values())
+        with self._lock:
+            cancel_ids = set()
+            if running:
+                placeholders = ", ".join("?" for _ in running)
+                ids = [job.id for job in running]
+                # Also writes progress reported since the last throttled flush
+                self._conn.executemany(
+                    "UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ? AND status = 'running'",
+                    [(now, job.snapshot(), job.id) for job in running]
+                )
+                cancel_ids = {row[0] for row in self._conn.execute(f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({placeholders})", ids)}
+
+            requeued = 0
+            for job_id, owner, heartbeat, attempts in self._conn.execute("SELECT id, owner, heartbeat, attempts FROM jobs WHERE status = 'running'").fetchall():
+                if job_id in self._running or self._owner_alive(owner, heartbeat, now):
+                    continue
+                if attempts >= JOB_MAX_ATTEMPTS:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'Job was interrupted too many times.', finished = ?, owner = NULL WHERE id = ? AND status = 'running'",
+                        (now, job_id)
+                    )
+                else:
+                    requeued += self._conn.execute(
+                        "UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND status = 'running' AND owner IS ?", (job_id, owner)
+                    ).rowcount
+
+            expired = [row[0] for row in self._conn.execute("SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - JOB_TTL_SECONDS,))]
+            if expired:
+                self._conn.execute(f"DELETE FROM jobs WHERE id IN ({', '.join('?' for _ in expired)})", expired)
+
+        for job in running:
+            if job.id in cancel_ids:
+                job.cancelled.set()
+        for job_id in expired:
+            self._remove_input(job_id)
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted job(s)")
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+_queue = None
+_queue_lock = threading.Lock()
+
+# Created on first use in each process: the connection and worker threads must not cross a fork
+def get_job_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None or not _queue.owner.endswith(f":{os.getpid()}"):
+            _queue = JobQueue()
+        return _queue
+
+# Start workers when an earlier process left jobs behind, so restarts do not lose work
+def resume_jobs():
+    if os.path.exists(JOBS_DB):
+        get_job_queue().start()
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import asyncio
+import random
+import threading
+import httpx
+from dotenv import load_dotenv
+from controllers.metrics import observe_llm_call, observe_tokens, timed_stream
+from controllers.progress import checkpoint, report_progress
+from controllers.routing import router, routed_call, arouted_call, ROUTING_ENABLED
+from controllers.admission import admit_call, aadmit_call
+
+load_dotenv()
+TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "")  # e.g. "fake" to send every model to one backend
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))  # per backend, async serving mode only
+
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.05"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0"))  # 0 returns instantly after the latency
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+def backend_concurrency(name):
+    return int(os.getenv(f"{name.upper()}_MAX_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+
+def backoff(attempt):
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+class LLMError(Exception):
+    pass
+
+class UnknownModelError(ValueError):
+    status_code = 400
+
+# Base for HTTP backends: one long-lived keep-alive pool per backend, shared by all requests
+class HttpBackend:
+    name = None
+
+    def __init__(self):
+        self._client = None
+        self._async_client = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+                        headers=self.headers()
+                    )
+        return self._client
+
+    # Async pool and semaphore are created inside the running event loop on first use
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            limit = backend_concurrency(self.name)
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=limit, max_keepalive_connections=min(limit, LLM_POOL_SIZE)),
+                headers=self.headers()
+            )
+        return self._async_client
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(backend_concurrency(self.name))
+        return self._semaphore
+
+    def headers(self):
+        return {}
+
+    # (prompt tokens, completion tokens) from a response body, when the provider reports them
+    def usage(self, data):
+        return None, None
+
+    def report_usage(self, model_id, data):
+        observe_tokens(self.name, model_id, *self.usage(data))
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self._semaphore = None
+
+    # POST with bounded retries and full-jitter exponential backoff on transient failures
+    def post(self, url, payload):
+        attempt = 0
+        while True:
+            try:
+                response = self.client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= LLM_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response.json()
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt >= LLM_MAX_RETRIES:
+                    raise LLMError(f"{self.name} request failed: {str(e)}") from e
+            except httpx.HTTPStatusError as e:
+                raise LLMError(f"{self.name} returned HTTP {e.response.status_code}: {e.response.text[:200]}") from e
+
+            time.sleep(backoff(attempt))
+            attempt += 1
+
+    async def apost(self, url, payload):
+        attempt = 0
+        while True:
+            try:
+                response = await self.async_client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= LLM_MAX_RETRIES:
+                    response.raise_for_status()
+                    return response.json()
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt >= LLM_MAX_RETRIES:
+                    raise LLMError(f"{self.name} request failed: {str(e)}") from e
+            except httpx.HTTPStatusError as e:
+                raise LLMError(f"{self.name} returned HTTP {e.response.status_code}: {e.response.text[:200]}") from e
+
+            await asyncio.sleep(backoff(attempt))
+            attempt += 1
+
+    # Streaming POST that yields server-sent event payloads; retries only before the first event arrives
+    def post_stream(self, url, payload):
+        attempt = 0
+        started = False
+        while True:
+            try:
+                with self.client.stream("POST", url, json=payload) as response:
+                    if response.status_code in RETRY_STATUS_CODES and attempt < LLM_MAX_RETRIES:
+                        response.read()
+                    else:
+                        if response.is_error:
+                            response.read()
+                            raise LLMError(f"{self.name} returned HTTP {response.status_code}: {response.text[:200]}")
+                        for line in response.iter_lines():
+                            if line.startswith("data:"):
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                started = True
+                                yield json.loads(data)
+                        return
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if started or attempt >= LLM_MAX_RETRIES:
+                    raise LLMError(f"{self.name} request failed: {str(e)}") from e
+
+            time.sleep(backoff(attempt))
+            attempt += 1
+
+class TogetherBackend(HttpBackend):
+    name = "together"
+    url = "https://api.together.xyz/v1/chat/completions"
+
+    def headers(self):
+        return {"Authorization": f"Bearer {TOGETHER_AI_API_KEY}"}
+
+    def payload(self, model_id, prompt):
+        return {
+            "model": model_id,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+
+    def parse(self, data):
+        return data["choices"][0]["message"]["content"]
+
+    def usage(self, data):
+        usage = data.get("usage") or {}
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+    def complete(self, model_id, prompt):
+        data = self.post(self.url, self.payload(model_id, prompt))
+        self.report_usage(model_id, data)
+        return self.parse(data)
+
+    async def acomplete(self, model_id, prompt):
+        data = await self.apost(self.url, self.payload(model_id, prompt))
+        self.report_usage(model_id, data)
+        return self.parse(data)
+
+    def stream(self, model_id, prompt):
+        events = self.post_stream(self.url, dict(self.payload(model_id, prompt), stream=True))
+        last = {}
+        for event in events:
+            # The final chunk carries the usage for the whole stream
+            if event.get("usage"):
+                last = event
+            choices = event.get("choices") or []
+            if choices:
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+        self.report_usage(model_id, last)
+
+class GeminiBackend(HttpBackend):
+    name = "gemini"
+    url = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+    stream_url = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse"
+
+    def headers(self):
+        return {"x-goog-api-key": GEMINI_API_KEY or ""}
+
+    def payload(self, prompt):
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+
+    def parse(self, data):
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+
+    def usage(self, data):
+        usage = data.get("usageMetadata") or {}
+        return usage.get("promptTokenCount"), usage.get("candidatesTokenCount")
+
+    def complete(self, model_id, prompt):
+        data = self.post(self.url.format(model=model_id), self.payload(prompt))
+        self.report_usage(model_id, data)
+        return self.parse(data)
+
+    async def acomplete(self, model_id, prompt):
+        data = await self.apost(self.url.format(model=model_id), self.payload(prompt))
+        self.report_usage(model_id, data)
+        return self.parse(data)
+
+    def stream(self, model_id, prompt):
+        events = self.post_stream(self.stream_url.format(model=model_id), self.payload(prompt))
+        last = {}
+        for event in events:
+            # Every event repeats the running usage totals; the last one is final
+            if event.get("usageMetadata"):
+                last = event
+            for candidate in event.get("candidates") or []:
+                for part in (candidate.get("content") or {}).get("parts") or []:
+                    if part.get("text"):
+                        yield part["text"]
+        self.report_usage(model_id, last)
+
+# Offline backend for local runs and load tests: sleeps like a provider and echoes the prompt
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self, latency=FAKE_LLM_LATENCY, tokens_per_second=FAKE_LLM_TOKENS_PER_SECOND, response=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response = response
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(backend_concurrency(self.name))
+        return self._semaphore
+
+    def delay(self, text):
+        if self.tokens_per_second > 0:
+            return self.latency + len(text.split()) / self.tokens_per_second
+        return self.latency
+
+    def render(self, model_id, prompt):
+        if self.response is not None:
+            return self.response(model_id, prompt)
+        return f"Fake response from {model_id} to a {len(prompt)} character prompt."
+
+    def complete(self, model_id, prompt):
+        text = self.render(model_id, prompt)
+        time.sleep(self.delay(text))
+        return text
+
+    async def acomplete(self, model_id, prompt):
+        text = self.render(model_id, prompt)
+        await asyncio.sleep(self.delay(text))
+        return text
+
+    def stream(self, model_id, prompt):
+        time.sleep(self.latency)
+        for i, token in enumerate(self.render(model_id, prompt).split(" ")):
+            if self.tokens_per_second > 0:
+                time.sleep(1 / self.tokens_per_second)
+            yield token if i == 0 else " " + token
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        self._semaphore = None
+
+BACKENDS = {
+    "together": TogetherBackend(),
+    "gemini": GeminiBackend(),
+    "fake": FakeBackend()
+}
+
+# Model names offered by the client, mapped to (backend, provider model id)
+MODELS = {
+    "LLama 3.3 Meta": ("together", "meta-llama/Llama-3.3-70B-Instruct-Turbo"),
+    "Google Gemini": ("gemini", "gemini-2.0-flash-exp"),
+    "Deepseek": ("together", "deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free")
+}
+
+def register_backend(name, backend):
+    previous = BACKENDS.get(name)
+    BACKENDS[name] = backend
+    if previous is not None and previous is not backend:
+        previous.close()
+
+def register_model(model, backend_name, model_id):
+    MODELS[model] = (backend_name, model_id)
+
+def resolve_model(model):
+    if model not in MODELS:
+        raise UnknownModelError(f"Unsupported model: {model}. Supported models are: {', '.join(MODELS)}")
+    backend_name, model_id = MODELS[model]
+    return BACKENDS[LLM_BACKEND or backend_name], model_id
+
+def _complete(model, prompt):
+    backend, model_id = resolve_model(model)
+    # Waits for the provider's rate limits, or raises OverloadedError
+    admit_call(backend.name, prompt)
+    started = time.perf_counter()
+    response = None
+    try:
+        response = backend.complete(model_id, prompt)
+    finally:
+        observe_llm_call(backend.name, model_id, prompt, response, time.perf_counter() - started)
+    return response
+
+async def _acomplete(model, prompt):
+    backend, model_id = resolve_model(model)
+    await aadmit_call(backend.name, prompt)
+    async with backend.semaphore:
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await backend.acomplete(model_id, prompt)
+        finally:
+            observe_llm_call(backend.name, model_id, prompt, response, time.perf_counter() - started)
+    return response
+
+# Function to call models. With ROUTING_ENABLED a slow call is hedged and a failed one fails over
+# to an equivalent model (controllers/routing.py).
+def call_model(model, prompt):
+    resolve_model(model)
+    # A cancelled background job stops before its next LLM call
+    checkpoint()
+    if ROUTING_ENABLED:
+        response = routed_call(model, lambda name: _complete(name, prompt), MODELS)
+    else:
+        response = _complete(model, prompt)
+    report_progress("llm_calls_done")
+    return response
+
+# Resolves the model up front so unknown models fail before a streaming response starts. Streams
+# are not hedged; with routing they start on the healthiest equivalent model.
+def stream_model(model, prompt):
+    resolve_model(model)
+    return _stream(model, prompt)
+
+# Admission waits for the first token to be pulled, so a stream nobody reads never takes a slot
+def _stream(model, prompt):
+    if ROUTING_ENABLED:
+        model = router.candidates(model, MODELS)[0]
+    backend, model_id = resolve_model(model)
+    admit_call(backend.name, prompt)
+    yield from timed_stream(backend.stream(model_id, prompt), backend.name, model_id, prompt)
+
+# Async variant for the ASGI app; each backend caps its own in-flight requests
+async def acall_model(model, prompt):
+    resolve_model(model)
+    checkpoint()
+    if ROUTING_ENABLED:
+        response = await arouted_call(model, lambda name: _acomplete(name, prompt), MODELS)
+    else:
+        response = await _acomplete(model, prompt)
+    report_progress("llm_calls_done")
+    return response
+
+def close_clients():
+    for backend in BACKENDS.values():
+        backend.close()
+
+async def aclose_clients():
+    for backend in BACKENDS.values():
+        await backend.aclose()
@@ -0,0 +1,133 @@
+import os
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from controllers.metrics import stage
+from controllers.tokens import count_tokens
+from controllers.executor import inherit_context
+from controllers.admission import AdmissionError
+
+load_dotenv()
+LONG_TEXT_CHUNK_TOKENS = int(os.getenv("LONG_TEXT_CHUNK_TOKENS", "1000"))
+LONG_TEXT_MAX_CONCURRENCY = int(os.getenv("LONG_TEXT_MAX_CONCURRENCY", "8"))
+LONG_TEXT_MAX_CHUNKS = int(os.getenv("LONG_TEXT_MAX_CHUNKS", "200"))
+
+# A sentence ends at ., ! or ? (optionally followed by closing quotes or brackets) before whitespace,
+# or at a blank line
+_sentence_end = re.compile(r"""[.!?]+["')\]]*\s+|\n\s*\n""")
+_word = re.compile(r"\S+")
+
+# (start, end) character spans of the sentences in text, whitespace between them excluded
+def sentence_spans(text):
+    spans = []
+    start = 0
+    for match in _sentence_end.finditer(text):
+        spans.append((start, match.start() + len(match.group().rstrip())))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return [(start, end) for start, end in spans if text[start:end].strip()]
+
+# (start, end, tokens) pieces of a sentence: the sentence itself when it fits the budget, otherwise
+# runs of whole words, and a single word longer than the budget is cut into fixed-size slices
+def _sentence_pieces(text, start, end, budget):
+    tokens = count_tokens(text[start:end])
+    if tokens <= budget:
+        yield start, end, tokens
+        return
+
+    piece_start = piece_end = None
+    used = 0
+    for match in _word.finditer(text, start, end):
+        word_start, word_end = match.span()
+        tokens = count_tokens(match.group()) + 1  # the space before it
+        if tokens > budget:
+            if piece_start is not None:
+                yield piece_start, piece_end, used
+                piece_start, used = None, 0
+            for cut in range(word_start, word_end, budget * 2):
+                piece = text[cut:min(cut + budget * 2, word_end)]
+                yield cut, cut + len(piece), count_tokens(piece)
+            continue
+        if piece_start is not None and used + tokens > budget:
+            yield piece_start, piece_end, used
+            piece_start, used = None, 0
+        if piece_start is None:
+            piece_start = word_start
+        piece_end = word_end
+        used += tokens
+    if piece_start is not None:
+        yield piece_start, piece_end, used
+
+# Pack whole sentences greedily, in order, into chunks of at most budget tokens. Each chunk keeps its
+# offsets into text, so results found in a chunk can be mapped back to the input. Sentences are
+# tokenized once and their counts added up, with one token for the whitespace between them.
+@stage("split")
+def split_text(text, budget=LONG_TEXT_CHUNK_TOKENS):
+    chunks = []
+    current = None
+    used = 0
+    for sentence_start, sentence_end in sentence_spans(text):
+        for start, end, tokens in _sentence_pieces(text, sentence_start, sentence_end, budget):
+            if current is not None and used + 1 + tokens <= budget:
+                current = (current[0], end)
+                used += 1 + tokens
+                continue
+            if current is not None:
+                chunks.append(current)
+            current = (start, end)
+            used = tokens
+    if current is not None:
+        chunks.append(current)
+    if len(chunks) > LONG_TEXT_MAX_CHUNKS:
+        raise ValueError(f"Text is too long: at most {LONG_TEXT_MAX_CHUNKS * budget} tokens can be processed")
+    return [{"text": text[start:end], "start": start, "end": end} for start, end in chunks]
+
+# Run work on every chunk concurrently; one (result, exception) pair per chunk, in input order
+def map_chunks(chunks, work):
+    def run(chunk):
+        try:
+            return work(chunk["text"]), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LONG_TEXT_MAX_CONCURRENCY, len(chunks))), initializer=inherit_context()) as pool:
+        return list(pool.map(run, chunks))
+
+async def amap_chunks(chunks, work):
+    limit = asyncio.Semaphore(LONG_TEXT_MAX_CONCURRENCY)
+
+    async def run(chunk):
+        async with limit:
+            try:
+                return await work(chunk["text"]), None
+            except Exception as e:
+                return None, e
+
+    return await asyncio.gather(*[run(chunk) for chunk in chunks])
+
+# Every chunk failed; the routes answer 502 with each chunk's error
+class ChunksFailedError(Exception):
+    status_code = 502
+
+    def __init__(self, chunks):
+        super().__init__("Processing failed for every chunk of the text")
+        self.chunks = chunks
+
+# Chunk spans and per-chunk errors for the response. Raises when every chunk failed: admission
+# errors as they are, so the client gets their status and Retry-After, anything else as ChunksFailedError.
+def chunk_report(chunks, outcomes):
+    report = []
+    for chunk, (_, error) in zip(chunks, outcomes):
+        entry = {"start": chunk["start"], "end": chunk["end"]}
+        if error is not None:
+            entry["error"] = str(error)
+        report.append(entry)
+
+    errors = [error for _, error in outcomes if error is not None]
+    if errors and len(errors) == len(outcomes):
+        if isinstance(errors[0], AdmissionError):
+            raise errors[0]
+        raise ChunksFailedError(report)
+    return report
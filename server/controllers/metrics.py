@@ -0,0 +1,172 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+
+load_dotenv()
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 104857600)
+
+STAGE_SECONDS = Histogram("coba_stage_seconds", "Time spent in each processing stage", ["stage"], buckets=LATENCY_BUCKETS)
+
+LLM_SECONDS = Histogram("coba_llm_seconds", "Total time of LLM calls", ["backend", "model", "mode"], buckets=LATENCY_BUCKETS)
+LLM_TTFT_SECONDS = Histogram("coba_llm_ttft_seconds", "Time to the first token of streamed LLM calls", ["backend", "model"], buckets=LATENCY_BUCKETS)
+LLM_ERRORS = Counter("coba_llm_errors_total", "LLM calls that raised", ["backend", "model"])
+LLM_PROMPT_BYTES = Histogram("coba_llm_prompt_bytes", "Size of prompts sent to LLMs", ["backend", "model"], buckets=SIZE_BUCKETS)
+LLM_RESPONSE_BYTES = Histogram("coba_llm_response_bytes", "Size of LLM responses", ["backend", "model"], buckets=SIZE_BUCKETS)
+LLM_TOKENS = Counter("coba_llm_tokens_total", "Tokens reported by the provider", ["backend", "model", "kind"])
+
+HTTP_SECONDS = Histogram("coba_http_request_seconds", "Time until the response headers are ready", ["route", "method", "status"], buckets=LATENCY_BUCKETS)
+HTTP_REQUEST_BYTES = Histogram("coba_http_request_bytes", "Size of request bodies", ["route"], buckets=SIZE_BUCKETS)
+HTTP_RESPONSE_BYTES = Histogram("coba_http_response_bytes", "Size of non-streamed response bodies", ["route"], buckets=SIZE_BUCKETS)
+
+SEMANTIC_CACHE_LOOKUPS = Counter("coba_semantic_cache_lookups_total", "Semantic answer cache lookups", ["model", "result"])
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "coba_semantic_cache_similarity", "Similarity of the closest cached question per lookup", ["model"],
+    buckets=(0.5, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+)
+
+COALESCED_REQUESTS = Counter("coba_coalesced_requests_total", "Requests that shared an identical in-flight computation instead of running their own", ["name"])
+
+ROUTING_EVENTS = Counter("coba_routing_events_total", "Hedged requests, failovers and calls answered by an equivalent model", ["model", "event"])
+
+ADMISSION_SHED = Counter("coba_admission_shed_total", "Requests refused by admission control", ["scope", "reason"])
+ADMISSION_WAIT_SECONDS = Histogram("coba_admission_wait_seconds", "Time provider calls waited for rate limit capacity", ["provider"], buckets=LATENCY_BUCKETS)
+ADMISSION_QUEUE_DEPTH = Gauge("coba_admission_queue_depth", "Provider calls waiting for rate limit capacity", ["provider"], multiprocess_mode="livesum")
+
+PROMPT_TOKENS = Histogram(
+    "coba_prompt_tokens", "Tokens in retrieval prompts, counted with the local tokenizer", ["model"],
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+)
+
+# Set once per worker when it is ready to serve (one series per live worker process)
+WORKER_START_SECONDS = Gauge("coba_worker_start_seconds", "Time from fork or process start until the worker was ready", ["warmed_up"], multiprocess_mode="liveall")
+WORKER_MEMORY_BYTES = Gauge("coba_worker_memory_bytes", "Worker memory when it became ready", ["kind"], multiprocess_mode="liveall")
+
+# Stages timed during the current request, for the Server-Timing header
+_timings = contextvars.ContextVar("stage_timings", default=None)
+
+def start_timings():
+    timings = []
+    _timings.set(timings)
+    return timings
+
+def current_timings():
+    return _timings.get() or []
+
+def _note(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.labels(name).observe(seconds)
+    _note(name, seconds)
+
+# Time a block (or, as a decorator, a function) as one stage
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def _size(text):
+    return len(text.encode("utf-8")) if text else 0
+
+def observe_llm_call(backend, model, prompt, response, seconds):
+    LLM_SECONDS.labels(backend, model, "complete").observe(seconds)
+    LLM_PROMPT_BYTES.labels(backend, model).observe(_size(prompt))
+    if response is None:
+        LLM_ERRORS.labels(backend, model).inc()
+    else:
+        LLM_RESPONSE_BYTES.labels(backend, model).observe(_size(response))
+    _note("llm", seconds)
+
+def observe_tokens(backend, model, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        LLM_TOKENS.labels(backend, model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(backend, model, "completion").inc(completion_tokens)
+
+# Pass tokens through while recording time to first token, total time and response size
+def timed_stream(tokens, backend, model, prompt):
+    started = time.perf_counter()
+    LLM_PROMPT_BYTES.labels(backend, model).observe(_size(prompt))
+    size = 0
+    first = True
+    try:
+        for token in tokens:
+            if first:
+                ttft = time.perf_counter() - started
+                LLM_TTFT_SECONDS.labels(backend, model).observe(ttft)
+                _note("llm_ttft", ttft)
+                first = False
+            size += _size(token)
+            yield token
+    except Exception:
+        LLM_ERRORS.labels(backend, model).inc()
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        LLM_SECONDS.labels(backend, model, "stream").observe(seconds)
+        LLM_RESPONSE_BYTES.labels(backend, model).observe(size)
+        _note("llm", seconds)
+
+def observe_request(route, method, status, request_bytes, response_bytes, seconds):
+    HTTP_SECONDS.labels(route, method, str(status)).observe(seconds)
+    if request_bytes is not None:
+        HTTP_REQUEST_BYTES.labels(route).observe(request_bytes)
+    if response_bytes is not None:
+        HTTP_RESPONSE_BYTES.labels(route).observe(response_bytes)
+
+def observe_semantic_lookup(model, hit, similarity):
+    SEMANTIC_CACHE_LOOKUPS.labels(model, "hit" if hit else "miss").inc()
+    if similarity is not None:
+        SEMANTIC_CACHE_SIMILARITY.labels(model).observe(similarity)
+
+def observe_coalesced(name):
+    COALESCED_REQUESTS.labels(name).inc()
+
+def observe_routing(model, event):
+    ROUTING_EVENTS.labels(model, event).inc()
+
+def observe_admission_shed(scope, reason):
+    ADMISSION_SHED.labels(scope, reason).inc()
+
+def observe_admission_wait(provider, seconds):
+    ADMISSION_WAIT_SECONDS.labels(provider).observe(seconds)
+
+def set_admission_queue_depth(provider, depth):
+    ADMISSION_QUEUE_DEPTH.labels(provider).set(depth)
+
+def observe_prompt_tokens(model, tokens):
+    PROMPT_TOKENS.labels(model).observe(tokens)
+
+def observe_worker_start(seconds, memory, warmed_up):
+    WORKER_START_SECONDS.labels(str(warmed_up).lower()).set(seconds)
+    for kind, value in memory.items():
+        WORKER_MEMORY_BYTES.labels(kind).set(value)
+
+# Repeated stages (e.g. the LLM calls of a map-reduce summary) are summed into one entry
+def server_timing(timings, total=None):
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0) + seconds
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+# Under a multi-process server each worker writes to PROMETHEUS_MULTIPROC_DIR and /metrics merges them
+def render_metrics():
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
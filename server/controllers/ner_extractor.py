@@ -1,40 +1,20 @@
-import os
-from together import Together
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-load_dotenv() 
-TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-def call_model(model, query):
-    if model == "LLama 3.3 Meta":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": f"{query}"}]
-        )
-        return response.choices[0].message.content.strip()
-
-    elif model == "Google Gemini":
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=f"{query}"
-        )
-        return response.text.strip()
-
-    elif model == "Deepseek":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free",
-            messages=[{"role": "user", "content": f"{query}"}]
-        )
-        return response.choices[0].message.content.strip()
-    
-def extract_entities(text, model):
-    if text:
-        query = f'''You are an expert in Named Entity Recognition. Extract and categorize all named entities from the following text. Return the output in a clearly structured, easy-to-parse format grouped by entity types.
+import re
+import json
+from controllers.metrics import stage
+from controllers.llm_provider import call_model, acall_model, resolve_model
+from controllers.result_cache import cached_result, acached_result
+from controllers.batching import run_batch, arun_batch
+from controllers.long_text import split_text, map_chunks, amap_chunks, chunk_report
+from controllers.executor import run_blocking
+
+# Bump when the prompt changes so cached results from the old prompt are not reused
+PROMPT_VERSION = 1
+
+ENTITY_TYPES = ('Persons', 'Locations', 'Dates', 'Organizations', 'Miscellaneous')
+
+@stage("prompt_build")
+def build_prompt(text):
+    return f'''You are an expert in Named Entity Recognition. Extract and categorize all named entities from the following text. Return the output in a clearly structured, easy-to-parse format grouped by entity types.
 
         Instructions:
         1. Identify all named entities in the input text.
@@ -59,6 +39,157 @@ def extract_entities(text, model):
 
         Entities:
         '''
-        
+
+def extract_entities(text, model, use_cache=True):
+    if text:
         # Sentiment result
-        return call_model(model, query)
\ No newline at end of file
+        return cached_result("ner", text, model, PROMPT_VERSION,
+                             lambda: call_model(model, build_prompt(text)).strip(), use_cache=use_cache)
+
+async def aextract_entities(text, model, use_cache=True):
+    async def compute():
+        return (await acall_model(model, build_prompt(text))).strip()
+
+    if text:
+        return await acached_result("ner", text, model, PROMPT_VERSION, compute, use_cache=use_cache)
+
+# Several texts in one prompt, answered one "[index] {json}" line each
+@stage("prompt_build")
+def build_batch_prompt(items):
+    return f'''You are an expert in Named Entity Recognition. Extract and categorize all named entities from each numbered text below.
+
+        Instructions:
+        1. Identify all named entities in each text, independently of the other texts.
+        2. Group them under the following types where applicable: Persons, Locations, Dates, Organizations, Miscellaneous.
+        3. Return exactly one line per text in the form [index] followed by a single-line JSON object mapping each type to a list of entity strings.
+        4. If a category has no entities, exclude it from the object; if a text has no entities, return {{}}.
+        5. Avoid extra commentary or explanations — return only these lines.
+
+        Example Output Format:
+        [0] {{"Persons": ["Narendra Modi"], "Locations": ["India"]}}
+        [1] {{}}
+
+        Texts:
+        {items}
+
+        Entities:
+        '''
+
+def parse_entity_groups(value):
+    try:
+        entities = json.loads(value)
+    except json.JSONDecodeError:
+        raise ValueError("Could not parse entities returned for this item")
+    if not isinstance(entities, dict):
+        raise ValueError("Could not parse entities returned for this item")
+    return {
+        entity_type: [str(entity) for entity in values]
+        for entity_type, values in entities.items()
+        if entity_type in ENTITY_TYPES and isinstance(values, list) and values
+    }
+
+def parse_batch_entities(value):
+    return {"entities": parse_entity_groups(value)}
+
+def extract_entities_batch(texts, model):
+    # An unknown model is a client error, not one error per text
+    resolve_model(model)
+    return run_batch(texts, build_batch_prompt, parse_batch_entities,
+                     lambda prompt: call_model(model, prompt))
+
+async def aextract_entities_batch(texts, model):
+    resolve_model(model)
+    return await arun_batch(texts, build_batch_prompt, parse_batch_entities,
+                            lambda prompt: acall_model(model, prompt))
+
+# One chunk of a long text, answered as a JSON object so the entities can be merged and located
+@stage("prompt_build")
+def build_chunk_prompt(text):
+    return f'''You are an expert in Named Entity Recognition. Extract and categorize all named entities from the following text.
+
+        Instructions:
+        1. Identify all named entities in the input text.
+        2. Group them under the following types where applicable: Persons, Locations, Dates, Organizations, Miscellaneous.
+        3. Write each entity exactly as it appears in the text.
+        4. Return a single-line JSON object mapping each type to a list of entity strings; exclude types with no entities and return {{}} if there are none.
+        5. Avoid extra commentary or explanations — return only the JSON object.
+
+        Example Output Format:
+        {{"Persons": ["Narendra Modi", "Joe Biden"], "Locations": ["India", "USA"]}}
+
+        Text: {text}
+
+        Entities:
+        '''
+
+def parse_chunk_entities(output):
+    # Tolerate code fences or a sentence around the object
+    start, end = output.find("{"), output.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("Could not parse entities returned for this chunk")
+    return parse_entity_groups(output[start:end + 1])
+
+# Character offsets of every whole-word occurrence of entity in text; case-insensitive if the
+# model changed its case
+def locate_entity(text, entity):
+    pattern = r"(?<!\w)" + re.escape(entity) + r"(?!\w)"
+    matches = list(re.finditer(pattern, text)) or list(re.finditer(pattern, text, re.IGNORECASE))
+    return [[match.start(), match.end()] for match in matches]
+
+# Entities from all chunks, deduplicated per type ignoring case, each with its offsets in the whole
+# text, in order of first appearance. Each entity is only looked for in the chunks that reported it.
+@stage("merge")
+def merge_entities(text, chunks, outcomes):
+    merged = {}
+    for chunk, (groups, _) in zip(chunks, outcomes):
+        for entity_type, entities in (groups or {}).items():
+            for entity in entities:
+                entity = entity.strip()
+                if not entity:
+                    continue
+                offsets = merged.setdefault(entity_type, {}).setdefault(entity.casefold(), (entity, set()))[1]
+                offsets.update((chunk["start"] + start, chunk["start"] + end) for start, end in locate_entity(chunk["text"], entity))
+
+    result = {}
+    for entity_type in ENTITY_TYPES:
+        if entity_type not in merged:
+            continue
+        found = []
+        for entity, offsets in merged[entity_type].values():
+            offsets = [list(offset) for offset in sorted(offsets)]
+            # Spelled as in the text where it was found
+            if offsets:
+                entity = text[offsets[0][0]:offsets[0][1]]
+            found.append({"text": entity, "offsets": offsets})
+        found.sort(key=lambda item: item["offsets"][0][0] if item["offsets"] else len(text))
+        result[entity_type] = found
+    return result
+
+# Long texts are split at sentence boundaries and the chunks extracted concurrently, so latency follows
+# the largest chunk instead of the whole text
+def extract_entities_long(text, model, use_cache=True):
+    resolve_model(model)
+    chunks = split_text(text)
+
+    def extract_chunk(chunk):
+        return cached_result("ner-chunk", chunk, model, PROMPT_VERSION,
+                             lambda: parse_chunk_entities(call_model(model, build_chunk_prompt(chunk))), use_cache=use_cache)
+
+    outcomes = map_chunks(chunks, extract_chunk)
+    report = chunk_report(chunks, outcomes)
+    return {"entities": merge_entities(text, chunks, outcomes), "chunks": report}
+
+async def aextract_entities_long(text, model, use_cache=True):
+    resolve_model(model)
+    # Splitting tokenizes the whole text and merging scans it, so both run off the event loop
+    chunks = await run_blocking(split_text, text)
+
+    async def extract_chunk(chunk):
+        async def compute():
+            return parse_chunk_entities(await acall_model(model, build_chunk_prompt(chunk)))
+
+        return await acached_result("ner-chunk", chunk, model, PROMPT_VERSION, compute, use_cache=use_cache)
+
+    outcomes = await amap_chunks(chunks, extract_chunk)
+    report = chunk_report(chunks, outcomes)
+    return {"entities": await run_blocking(merge_entities, text, chunks, outcomes), "chunks": report}
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+# Quantized exports ship in the sentence-transformers repo, e.g. onnx/model.onnx, onnx/model_qint8_avx512_vnni.onnx
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "256"))
+
+# all-MiniLM-L6-v2 run through onnxruntime: mean pooling and L2 normalization, as in the
+# sentence-transformers pipeline, so vectors are interchangeable with the HuggingFace backend
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_name, batch_size=32, threads=0, onnx_file=EMBEDDING_ONNX_FILE, max_tokens=EMBEDDING_MAX_TOKENS, session=None, tokenizer=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer or self._load_tokenizer()
+        self.session = session or self._load_session(onnx_file, threads)
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _load_tokenizer(self):
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(hf_hub_download(self.model_name, "tokenizer.json"))
+        tokenizer.no_padding()
+        tokenizer.enable_truncation(max_length=self.max_tokens)
+        return tokenizer
+
+    def _load_session(self, onnx_file, threads):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        path = onnx_file if os.path.exists(onnx_file) else hf_hub_download(self.model_name, onnx_file)
+        return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def _run(self, encodings):
+        length = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.ids)] = 1
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, inputs)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    # Texts are sorted by token length and batched, so each batch pads to similar lengths
+    def embed(self, texts):
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        vectors = None
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            pooled = self._run([encodings[i] for i in batch])
+            if vectors is None:
+                vectors = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            vectors[batch] = pooled
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.embed(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed([text])[0].tolist()
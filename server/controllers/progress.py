@@ -0,0 +1,42 @@
+import contextvars
+from contextlib import contextmanager
+
+# Progress of the background job running in this context, if any. The pipeline reports what it
+# has done (pages parsed, chunks embedded, LLM calls made); outside a job every call is a no-op.
+_tracker = contextvars.ContextVar("job_progress", default=None)
+
+@contextmanager
+def track_progress(tracker):
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+
+def report_progress(key, amount=1):
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.add(key, amount)
+
+def set_progress(key, value):
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.set(key, value)
+
+# Raises if the job was cancelled; called before expensive steps such as LLM calls
+def checkpoint():
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.checkpoint()
+
+def _counted(items, tracker, key):
+    for item in items:
+        yield item
+        tracker.add(key, 1)
+
+# Pass items through, counting each one under key
+def count_progress(items, key):
+    tracker = _tracker.get()
+    if tracker is None:
+        return items
+    return _counted(items, tracker, key)
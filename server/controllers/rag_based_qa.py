@@ -1,89 +1,98 @@
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-import os
-from pypdf import PdfReader
-from docx import Document
-from together import Together
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-load_dotenv()
-TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-def call_model(model, prompt):
-
-    if model == "LLama 3.3 Meta":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": f"{prompt}"}]
-        )
-        return response.choices[0].message.content
-
-    elif model == "Google Gemini":
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=f"{prompt}"
-        )
-        return response.text
-
-    elif model == "Deepseek":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free",
-            messages=[{"role": "user", "content": f"{prompt}"}]
-        )
-        return response.choices[0].message.content
-
-# File processing functions
-def extract_text_from_file(uploaded_file):
-    file_extension = uploaded_file.filename.split('.')[-1].lower()
-    if file_extension == "pdf":
-        return extract_text_from_pdf(uploaded_file)
-    elif file_extension == "docx":
-        return extract_text_from_docx(uploaded_file)
-    elif file_extension == "txt":
-        return extract_text_from_txt(uploaded_file)
-    return ""
-
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    pdf_reader = PdfReader(pdf_file)
-    for page in pdf_reader.pages:
-        text += page.extract_text() or ''
-    return text
-
-def extract_text_from_docx(docx_file):
-    text = ""
-    doc = Document(docx_file)
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + '\n'
-    return text
-
-def extract_text_from_txt(txt_file):
-    return txt_file.read().decode('utf-8')
-
-# Text processing
-def process_text(text):
-    text_splitter = CharacterTextSplitter(separator="\n", chunk_size=1000, chunk_overlap=200, length_function=len)
-    chunks = text_splitter.split_text(text)
-    embeddings = HuggingFaceEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
-    knowledgebase = FAISS.from_texts(chunks, embeddings)
+from controllers.extraction import extract_text_from_file
+from controllers.index_cache import index_cache, index_cache_key
+from controllers.llm_provider import call_model, acall_model, stream_model, resolve_model
+from controllers.context_builder import build_context, pack_chunks, prompt_usage, token_budget, CONTEXT_SEPARATOR
+from controllers.tokens import count_tokens, tokenizer_name
+from controllers.executor import run_blocking
+from controllers.metrics import stage
+
+# Text processing: chunk sizes are in tokens of the local tokenizer
+CHUNK_SEPARATOR = "\n"
+CHUNK_SIZE = 250
+CHUNK_OVERLAP = 50
+
+# langchain and numpy are imported on first use, so workers that never see a document never load them
+def build_knowledgebase(text):
+    from langchain.text_splitter import CharacterTextSplitter
+    from controllers.chunk_store import build_faiss_index
+
+    text_splitter = CharacterTextSplitter(separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=count_tokens)
+    with stage("split"):
+        chunks = text_splitter.split_text(text)
+    knowledgebase = build_faiss_index(chunks)
     return knowledgebase
 
-def answer_query_from_document(text, query, model):
+# Reuse the index of a document we have already seen instead of re-embedding it
+def process_text(text):
+    key = index_cache_key(text, separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, tokenizer=tokenizer_name())
+    return index_cache.get_or_build(key, lambda: build_knowledgebase(text))
+
+def prompt_template(context, query):
+    return f"Answer the following question based on the provided context:\n\n{context}\n\nQuestion: {query}"
+
+# Pack the chunks most relevant to the query into the model's token budget and build the LLM prompt
+# from them; returns the prompt and its token usage
+def build_prompt(text, query, model, knowledgebase=None):
 
-    knowledgebase = process_text(text)
-    # Perform a similarity search to find the most relevant chunks for the given query
-    docs = knowledgebase.similarity_search(query, k=3)  # Retrieve top 3 relevant chunks
+    # Documents stored through /documents are passed in with their index already built
+    if knowledgebase is None:
+        knowledgebase = process_text(text)
+    context, usage = build_context(knowledgebase, query, model, lambda context: prompt_template(context, query))
 
-    # Combine the retrieved chunks into a context for the LLM
-    context = "\n\n".join([doc.page_content for doc in docs])
+    prompt = format_prompt(context, query)
+    return prompt, prompt_usage(prompt, model, usage)
 
+@stage("prompt_build")
+def format_prompt(context, query):
     # Prepare the prompt for LLM, providing context to answer the query
-    prompt = f"Answer the following question based on the provided context:\n\n{context}\n\nQuestion: {query}"
+    return prompt_template(context, query)
+
+# Answers come back with the prompt's token usage
+def answer_query_from_document(text, query, model, knowledgebase=None):
+    resolve_model(model)
+    prompt, usage = build_prompt(text, query, model, knowledgebase)
+    return call_model(model, prompt), usage
+
+# Embedding and FAISS search run on the CPU executor; the LLM call stays on the event loop
+async def aanswer_query_from_document(text, query, model, knowledgebase=None):
+    resolve_model(model)
+    prompt, usage = await run_blocking(build_prompt, text, query, model, knowledgebase)
+    return await acall_model(model, prompt), usage
+
+# Retrieval happens eagerly; only the LLM answer is streamed
+def stream_answer_from_document(text, query, model, knowledgebase=None):
+    resolve_model(model)
+    prompt, usage = build_prompt(text, query, model, knowledgebase)
+    return stream_model(model, prompt), usage
+
+# Corpus-wide retrieval (controllers/corpus_index.py) feeding the same prompt as a single document.
+# k bounds the sources; the model's token budget may keep fewer.
+def build_corpus_prompt(query, model, k=3, document_ids=None, tags=None):
+    import numpy as np
+    from controllers.corpus_index import get_corpus_index
+
+    sources = get_corpus_index().search(query, k, document_ids, tags)
+    if not sources:
+        raise LookupError("No indexed documents match the query filters")
+    budget = token_budget(model)
+    relevance = np.array([source["score"] for source in sources], dtype=np.float32)
+    pieces, taken = pack_chunks([source["text"] for source in sources], None, relevance,
+                                max(0, budget - count_tokens(prompt_template("", query))))
+    prompt = format_prompt(CONTEXT_SEPARATOR.join(pieces), query)
+    usage = {"budget_tokens": budget, "chunks_considered": len(sources), "chunks_used": len(taken)}
+    return prompt, [sources[index] for index in taken], prompt_usage(prompt, model, usage)
+
+def answer_query_from_corpus(query, model, k=3, document_ids=None, tags=None):
+    resolve_model(model)
+    prompt, sources, usage = build_corpus_prompt(query, model, k, document_ids, tags)
+    return call_model(model, prompt), sources, usage
+
+async def aanswer_query_from_corpus(query, model, k=3, document_ids=None, tags=None):
+    resolve_model(model)
+    prompt, sources, usage = await run_blocking(build_corpus_prompt, query, model, k, document_ids, tags)
+    return await acall_model(model, prompt), sources, usage
 
-    return call_model(model, prompt)
\ No newline at end of file
+def stream_answer_from_corpus(query, model, k=3, document_ids=None, tags=None):
+    resolve_model(model)
+    prompt, _, usage = build_corpus_prompt(query, model, k, document_ids, tags)
+    return stream_model(model, prompt), usage
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+from controllers.single_flight import coalesce, acoalesce
+
+load_dotenv()
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "")  # e.g. .cache/results.sqlite3; empty keeps the cache in memory only
+RESULT_CACHE_DB_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_DB_MAX_ENTRIES", "200000"))
+
+_whitespace = re.compile(r"\s+")
+
+# Inputs that differ only in unicode form or whitespace produce the same LLM output
+def normalize_text(text):
+    return _whitespace.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+def result_cache_key(namespace, text, model, prompt_version, language=None):
+    payload = json.dumps([namespace, prompt_version, model, language, normalize_text(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SqliteResultStore:
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    # Opened on first use in each process: the connection must not cross a fork. Called with self._lock held.
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    # The value and the time it was stored, or None
+    def get(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > ttl:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row[0]), row[1]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+            self._writes += 1
+            # Size-based eviction is checked every few hundred writes rather than on each insert
+            if self._writes % 256 == 0:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM results")
+            conn.commit()
+
+# Two-tier cache for deterministic LLM results: in-memory LRU in front of optional SQLite
+class ResultCache:
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL_SECONDS, db_path=RESULT_CACHE_DB, db_max_entries=RESULT_CACHE_DB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = SqliteResultStore(db_path, db_max_entries) if db_path else None
+        self._entries = OrderedDict()  # key -> (value, created), created in time.time() like the disk tier
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, namespace, name):
+        counters = self._stats.setdefault(namespace, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        counters[name] += 1
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._count(namespace, "memory_hits")
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+        stored = self.store.get(key, self.ttl) if self.store else None
+        with self._lock:
+            if stored is None:
+                self._count(namespace, "misses")
+                return None
+            self._count(namespace, "disk_hits")
+        # The entry keeps the time it was stored, so the TTL runs from the original compute
+        value, created = stored
+        self._put_memory(key, value, created)
+        return value
+
+    def set(self, key, value):
+        self._put_memory(key, value, time.time())
+        if self.store:
+            self.store.set(key, value)
+
+    def _put_memory(self, key, value, created):
+        with self._lock:
+            self._entries[key] = (value, created)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self._stats.items():
+                lookups = sum(counters.values())
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                namespaces[namespace] = dict(counters, hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+            return {"entries": len(self._entries), "persistent": self.store is not None, "namespaces": namespaces}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store:
+            self.store.clear()
+
+result_cache = ResultCache()
+
+# Uncached requests coalesce only with each other: a cached request never waits on a compute() that
+# will not store its result, and a no_cache request never gets a result it did not ask to recompute
+def uncached_flight_key(key):
+    return f"no-cache:{key}"
+
+# Look the result up first and only call compute() on a miss; empty results are never stored.
+# Identical requests that miss together share one compute() call.
+def cached_result(namespace, text, model, prompt_version, compute, language=None, use_cache=True):
+    key = result_cache_key(namespace, text, model, prompt_version, language)
+    if not (use_cache and RESULT_CACHE_ENABLED):
+        return coalesce(namespace, uncached_flight_key(key), compute)
+
+    def compute_and_store():
+        value = compute()
+        if value:
+            result_cache.set(key, value)
+        return value
+
+    value = result_cache.get(namespace, key)
+    if value is None:
+        value = coalesce(namespace, key, compute_and_store)
+    return value
+
+async def acached_result(namespace, text, model, prompt_version, compute, language=None, use_cache=True):
+    key = result_cache_key(namespace, text, model, prompt_version, language)
+    if not (use_cache and RESULT_CACHE_ENABLED):
+        return await acoalesce(namespace, uncached_flight_key(key), compute)
+
+    async def compute_and_store():
+        value = await compute()
+        if value:
+            result_cache.set(key, value)
+        return value
+
+    value = result_cache.get(namespace, key)
+    if value is None:
+        value = await acoalesce(namespace, key, compute_and_store)
+    return value
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from controllers.metrics import observe_routing
+from controllers.admission import AdmissionError
+
+load_dotenv()
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "false").lower() == "true"
+ROUTING_WINDOW = int(os.getenv("ROUTING_WINDOW", "200"))  # outcomes kept per model
+ROUTING_WINDOW_SECONDS = float(os.getenv("ROUTING_WINDOW_SECONDS", "300"))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "20"))
+ROUTING_HEDGE_PERCENTILE = float(os.getenv("ROUTING_HEDGE_PERCENTILE", "0.95"))
+ROUTING_HEDGE_MIN_SECONDS = float(os.getenv("ROUTING_HEDGE_MIN_SECONDS", "0.5"))
+ROUTING_HEDGE_DEFAULT_SECONDS = float(os.getenv("ROUTING_HEDGE_DEFAULT_SECONDS", "10"))  # until ROUTING_MIN_SAMPLES
+ROUTING_MAX_ERROR_RATE = float(os.getenv("ROUTING_MAX_ERROR_RATE", "0.5"))
+ROUTING_WORKERS = int(os.getenv("ROUTING_WORKERS", "32"))
+
+# Models whose answers are interchangeable, tried in this order when the requested one is slow or failing
+DEFAULT_EQUIVALENTS = {
+    "LLama 3.3 Meta": ["Deepseek", "Google Gemini"],
+    "Deepseek": ["LLama 3.3 Meta", "Google Gemini"],
+    "Google Gemini": ["LLama 3.3 Meta", "Deepseek"]
+}
+ROUTING_EQUIVALENTS = json.loads(os.getenv("ROUTING_EQUIVALENTS", "") or "null") or DEFAULT_EQUIVALENTS
+
+# Recent outcomes of one model: latency of each success, None for each error. Entries older than
+# ROUTING_WINDOW_SECONDS fall out, so a model demoted for errors is tried again once they age out.
+class ModelHealth:
+    def __init__(self):
+        self.outcomes = deque(maxlen=ROUTING_WINDOW)  # (finished, seconds or None)
+
+    def _prune(self, now):
+        while self.outcomes and now - self.outcomes[0][0] > ROUTING_WINDOW_SECONDS:
+            self.outcomes.popleft()
+
+    def record(self, seconds):
+        now = time.monotonic()
+        self._prune(now)
+        self.outcomes.append((now, seconds))
+
+    def snapshot(self):
+        self._prune(time.monotonic())
+        latencies = sorted(seconds for _, seconds in self.outcomes if seconds is not None)
+        errors = len(self.outcomes) - len(latencies)
+        return latencies, errors
+
+class Router:
+    def __init__(self, equivalents=ROUTING_EQUIVALENTS):
+        self.equivalents = equivalents
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self._lock:
+            self._health.setdefault(model, ModelHealth()).record(seconds)
+
+    def _snapshot(self, model):
+        with self._lock:
+            health = self._health.get(model)
+            return health.snapshot() if health else ([], 0)
+
+    def healthy(self, model):
+        latencies, errors = self._snapshot(model)
+        total = len(latencies) + errors
+        return total < ROUTING_MIN_SAMPLES or errors / total <= ROUTING_MAX_ERROR_RATE
+
+    # The requested model first, then its equivalents; models failing too often move to the back
+    def candidates(self, model, known):
+        names = [model] + [name for name in self.equivalents.get(model, []) if name != model and name in known]
+        return [name for name in names if self.healthy(name)] + [name for name in names if not self.healthy(name)]
+
+    # How long to wait on a call before sending a duplicate elsewhere: the model's recent p95
+    def hedge_delay(self, model):
+        latencies, _ = self._snapshot(model)
+        if len(latencies) < ROUTING_MIN_SAMPLES:
+            return ROUTING_HEDGE_DEFAULT_SECONDS
+        index = min(len(latencies) - 1, int(len(latencies) * ROUTING_HEDGE_PERCENTILE))
+        return max(ROUTING_HEDGE_MIN_SECONDS, latencies[index])
+
+    def stats(self):
+        models = {}
+        for model in list(self._health):
+            latencies, errors = self._snapshot(model)
+            total = len(latencies) + errors
+            models[model] = {
+                "samples": total,
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "p50_seconds": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                "hedge_after_seconds": round(self.hedge_delay(model), 3),
+                "healthy": self.healthy(model)
+            }
+        return models
+
+router = Router()
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = 0  # attempts submitted to the pool and not finished, queued ones included
+
+# Routed calls block a pool thread per attempt; created on first use so forked workers get their own
+def get_routing_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=ROUTING_WORKERS, thread_name_prefix="llm-route")
+        return _pool
+
+def _pool_has_room():
+    with _pool_lock:
+        return _in_flight < ROUTING_WORKERS
+
+def _submit(pool, fn, *args):
+    global _in_flight
+    with _pool_lock:
+        _in_flight += 1
+    future = pool.submit(fn, *args)
+    future.add_done_callback(_finished)
+    return future
+
+def _finished(future):
+    global _in_flight
+    with _pool_lock:
+        _in_flight -= 1
+
+# When an attempt started running, as opposed to when it was queued
+class AttemptClock:
+    def __init__(self):
+        self.began = threading.Event()
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.began.set()
+
+def _timed(model, attempt, clock=None):
+    started = time.perf_counter()
+    if clock is not None:
+        clock.start()
+    try:
+        response = attempt(model)
+    except AdmissionError:
+        # Refused by our own rate limits; says nothing about the provider's health
+        raise
+    except Exception:
+        router.record(model, None)
+        raise
+    router.record(model, time.perf_counter() - started)
+    return response
+
+# Without a free pool worker the candidates are tried one after another in the caller's thread:
+# failover still works, but a hedge would only queue behind the attempts it is meant to overtake
+def _inline_call(model, candidates, attempt):
+    errors = []
+    for name in candidates:
+        if errors:
+            observe_routing(model, "failover")
+        try:
+            response = _timed(name, attempt)
+        except Exception as e:
+            errors.append(e)
+            continue
+        if name != model:
+            observe_routing(model, "served_by_alternate")
+        return response
+    raise errors[0]
+
+# Call the first candidate; if it runs past its hedge delay, send one duplicate to the next candidate
+# and take whichever answers first. Errors fail over to the next candidate; the first error is raised
+# once all have failed. A losing synchronous call cannot be interrupted: it finishes in the
+# background and only its latency is kept. The hedge delay counts from when the latest attempt
+# started running, so time spent queued for a pool worker never triggers a hedge.
+def routed_call(model, attempt, known):
+    candidates = router.candidates(model, known)
+    if not _pool_has_room():
+        return _inline_call(model, candidates, attempt)
+    pool = get_routing_pool()
+    pending = {}
+    errors = []
+    hedged = False
+    latest = None
+
+    def launch():
+        nonlocal latest
+        name = candidates[len(pending) + len(errors)]
+        latest = (name, AttemptClock())
+        # Each attempt runs in a copy of the caller's context, so its timings land in this request
+        pending[_submit(pool, contextvars.copy_context().run, _timed, name, attempt, latest[1])] = name
+
+    launch()
+    while pending:
+        can_hedge = not hedged and len(pending) + len(errors) < len(candidates) and _pool_has_room()
+        timeout = None
+        if can_hedge:
+            # Before the hedge the latest attempt is the only one pending, and it cannot finish before it starts
+            name, clock = latest
+            clock.began.wait()
+            timeout = max(0.0, clock.started + router.hedge_delay(name) - time.perf_counter())
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            hedged = True
+            observe_routing(model, "hedge")
+            launch()
+            continue
+
+        for future in done:
+            name = pending.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            for loser in pending:
+                loser.cancel()
+            if name != model:
+                observe_routing(model, "served_by_alternate")
+            return response
+
+        if len(pending) + len(errors) < len(candidates):
+            observe_routing(model, "failover")
+            launch()
+    raise errors[0]
+
+async def _atimed(model, attempt):
+    started = time.perf_counter()
+    try:
+        response = await attempt(model)
+    except AdmissionError:
+        raise
+    except Exception:
+        router.record(model, None)
+        raise
+    router.record(model, time.perf_counter() - started)
+    return response
+
+# Same policy in the event loop, where the losing request is cancelled
+async def arouted_call(model, attempt, known):
+    candidates = router.candidates(model, known)
+    pending = {}
+    errors = []
+    hedged = False
+
+    def launch():
+        name = candidates[len(pending) + len(errors)]
+        pending[asyncio.ensure_future(_atimed(name, attempt))] = name
+
+    launch()
+    try:
+        while pending:
+            can_hedge = not hedged and len(pending) + len(errors) < len(candidates)
+            timeout = router.hedge_delay(candidates[0]) if can_hedge else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                observe_routing(model, "hedge")
+                launch()
+                continue
+
+            for task in done:
+                name = pending.pop(task)
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                if name != model:
+                    observe_routing(model, "served_by_alternate")
+                return task.result()
+
+            if len(pending) + len(errors) < len(candidates):
+                observe_routing(model, "failover")
+                launch()
+        raise errors[0]
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from controllers.embeddings import get_embeddings
+from controllers.result_cache import normalize_text
+from controllers.executor import run_blocking
+from controllers.metrics import stage, observe_semantic_lookup
+
+load_dotenv()
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))  # per model
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+
+# Past questions of one model and prompt version. Unit vectors sit in a matrix searched with one
+# matrix-vector product; slots of evicted or expired questions are reused. numpy is imported on
+# first use so the app starts without it.
+class SemanticPartition:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.vectors = None
+        self.size = 0  # slots handed out so far
+        self.entries = {}  # slot -> (question, answer, created)
+        self.slots = OrderedDict()  # question -> slot, least recently used first
+        self.free = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Closest live question as (slot, similarity); expired questions met on the way are dropped
+    def search(self, vector, ttl):
+        import numpy as np
+
+        if not self.entries:
+            return None, None
+        scores = self.vectors[:self.size] @ vector
+        scores[self.free] = -np.inf
+        while True:
+            slot = int(np.argmax(scores))
+            if scores[slot] == -np.inf:
+                return None, None
+            if time.monotonic() - self.entries[slot][2] <= ttl:
+                return slot, float(scores[slot])
+            self.remove(slot)
+            scores[slot] = -np.inf
+
+    def touch(self, slot):
+        self.slots.move_to_end(self.entries[slot][0])
+        return self.entries[slot][1]
+
+    def insert(self, question, vector, answer):
+        import numpy as np
+
+        slot = self.slots.get(question)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+            elif self.size < self.max_entries:
+                slot = self.size
+                self.size += 1
+            else:
+                _, slot = self.slots.popitem(last=False)
+            self.slots[question] = slot
+
+        # The matrix grows by doubling up to max_entries
+        capacity = 0 if self.vectors is None else len(self.vectors)
+        if slot >= capacity:
+            grown = np.zeros((min(self.max_entries, max(64, capacity * 2, slot + 1)), len(vector)), dtype=np.float32)
+            if capacity:
+                grown[:capacity] = self.vectors
+            self.vectors = grown
+
+        self.vectors[slot] = vector
+        self.entries[slot] = (question, answer, time.monotonic())
+        self.slots.move_to_end(question)
+
+    def remove(self, slot):
+        question, _, _ = self.entries.pop(slot)
+        del self.slots[question]
+        self.free.append(slot)
+
+# Answers reused for questions that mean the same thing: a question whose embedding is at least
+# `threshold` cosine-similar to a past question of the same model gets that question's answer
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._partitions = {}  # (model, prompt_version) -> SemanticPartition
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @stage("semantic_cache")
+    def embed(self, question):
+        import numpy as np
+
+        vector = np.asarray(get_embeddings().embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # Returns (answer or None, vector); the vector is handed back to set() so a miss is embedded once
+    def get(self, model, prompt_version, question):
+        vector = self.embed(normalize_text(question))
+        with self._lock:
+            partition = self._partitions.get((model, prompt_version))
+            slot, similarity = partition.search(vector, self.ttl) if partition else (None, None)
+            hit = similarity is not None and similarity >= self.threshold
+            answer = partition.touch(slot) if hit else None
+            counters = self._stats.setdefault(model, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+        observe_semantic_lookup(model, hit, similarity)
+        return answer, vector
+
+    def set(self, model, prompt_version, question, vector, answer):
+        with self._lock:
+            partition = self._partitions.get((model, prompt_version))
+            if partition is None:
+                partition = self._partitions[(model, prompt_version)] = SemanticPartition(self.max_entries)
+            partition.insert(normalize_text(question), vector, answer)
+
+    def stats(self):
+        with self._lock:
+            models = {}
+            for model, counters in self._stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                entries = sum(len(partition) for key, partition in self._partitions.items() if key[0] == model)
+                models[model] = dict(counters, entries=entries, hit_rate=round(counters["hits"] / lookups, 4) if lookups else 0.0)
+            return {"threshold": self.threshold, "models": models}
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+semantic_cache = SemanticCache()
+
+# Like cached_result, but matching questions by meaning; empty answers are never stored
+def cached_answer(question, model, prompt_version, compute, use_cache=True):
+    if not (use_cache and SEMANTIC_CACHE_ENABLED):
+        return compute()
+
+    answer, vector = semantic_cache.get(model, prompt_version, question)
+    if answer is None:
+        answer = compute()
+        if answer:
+            semantic_cache.set(model, prompt_version, question, vector, answer)
+    return answer
+
+# Embedding is CPU work, so the lookup runs on the executor
+async def acached_answer(question, model, prompt_version, compute, use_cache=True):
+    if not (use_cache and SEMANTIC_CACHE_ENABLED):
+        return await compute()
+
+    answer, vector = await run_blocking(semantic_cache.get, model, prompt_version, question)
+    if answer is None:
+        answer = await compute()
+        if answer:
+            semantic_cache.set(model, prompt_version, question, vector, answer)
+    return answer
+
+# stream opens the provider stream. A hit is sent as a single token without opening it; a miss is stored once it completes
+def stream_cached_answer(question, model, prompt_version, stream, use_cache=True):
+    if not (use_cache and SEMANTIC_CACHE_ENABLED):
+        yield from stream()
+        return
+
+    answer, vector = semantic_cache.get(model, prompt_version, question)
+    if answer is not None:
+        yield answer
+        return
+
+    parts = []
+    for token in stream():
+        parts.append(token)
+        yield token
+    if parts:
+        semantic_cache.set(model, prompt_version, question, vector, "".join(parts))
@@ -1,40 +1,22 @@
-import os
-from together import Together
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-load_dotenv() 
-TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-def call_model(model, query):
-    if model == "LLama 3.3 Meta":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": f"{query}"}]
-        )
-        return response.choices[0].message.content.strip()
-
-    elif model == "Google Gemini":
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=f"{query}"
-        )
-        return response.text.strip()
-
-    elif model == "Deepseek":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free",
-            messages=[{"role": "user", "content": f"{query}"}]
-        )
-        return response.choices[0].message.content.strip()
-    
-def analyze_sentiment(text, model):
-    if text:
-        query = f'''You are a sentiment analysis expert. Your task is to analyze the following text and classify its overall sentiment.
+import re
+from controllers.metrics import stage
+from controllers.llm_provider import call_model, acall_model, resolve_model
+from controllers.result_cache import cached_result, acached_result
+from controllers.batching import run_batch, arun_batch
+from controllers.long_text import split_text, map_chunks, amap_chunks, chunk_report
+from controllers.executor import run_blocking
+
+# Bump when the prompt changes so cached results from the old prompt are not reused
+PROMPT_VERSION = 1
+
+SENTIMENTS = ('positive', 'negative', 'neutral')
+SENTIMENT_SCORES = {'positive': 1.0, 'neutral': 0.0, 'negative': -1.0}
+# Aggregate scores within this distance of zero are reported as neutral
+NEUTRAL_BAND = 0.2
+
+@stage("prompt_build")
+def build_prompt(text):
+    return f'''You are a sentiment analysis expert. Your task is to analyze the following text and classify its overall sentiment.
 
         Instructions:
         1. Read the provided text carefully.
@@ -45,6 +27,123 @@ def analyze_sentiment(text, model):
         Text: {text}
 
         Sentiment: '''
-        
+
+def analyze_sentiment(text, model, use_cache=True):
+    if text:
         # Sentiment result
-        return call_model(model, query)
\ No newline at end of file
+        return cached_result("sentiment", text, model, PROMPT_VERSION,
+                             lambda: call_model(model, build_prompt(text)).strip(), use_cache=use_cache)
+
+async def aanalyze_sentiment(text, model, use_cache=True):
+    async def compute():
+        return (await acall_model(model, build_prompt(text))).strip()
+
+    if text:
+        return await acached_result("sentiment", text, model, PROMPT_VERSION, compute, use_cache=use_cache)
+
+# Several texts in one prompt, answered one "[index] label" line each
+@stage("prompt_build")
+def build_batch_prompt(items):
+    return f'''You are a sentiment analysis expert. Your task is to classify the overall sentiment of each numbered text below.
+
+        Instructions:
+        1. Read each text carefully and independently of the others.
+        2. Classify each text as either positive, negative, or neutral.
+        3. Return exactly one line per text in the form [index] sentiment, using the same index as the text.
+        4. **Return only these lines, without any additional explanation or analysis.**
+
+        Texts:
+        {items}
+
+        Sentiments:
+        '''
+
+def parse_batch_sentiment(value):
+    sentiment = value.strip(" .*").lower()
+    if sentiment not in SENTIMENTS:
+        raise ValueError(f"Unexpected sentiment: {value}")
+    return {"sentiment": sentiment}
+
+def analyze_sentiment_batch(texts, model):
+    # An unknown model is a client error, not one error per text
+    resolve_model(model)
+    return run_batch(texts, build_batch_prompt, parse_batch_sentiment,
+                     lambda prompt: call_model(model, prompt))
+
+async def aanalyze_sentiment_batch(texts, model):
+    resolve_model(model)
+    return await arun_batch(texts, build_batch_prompt, parse_batch_sentiment,
+                            lambda prompt: acall_model(model, prompt))
+
+# One chunk of a long text, answered with a label and a score so chunks can be aggregated
+@stage("prompt_build")
+def build_chunk_prompt(text):
+    return f'''You are a sentiment analysis expert. Your task is to analyze the following text and classify its overall sentiment.
+
+        Instructions:
+        1. Read the provided text carefully.
+        2. Classify the sentiment as either positive, negative, or neutral.
+        3. Score its strength from -1 (very negative) through 0 (neutral) to 1 (very positive).
+        4. **Return only one line in the form: sentiment score (for example: negative -0.6), without any additional explanation or analysis.**
+
+        Text: {text}
+
+        Sentiment: '''
+
+_chunk_sentiment = re.compile(r"(positive|negative|neutral)[\s:,(]*(-?\d+(?:\.\d+)?)?", re.IGNORECASE)
+
+def parse_chunk_sentiment(output):
+    match = _chunk_sentiment.search(output)
+    if not match:
+        raise ValueError(f"Unexpected sentiment: {output.strip()}")
+    sentiment = match.group(1).lower()
+    # Without a usable score the label alone decides it
+    score = float(match.group(2)) if match.group(2) else SENTIMENT_SCORES[sentiment]
+    return {"sentiment": sentiment, "score": max(-1.0, min(1.0, score))}
+
+# Overall sentiment as the mean chunk score weighted by chunk length, plus each chunk's result
+@stage("merge")
+def aggregate_sentiment(chunks, outcomes):
+    report = chunk_report(chunks, outcomes)
+    total = weight = 0.0
+    for entry, (result, _) in zip(report, outcomes):
+        if result is None:
+            continue
+        entry.update(result)
+        size = entry["end"] - entry["start"]
+        total += result["score"] * size
+        weight += size
+
+    score = total / weight
+    if score > NEUTRAL_BAND:
+        sentiment = "positive"
+    elif score < -NEUTRAL_BAND:
+        sentiment = "negative"
+    else:
+        sentiment = "neutral"
+    return {"sentiment": sentiment, "score": round(score, 4), "chunks": report}
+
+# Long texts are split at sentence boundaries and the chunks scored concurrently, so latency follows
+# the largest chunk instead of the whole text
+def analyze_sentiment_long(text, model, use_cache=True):
+    resolve_model(model)
+    chunks = split_text(text)
+
+    def analyze_chunk(chunk):
+        return cached_result("sentiment-chunk", chunk, model, PROMPT_VERSION,
+                             lambda: parse_chunk_sentiment(call_model(model, build_chunk_prompt(chunk))), use_cache=use_cache)
+
+    return aggregate_sentiment(chunks, map_chunks(chunks, analyze_chunk))
+
+async def aanalyze_sentiment_long(text, model, use_cache=True):
+    resolve_model(model)
+    # Splitting tokenizes the whole text, so it runs off the event loop
+    chunks = await run_blocking(split_text, text)
+
+    async def analyze_chunk(chunk):
+        async def compute():
+            return parse_chunk_sentiment(await acall_model(model, build_chunk_prompt(chunk)))
+
+        return await acached_result("sentiment-chunk", chunk, model, PROMPT_VERSION, compute, use_cache=use_cache)
+
+    return aggregate_sentiment(chunks, await amap_chunks(chunks, analyze_chunk))
@@ -0,0 +1,66 @@
+import json
+import asyncio
+import hashlib
+import threading
+from controllers.metrics import observe_coalesced
+
+def flight_key(name, model, *payload):
+    return hashlib.sha256(json.dumps([name, model, *payload]).encode("utf-8")).hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Concurrent calls with the same key share one computation: the first caller runs it, the others
+# wait and receive its result, or its exception. Nothing is kept once the call finishes; reusing
+# finished results is the caches' job.
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> _Call, threads
+        self._tasks = {}  # key -> asyncio.Task, event loop
+        self._lock = threading.Lock()
+
+    def do(self, name, key, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            observe_coalesced(name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    # The computation runs as its own task, so a caller that disconnects does not cancel it for the rest
+    async def ado(self, name, key, compute):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            observe_coalesced(name)
+        return await asyncio.shield(task)
+
+single_flight = SingleFlight()
+
+def coalesce(name, key, compute):
+    return single_flight.do(name, key, compute)
+
+async def acoalesce(name, key, compute):
+    return await single_flight.ado(name, key, compute)
@@ -0,0 +1,81 @@
+import os
+import time
+import resource
+import importlib
+import multiprocessing
+from dotenv import load_dotenv
+from controllers.embeddings import get_embeddings, warm_up_embeddings, EMBEDDING_BACKEND
+from controllers.metrics import observe_worker_start
+from controllers.tokens import get_tokenizer
+from controllers.job_queue import resume_jobs
+
+load_dotenv()
+PRELOAD_EMBEDDINGS = os.getenv("PRELOAD_EMBEDDINGS", "false").lower() == "true"
+PRELOAD_WARM_UP = os.getenv("PRELOAD_WARM_UP", "process")  # "worker" when workers fork after preload
+
+# Imported lazily by the document routes; preloading them in a master process lets forked workers share them
+HEAVY_MODULES = (
+    "numpy",
+    "langchain.text_splitter",
+    "langchain_community.vectorstores",
+    "pypdf",
+    "docx",
+    "controllers.chunk_store",
+    "controllers.corpus_index",
+)
+
+# Extraction pool workers are started with forkserver or spawn, which import the entry script again as
+# __mp_main__; they only parse documents, so the script must skip its server startup in them
+def is_pool_child(module_name):
+    return module_name == "__mp_main__" or multiprocessing.parent_process() is not None
+
+# Import the heavy modules and load the tokenizer and the embedding model. Before a fork only the weights are loaded:
+# inference starts the runtime's thread pools, which do not survive fork, so warm-up happens per
+# worker. ONNX sessions start their pools when created and are loaded per worker too.
+def preload():
+    started = time.perf_counter()
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
+    get_tokenizer()
+    if PRELOAD_WARM_UP != "worker":
+        warm_up_embeddings()
+    elif EMBEDDING_BACKEND != "onnx":
+        get_embeddings()
+    return time.perf_counter() - started
+
+# Resident memory split into what this process shares with others (copy-on-write pages from the
+# master) and what it owns; pss charges shared pages proportionally to each process
+def process_memory():
+    try:
+        fields = {}
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+        return {
+            "rss": fields["Rss"],
+            "pss": fields["Pss"],
+            "shared": fields["Shared_Clean"] + fields["Shared_Dirty"],
+            "private": fields["Private_Clean"] + fields["Private_Dirty"],
+        }
+    except (OSError, KeyError):
+        # No smaps_rollup (macOS, old kernels): peak RSS is the best available figure
+        scale = 1 if os.uname().sysname == "Darwin" else 1024
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale}
+
+def format_memory(memory):
+    return ", ".join(f"{kind} {value / (1024 * 1024):.0f}MB" for kind, value in memory.items())
+
+# Finish starting a forked worker: warm the model and resume queued jobs in this process, then report
+def init_worker(started, logger):
+    if PRELOAD_EMBEDDINGS:
+        warm_up_embeddings()
+    resume_jobs()
+    report_ready(started, logger)
+
+def report_ready(started, logger):
+    seconds = time.perf_counter() - started
+    memory = process_memory()
+    observe_worker_start(seconds, memory, PRELOAD_EMBEDDINGS)
+    logger.info(f"Worker {os.getpid()} ready in {seconds * 1000:.0f}ms ({format_memory(memory)})")
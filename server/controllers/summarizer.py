@@ -1,19 +1,28 @@
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 import os
-from pypdf import PdfReader
-from docx import Document
-from together import Together
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai  
+from controllers.extraction import extract_text_from_file
+from controllers.index_cache import index_cache, index_cache_key
+from controllers.llm_provider import call_model, acall_model, UnknownModelError
+from controllers.admission import AdmissionError
+from controllers.executor import run_blocking, inherit_context
+from controllers.tokens import estimate_tokens, count_tokens, tokenizer_name
+from controllers.context_builder import build_context, prompt_usage
+from controllers.metrics import stage
+from controllers.progress import set_progress
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
-TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "map_reduce")  # "map_reduce" or "retrieval"
+SUMMARY_GROUP_TOKENS = int(os.getenv("SUMMARY_GROUP_TOKENS", "3000"))
+SUMMARY_SINGLE_CALL_TOKENS = int(os.getenv("SUMMARY_SINGLE_CALL_TOKENS", "3000"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+SUMMARY_MODES = ("map_reduce", "retrieval")
 
-def call_model(model, context=""):
-    summarization_prompt = '''You are an advanced AI assistant skilled in document summarization. Your task is to provide a concise, yet informative summary of the provided content.
+SUMMARIZATION_PROMPT = '''You are an advanced AI assistant skilled in document summarization. Your task is to provide a concise, yet informative summary of the provided content.
 
     Context from knowledge retrieval system:
     {context}
@@ -25,79 +34,173 @@ def call_model(model, context=""):
     - Integrates the most relevant information from the retrieved context
     - Maintains factual accuracy according to the source material'''
 
-    if model == "LLama 3.3 Meta":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": f"{summarization_prompt}\n\n{context}"}]
-        )
-        return response.choices[0].message.content
-
-    elif model == "Google Gemini":
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=f"{summarization_prompt}\n\n{context}"
-        )
-        return response.text
-
-    elif model == "Deepseek":
-        client = Together(api_key=TOGETHER_AI_API_KEY)
-        response = client.chat.completions.create(
-            model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free",
-            messages=[{"role": "user", "content": f"{summarization_prompt}\n\n{context}"}]
-        )
-        return response.choices[0].message.content
-
-# File processing functions
-def extract_text_from_file(uploaded_file):
-    file_extension = uploaded_file.filename.split('.')[-1].lower()
-    if file_extension == "pdf":
-        return extract_text_from_pdf(uploaded_file)
-    elif file_extension == "docx":
-        return extract_text_from_docx(uploaded_file)
-    elif file_extension == "txt":
-        return extract_text_from_txt(uploaded_file)
-    return ""
-
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    pdf_reader = PdfReader(pdf_file)
-    for page in pdf_reader.pages:
-        text += page.extract_text() or ''
-    return text
-
-def extract_text_from_docx(docx_file):
-    text = ""
-    doc = Document(docx_file)
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + '\n'
-    return text
-
-def extract_text_from_txt(txt_file):
-    return txt_file.read().decode('utf-8')
-
-# Text processing
-def process_text(text):
-    text_splitter = CharacterTextSplitter(separator="\n", chunk_size=1000, chunk_overlap=200, length_function=len)
-    chunks = text_splitter.split_text(text)
-    embeddings = HuggingFaceEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
-    knowledgebase = FAISS.from_texts(chunks, embeddings)
+MAP_PROMPT = '''You are an advanced AI assistant skilled in document summarization. The following text is part {part} of {parts} of a longer document.
+
+    Summarize this part so it can later be combined with summaries of the other parts:
+    - Keep the main points, key facts, figures, names and dates
+    - Keep the arguments made and any conclusions reached
+    - Do not add information that is not in the text
+    - Return only the summary'''
+
+COMBINE_PROMPT = '''You are an advanced AI assistant skilled in document summarization. The following are summaries of consecutive parts of one document.
+
+    Merge them into a single shorter summary that:
+    - Keeps the main points, key facts and conclusions from every part
+    - Removes repetition between parts
+    - Preserves the order in which topics appear in the document
+    - Returns only the merged summary'''
+
+# Function to summarize the retrieved context
+def summarize_context(model, context=""):
+    return call_model(model, final_prompt(context))
+
+# Text processing: chunk sizes are in tokens of the local tokenizer
+CHUNK_SEPARATOR = "\n"
+CHUNK_SIZE = 250
+CHUNK_OVERLAP = 50
+
+def build_knowledgebase(text):
+    from langchain.text_splitter import CharacterTextSplitter
+    from controllers.chunk_store import build_faiss_index
+
+    text_splitter = CharacterTextSplitter(separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=count_tokens)
+    with stage("split"):
+        chunks = text_splitter.split_text(text)
+    knowledgebase = build_faiss_index(chunks)
     return knowledgebase
 
-def summarize_text(text, model):
-    try:
+# Reuse the index of a document we have already seen instead of re-embedding it
+def process_text(text):
+    key = index_cache_key(text, separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, tokenizer=tokenizer_name())
+    return index_cache.get_or_build(key, lambda: build_knowledgebase(text))
+
+# Fill the model's token budget with the chunks that best, and most diversely, cover the document's main topics
+def retrieve_context(text, model, knowledgebase=None):
+    if knowledgebase is None:
         knowledgebase = process_text(text)
-        
-        query = "What are the primary topics, arguments, and conclusions in this document?"
-        
-        docs = knowledgebase.similarity_search(query)
-        context = docs[0].page_content if docs else ""
-        
-        # Add timeout handling for API calls
-        return call_model(model, context)
+    
+    query = "What are the primary topics, arguments, and conclusions in this document?"
+    
+    context, usage = build_context(knowledgebase, query, model, lambda context: f"{SUMMARIZATION_PROMPT}\n\n{context}")
+    prompt_usage(f"{SUMMARIZATION_PROMPT}\n\n{context}", model, usage)
+    return context
+
+# Split text into consecutive groups that each fit the per-call token budget
+def group_text(text, budget=SUMMARY_GROUP_TOKENS):
+    from langchain.text_splitter import CharacterTextSplitter
+
+    text_splitter = CharacterTextSplitter(separator=CHUNK_SEPARATOR, chunk_size=CHUNK_SIZE, chunk_overlap=0, length_function=count_tokens)
+    with stage("split"):
+        return group_pieces(text_splitter.split_text(text), budget)
+
+def group_pieces(pieces, budget=SUMMARY_GROUP_TOKENS):
+    groups = []
+    current = []
+    used = 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and used + tokens > budget:
+            groups.append("\n".join(current))
+            current = []
+            used = 0
+        current.append(piece)
+        used += tokens
+    if current:
+        groups.append("\n".join(current))
+    return groups
+
+# Groups to merge in the next reduce round. When adjacent summaries no longer fit one budget
+# together, grouping stops shrinking them, so they are merged in pairs instead: every round then
+# leaves fewer summaries, and the reduce ends with summaries that fit one call.
+def reduce_groups(summaries, groups):
+    if len(groups) < len(summaries):
+        return groups
+    return ["\n".join(summaries[i:i + 2]) for i in range(0, len(summaries), 2)]
+
+@stage("prompt_build")
+def map_prompt(group, part, parts):
+    return f"{MAP_PROMPT.format(part=part, parts=parts)}\n\n{group}"
+
+@stage("prompt_build")
+def combine_prompt(group):
+    return f"{COMBINE_PROMPT}\n\n{group}"
+
+@stage("prompt_build")
+def final_prompt(context):
+    return f"{SUMMARIZATION_PROMPT}\n\n{context}"
+
+# The estimate rules out long documents before they are tokenized
+def fits_single_call(text):
+    return estimate_tokens(text) <= 2 * SUMMARY_SINGLE_CALL_TOKENS and count_tokens(text) <= SUMMARY_SINGLE_CALL_TOKENS
+
+# Summarize groups concurrently (map), then merge the partial summaries level by level (reduce)
+def map_reduce_summary(text, model):
+    # Short documents fit in one call: no splitting, no embedding
+    if fits_single_call(text):
+        return call_model(model, final_prompt(text))
+
+    groups = group_text(text)
+    set_progress("summary_parts", len(groups))
+    with ThreadPoolExecutor(max_workers=SUMMARY_MAX_CONCURRENCY, initializer=inherit_context()) as pool:
+        prompts = [map_prompt(group, i + 1, len(groups)) for i, group in enumerate(groups)]
+        summaries = list(pool.map(lambda prompt: call_model(model, prompt), prompts))
+
+        groups = group_pieces(summaries)
+        # Stop when the summaries fit one call
+        while len(groups) > 1:
+            summaries = list(pool.map(lambda group: call_model(model, combine_prompt(group)), reduce_groups(summaries, groups)))
+            groups = group_pieces(summaries)
+
+    return call_model(model, final_prompt(groups[0]))
+
+async def amap_reduce_summary(text, model):
+    # Counting tokens and grouping both tokenize the text, so they run off the event loop
+    if await run_blocking(fits_single_call, text):
+        return await acall_model(model, final_prompt(text))
+
+    limit = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+
+    async def call(prompt):
+        async with limit:
+            return await acall_model(model, prompt)
+
+    groups = await run_blocking(group_text, text)
+    summaries = await asyncio.gather(*[call(map_prompt(group, i + 1, len(groups))) for i, group in enumerate(groups)])
+
+    groups = await run_blocking(group_pieces, summaries)
+    while len(groups) > 1:
+        summaries = await asyncio.gather(*[call(combine_prompt(group)) for group in reduce_groups(summaries, groups)])
+        groups = await run_blocking(group_pieces, summaries)
+
+    return await acall_model(model, final_prompt(groups[0]))
+
+# Raises on failure; background jobs call it directly so a failed summary fails the job
+def summarize(text, model, knowledgebase=None, mode=None):
+    if (mode or SUMMARY_MODE) == "map_reduce":
+        return map_reduce_summary(text, model)
+
+    context = retrieve_context(text, model, knowledgebase)
+    return summarize_context(model, context)
+
+def summarize_text(text, model, knowledgebase=None, mode=None):
+    try:
+        return summarize(text, model, knowledgebase, mode)
+    except (UnknownModelError, AdmissionError):
+        raise
     except Exception as e:
-        # Log the error
-        print(f"Error in summarize_text: {str(e)}")
+        logger.exception("Error in summarize_text")
         # Return a meaningful error message
-        return f"An error occurred during summarization: {str(e)}" 
\ No newline at end of file
+        return f"An error occurred during summarization: {str(e)}"
+
+async def asummarize_text(text, model, knowledgebase=None, mode=None):
+    try:
+        if (mode or SUMMARY_MODE) == "map_reduce":
+            return await amap_reduce_summary(text, model)
+
+        context = await run_blocking(retrieve_context, text, model, knowledgebase)
+        return await acall_model(model, final_prompt(context))
+    except (UnknownModelError, AdmissionError):
+        raise
+    except Exception as e:
+        logger.exception("Error in asummarize_text")
+        return f"An error occurred during summarization: {str(e)}"
\ No newline at end of file
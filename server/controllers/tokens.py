@@ -0,0 +1,68 @@
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+# "auto" never touches the network: it uses a tokenizer.json already on disk (TOKENIZER_FILE, or TOKENIZER_MODEL in
+# the Hugging Face cache) and the estimate otherwise. "tiktoken" and "huggingface" download their files when missing.
+TOKENIZER = os.getenv("TOKENIZER", "auto")  # "auto", "tiktoken", "huggingface" or "estimate"
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")  # tiktoken
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "openai-community/gpt2")  # huggingface tokenizer.json
+TOKENIZER_FILE = os.getenv("TOKENIZER_FILE", "")  # local tokenizer.json, used instead of TOKENIZER_MODEL
+
+# Rough token count for budgeting prompts: about four characters per token for English text
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+_tokenizer = None
+_lock = threading.Lock()
+
+def _load_tiktoken():
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return f"tiktoken:{TOKENIZER_ENCODING}", lambda text: len(encoding.encode(text, disallowed_special=()))
+
+def _load_huggingface(local_files_only=False):
+    from huggingface_hub import hf_hub_download
+    from tokenizers import Tokenizer
+
+    if TOKENIZER_FILE:
+        name, path = os.path.basename(TOKENIZER_FILE), TOKENIZER_FILE
+    else:
+        name, path = TOKENIZER_MODEL, hf_hub_download(TOKENIZER_MODEL, "tokenizer.json", local_files_only=local_files_only)
+    tokenizer = Tokenizer.from_file(path)
+    tokenizer.no_truncation()
+    return f"huggingface:{name}", lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+def _load():
+    if TOKENIZER == "tiktoken":
+        return _load_tiktoken()
+    if TOKENIZER == "huggingface":
+        return _load_huggingface()
+    if TOKENIZER == "auto":
+        try:
+            return _load_huggingface(local_files_only=True)
+        except Exception as e:
+            logger.warning("No local %s tokenizer (set TOKENIZER_FILE or download it), estimating token counts instead: %s",
+                           TOKENIZER_FILE or TOKENIZER_MODEL, e)
+    return "estimate", estimate_tokens
+
+# (name, count function), loaded once per process
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                _tokenizer = _load()
+    return _tokenizer
+
+def tokenizer_name():
+    return get_tokenizer()[0]
+
+# Token count from the local tokenizer. Providers count with their own tokenizers, so budgets keep some headroom
+def count_tokens(text):
+    return get_tokenizer()[1](text) if text else 0
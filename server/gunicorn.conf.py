@@ -0,0 +1,44 @@
+import os
+import time
+import tempfile
+import multiprocessing
+
+# Production entry point: gunicorn (run from this directory, it reads this file by default)
+# The app, heavy imports and embedding weights load once in the master; workers are forked from
+# it and share that memory copy-on-write. HTTP pools, executors and model thread pools are
+# created lazily, so each worker gets its own after the fork.
+config_loaded = time.perf_counter()
+
+os.environ.setdefault("PRELOAD_EMBEDDINGS", "true")
+os.environ["PRELOAD_WARM_UP"] = "worker"
+# Workers write their metrics here and /metrics merges them; it must start empty
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="coba-metrics-")
+
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+# Threads keep a worker busy while its requests wait on the LLM provider
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+preload_app = True
+
+def when_ready(server):
+    from controllers.startup import process_memory, format_memory
+
+    seconds = time.perf_counter() - config_loaded
+    server.log.info(f"Master ready in {seconds * 1000:.0f}ms ({format_memory(process_memory())})")
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+def post_worker_init(worker):
+    from controllers.startup import init_worker
+
+    init_worker(worker.forked_at, worker.log)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
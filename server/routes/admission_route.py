@@ -0,0 +1,16 @@
+from flask import request, jsonify
+from controllers.admission import admit_request, admission_stats
+from routes.common import client_key, UNMETERED_METHODS
+
+# Admission control: per-key limits checked as requests arrive, and the current queues and buckets.
+# Provider limits (controllers/admission.py) become 429 or 503 with Retry-After through the shared
+# error handlers (routes/errors_route.py).
+def admission_controller(app):
+    @app.before_request
+    def admit():
+        if request.method not in UNMETERED_METHODS:
+            admit_request(client_key(request.headers, request.remote_addr), request.content_length)
+
+    @app.route("/admission-stats", methods=["GET"])
+    def admission_stats_route():
+        return jsonify(admission_stats())
@@ -0,0 +1,378 @@
+import time
+import asyncio
+from quart import request, jsonify, g, Response, current_app
+from controllers.summarizer import asummarize_text
+from controllers.sentiment_analyzer import aanalyze_sentiment, aanalyze_sentiment_batch, aanalyze_sentiment_long
+from controllers.ner_extractor import aextract_entities, aextract_entities_batch, aextract_entities_long
+from controllers.code_generator import aextract_code, stream_code
+from controllers.generative_qa import agenerate_answer, stream_answer
+from controllers.rag_based_qa import (aanswer_query_from_document, stream_answer_from_document, aanswer_query_from_corpus,
+                                      stream_answer_from_corpus, extract_text_from_file, process_text)
+from controllers.document_store import document_store
+from controllers.executor import run_blocking, iterate_blocking
+from controllers.extraction import upload_digest
+from controllers.llm_provider import resolve_model
+from controllers.routing import router, ROUTING_ENABLED
+from controllers.admission import admit_request, admission_stats
+from controllers.single_flight import acoalesce, flight_key
+from controllers.result_cache import result_cache
+from controllers.semantic_cache import semantic_cache
+from controllers.metrics import start_timings, current_timings, observe_request, server_timing, render_metrics, SERVER_TIMING_ENABLED
+from controllers.job_queue import get_job_queue, JOB_EVENTS_INTERVAL
+from routes import common
+from routes.common import (summarize_request, sentiment_request, entities_request, batch_request, code_request, answer_request,
+                           document_query_request, corpus_query_request, require_multipart, require_upload, parse_mode, parse_tags,
+                           corpus_index, json_object, document_body, job_body, job_event, cancel_status, token_events, error_response,
+                           client_key, RequestError, HANDLED_ERRORS, UNMETERED_METHODS, SSE_HEADERS, DEFAULT_MODEL)
+
+# Parsing, validation and error mapping live in routes/common.py, shared with the Flask routes;
+# this module only adapts them to Quart and awaits the async controllers.
+
+async def json_body():
+    return json_object(await request.get_json(silent=True))
+
+def wants_stream():
+    return common.wants_stream(request.args, request.headers)
+
+def wants_job(form):
+    return common.wants_job(request.args, form)
+
+def job_response(job, status=200):
+    body, headers = job_body(job)
+    return jsonify(body), status, headers
+
+# Saving the upload and the SQLite writes block, so they run on the executor
+async def submit_job(kind, uploaded_file, params, form):
+    priority = common.job_priority(request.args, form)
+    if "model" in params:
+        resolve_model(params["model"])
+    return job_response(await run_blocking(get_job_queue().submit, kind, uploaded_file, params, priority), 202)
+
+async def job_events(job_id):
+    queue = get_job_queue()
+    last = None
+    while True:
+        job = await run_blocking(queue.get, job_id)
+        event, finished = job_event(job, last)
+        if event is not None:
+            yield event
+        if finished:
+            return
+        last = job
+        await asyncio.sleep(JOB_EVENTS_INTERVAL)
+
+# Provider streams are blocking iterators; each token is pulled on the executor
+def sse_response(tokens, started=None, done=None):
+    path = request.path
+    logger = current_app.logger
+    events = token_events(tokens, started or time.perf_counter(), done, lambda line: logger.info(f"{path} {line}"))
+    return Response(iterate_blocking(events), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+# The existing endpoints served from the ASGI app with async provider calls
+def async_controller(app):
+    async def handle(e):
+        body, status, headers = error_response(e)
+        return jsonify(body), status, headers
+
+    for error in HANDLED_ERRORS:
+        app.register_error_handler(error, handle)
+
+    @app.before_request
+    async def start_request_timing():
+        g.request_started = time.perf_counter()
+        start_timings()
+
+    @app.before_request
+    async def admit():
+        if request.method not in UNMETERED_METHODS:
+            admit_request(client_key(request.headers, request.remote_addr), request.content_length)
+
+    @app.after_request
+    async def record_request_timing(response):
+        elapsed = time.perf_counter() - g.pop("request_started", time.perf_counter())
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        observe_request(route, request.method, response.status_code, request.content_length, response.content_length, elapsed)
+        if SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = server_timing(current_timings(), elapsed)
+            response.headers["Timing-Allow-Origin"] = "*"
+        return response
+
+    @app.route('/summarize-text', methods=['POST'])
+    async def summarize_txt():
+        data = await request.get_json(silent=True)
+        text_input, model, mode = summarize_request(data if isinstance(data, dict) else await request.form)
+
+        summary = await asummarize_text(text_input, model, mode=mode)
+        return jsonify({"summary": summary})
+
+    @app.route('/summarize-doc', methods=['POST'])
+    async def summarize_doc():
+        files = await request.files
+        form = await request.form
+        uploaded_file = require_upload(files)
+        model = form.get("model", DEFAULT_MODEL)
+        mode = parse_mode(form.get("mode"))
+        if wants_job(form):
+            return await submit_job("summarize", uploaded_file, {"model": model, "mode": mode}, form)
+
+        async def compute():
+            text = await run_blocking(extract_text_from_file, uploaded_file)
+            return await asummarize_text(text, model, mode=mode)
+
+        key = flight_key("summarize-doc", model, mode, await run_blocking(upload_digest, uploaded_file))
+        summary = await acoalesce("summarize-doc", key, compute)
+        return jsonify({"summary": summary})
+
+    @app.route("/analyze_sentiment", methods=["POST"])
+    async def analyze_sentiment_route():
+        text_input, model_choice, use_cache, long = sentiment_request(await json_body())
+
+        if long:
+            try:
+                return jsonify(await aanalyze_sentiment_long(text_input, model_choice, use_cache))
+            except ValueError as e:
+                raise RequestError(str(e))
+
+        sentiment = await aanalyze_sentiment(text_input, model_choice, use_cache)
+        return jsonify({"sentiment": sentiment})
+
+    @app.route("/extract_entities", methods=["POST"])
+    async def extract_entities_route():
+        text, model_choice, use_cache, long = entities_request(await json_body())
+
+        if long:
+            try:
+                return jsonify(await aextract_entities_long(text, model_choice, use_cache))
+            except ValueError as e:
+                raise RequestError(str(e))
+
+        entities = await aextract_entities(text, model_choice, use_cache)
+        return jsonify({"entities": entities})
+
+    @app.route("/analyze_sentiment_batch", methods=["POST"])
+    async def analyze_sentiment_batch_route():
+        texts, model_choice = batch_request(await json_body())
+        results = await aanalyze_sentiment_batch(texts, model_choice)
+        return jsonify({"results": results})
+
+    @app.route("/extract_entities_batch", methods=["POST"])
+    async def extract_entities_batch_route():
+        texts, model_choice = batch_request(await json_body())
+        results = await aextract_entities_batch(texts, model_choice)
+        return jsonify({"results": results})
+
+    @app.route('/generate-code', methods=['POST'])
+    async def generate_code():
+        started = time.perf_counter()
+        text, model_choice, language, use_cache = code_request(await json_body())
+
+        if wants_stream():
+            return sse_response(stream_code(text, model_choice, language), started)
+
+        code = await aextract_code(text, model_choice, language, use_cache)
+        return jsonify({"code": code})
+
+    @app.route("/generate-answer", methods=["POST"])
+    async def generate_answer_route():
+        started = time.perf_counter()
+        text, model_choice, use_cache = answer_request(await json_body())
+
+        if wants_stream():
+            return sse_response(stream_answer(text, model_choice, use_cache), started)
+
+        answer = await agenerate_answer(text, model_choice, use_cache)
+        return jsonify({"answer": answer})
+
+    @app.route("/answer-query-from-document", methods=["POST"])
+    async def answer_query_from_document_route():
+        started = time.perf_counter()
+        require_multipart(request.content_type)
+        files = await request.files
+        form = await request.form
+        uploaded_file = require_upload(files, "No file part in the request", "No file selected")
+
+        model_choice = form.get("model", DEFAULT_MODEL)
+        query = form.get("query", "")
+
+        try:
+            text = await run_blocking(extract_text_from_file, uploaded_file)
+
+            if wants_stream():
+                tokens, usage = await run_blocking(stream_answer_from_document, text, query, model_choice)
+                return sse_response(tokens, started, {"usage": usage})
+
+            answer, usage = await aanswer_query_from_document(text, query, model_choice)
+            return jsonify({"answer": answer, "usage": usage})
+
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/documents", methods=["POST"])
+    async def create_document_route():
+        files = await request.files
+        form = await request.form
+        uploaded_file = require_upload(files, "No file part in the request", "No file selected")
+        if wants_job(form):
+            return await submit_job("index", uploaded_file, {}, form)
+
+        try:
+            text = await run_blocking(extract_text_from_file, uploaded_file)
+            knowledgebase = await run_blocking(process_text, text)
+            document = await run_blocking(document_store.add, uploaded_file.filename, text, knowledgebase)
+            return jsonify(document_body(document)), 201
+
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/documents/<document_id>/query", methods=["POST"])
+    async def query_document_route(document_id):
+        started = time.perf_counter()
+        document = await run_blocking(document_store.get, document_id)
+        if document is None:
+            return jsonify({"error": "Document not found or expired"}), 404
+
+        query, model_choice = document_query_request(await json_body())
+
+        try:
+            if wants_stream():
+                tokens, usage = await run_blocking(stream_answer_from_document, document.text, query, model_choice, document.knowledgebase)
+                return sse_response(tokens, started, {"usage": usage})
+
+            answer, usage = await aanswer_query_from_document(document.text, query, model_choice, document.knowledgebase)
+            return jsonify({"answer": answer, "usage": usage})
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/documents/<document_id>/summarize", methods=["POST"])
+    async def summarize_document_route(document_id):
+        document = await run_blocking(document_store.get, document_id)
+        if document is None:
+            return jsonify({"error": "Document not found or expired"}), 404
+
+        data = await json_body()
+        model_choice = data.get("model", DEFAULT_MODEL)
+        mode = parse_mode(data.get("mode"))
+
+        summary = await asummarize_text(document.text, model_choice, document.knowledgebase, mode)
+        return jsonify({"summary": summary})
+
+    @app.route("/documents/<document_id>", methods=["DELETE"])
+    async def delete_document_route(document_id):
+        if not await run_blocking(document_store.remove, document_id):
+            return jsonify({"error": "Document not found or expired"}), 404
+        return "", 204
+
+    @app.route("/jobs/summarize", methods=["POST"])
+    async def submit_summarize_job():
+        files = await request.files
+        form = await request.form
+        uploaded_file = require_upload(files)
+        model = form.get("model", DEFAULT_MODEL)
+        mode = parse_mode(form.get("mode"))
+        return await submit_job("summarize", uploaded_file, {"model": model, "mode": mode}, form)
+
+    @app.route("/jobs/index", methods=["POST"])
+    async def submit_index_job():
+        files = await request.files
+        form = await request.form
+        return await submit_job("index", require_upload(files), {}, form)
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    async def get_job_route(job_id):
+        job = await run_blocking(get_job_queue().get, job_id)
+        if job is None:
+            return jsonify({"error": "Job not found or expired"}), 404
+        return job_response(job)
+
+    @app.route("/jobs/<job_id>/events", methods=["GET"])
+    async def job_events_route(job_id):
+        if await run_blocking(get_job_queue().get, job_id) is None:
+            return jsonify({"error": "Job not found or expired"}), 404
+        return Response(job_events(job_id), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    @app.route("/jobs/<job_id>", methods=["DELETE"])
+    async def cancel_job_route(job_id):
+        job = await run_blocking(get_job_queue().cancel, job_id)
+        if job is None:
+            return jsonify({"error": "Job not found or expired"}), 404
+        return job_response(job, cancel_status(job))
+
+    @app.route("/corpus/documents", methods=["POST"])
+    async def add_corpus_document_route():
+        files = await request.files
+        form = await request.form
+        uploaded_file = require_upload(files)
+        tags = parse_tags(form.get("tags"))
+        document_id = form.get("document_id") or None
+        if wants_job(form):
+            return await submit_job("corpus", uploaded_file, {"tags": tags, "document_id": document_id}, form)
+
+        text = await run_blocking(extract_text_from_file, uploaded_file)
+        try:
+            document = await run_blocking(corpus_index().add, text, uploaded_file.filename, tags, document_id)
+            return jsonify(document), 201
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.route("/corpus/documents", methods=["GET"])
+    async def list_corpus_documents_route():
+        limit = request.args.get("limit", 100, type=int)
+        offset = request.args.get("offset", 0, type=int)
+        documents = await run_blocking(corpus_index().documents, request.args.get("tag"), min(limit, 1000), offset)
+        return jsonify({"documents": documents})
+
+    @app.route("/corpus/documents/<document_id>", methods=["DELETE"])
+    async def remove_corpus_document_route(document_id):
+        if not await run_blocking(corpus_index().remove, document_id):
+            return jsonify({"error": "Document not found"}), 404
+        return "", 204
+
+    @app.route("/corpus/search", methods=["POST"])
+    async def search_corpus_route():
+        query, _, k, document_ids, tags = corpus_query_request(await json_body())
+        return jsonify({"results": await run_blocking(corpus_index().search, query, k, document_ids, tags)})
+
+    @app.route("/corpus/query", methods=["POST"])
+    async def query_corpus_route():
+        query, model_choice, k, document_ids, tags = corpus_query_request(await json_body())
+
+        try:
+            if wants_stream():
+                tokens, usage = await run_blocking(stream_answer_from_corpus, query, model_choice, k, document_ids, tags)
+                return sse_response(tokens, done={"usage": usage})
+
+            answer, sources, usage = await aanswer_query_from_corpus(query, model_choice, k, document_ids, tags)
+            return jsonify({"answer": answer, "sources": sources, "usage": usage})
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/corpus/stats", methods=["GET"])
+    async def corpus_stats_route():
+        return jsonify(await run_blocking(corpus_index().stats))
+
+    @app.route("/routing-stats", methods=["GET"])
+    async def routing_stats_route():
+        return jsonify({"enabled": ROUTING_ENABLED, "models": router.stats()})
+
+    @app.route("/admission-stats", methods=["GET"])
+    async def admission_stats_route():
+        return jsonify(admission_stats())
+
+    @app.route("/cache-stats", methods=["GET"])
+    async def cache_stats_route():
+        return jsonify({"results": result_cache.stats(), "semantic": semantic_cache.stats()})
+
+    @app.route("/metrics", methods=["GET"])
+    async def metrics_route():
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
@@ -0,0 +1,9 @@
+from flask import jsonify
+from controllers.result_cache import result_cache
+from controllers.semantic_cache import semantic_cache
+
+# Hit and miss counters for the result and semantic answer caches
+def cache_controller(app):
+    @app.route("/cache-stats", methods=["GET"])
+    def cache_stats_route():
+        return jsonify({"results": result_cache.stats(), "semantic": semantic_cache.stats()})
@@ -1,19 +1,20 @@
+import time
 from flask import request, jsonify
-from controllers.code_generator import extract_code
+from controllers.code_generator import extract_code, stream_code
+from routes.common import code_request, json_object
+from routes.streaming import wants_stream, sse_response
 
 def code_generation_controller(app):
     @app.route('/generate-code', methods=['POST'])
     def generate_code():
-        data = request.get_json()
-        text = data.get('text', '')
-        model_choice = data.get('model_choice', 'LLama 3.3 Meta')
-        language = data.get('language', 'python')
+        started = time.perf_counter()
+        text, model_choice, language, use_cache = code_request(json_object(request.get_json(silent=True)))
 
-        if not text:
-            return jsonify({"error": "No text provided for code extraction"}), 400
+        if wants_stream():
+            return sse_response(stream_code(text, model_choice, language), started)
 
-        # Extract entities using the selected model
-        code = extract_code(text, model_choice, language)
+        # Extract code using the selected model
+        code = extract_code(text, model_choice, language, use_cache)
 
-        # Return extracted entities as JSON
-        return jsonify({"code": code})
\ No newline at end of file
+        # Return the code as JSON
+        return jsonify({"code": code})
@@ -0,0 +1,206 @@
+import json
+import time
+from controllers.admission import AdmissionError, ADMISSION_KEY_HEADER
+from controllers.extraction import ExtractionError
+from controllers.llm_provider import UnknownModelError
+from controllers.long_text import ChunksFailedError
+from controllers.document_store import DocumentTooLargeError, DOCUMENT_TTL_SECONDS
+from controllers.job_queue import JobQueueFullError, TERMINAL_STATUSES
+from controllers.summarizer import SUMMARY_MODE, SUMMARY_MODES
+from controllers.batching import validate_batch
+
+# Request parsing, validation and error mapping shared by the Flask routes and the Quart app
+# (routes/async_routes.py). Nothing here touches a framework: the routes pass in the request's JSON,
+# form, args and headers and turn the results into responses.
+
+DEFAULT_MODEL = "LLama 3.3 Meta"
+
+# Requests that only read state are never counted against a key
+UNMETERED_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# A request the client has to fix, answered with its message and status
+class RequestError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+# Errors every route answers as JSON with their status_code; see error_response
+HANDLED_ERRORS = (RequestError, ExtractionError, UnknownModelError, AdmissionError, ChunksFailedError, DocumentTooLargeError, JobQueueFullError)
+
+def error_response(e):
+    body = {"error": str(e)}
+    headers = {}
+    if isinstance(e, AdmissionError):
+        body["retry_after"] = round(e.retry_after, 1)
+        headers["Retry-After"] = e.retry_after_header
+    if isinstance(e, ChunksFailedError):
+        body["chunks"] = e.chunks
+    return body, e.status_code, headers
+
+# The parsed JSON body, or an empty one when it is missing, malformed or not an object
+def json_object(value):
+    return value if isinstance(value, dict) else {}
+
+# true or 1, as JSON or as "true" / "1" from a form or query string; anything else, "false" included, is off
+def flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true")
+    if isinstance(value, bool):
+        return value
+    return isinstance(value, int) and value == 1
+
+def use_cache(data):
+    return not flag(data.get("no_cache"))
+
+def client_key(headers, remote_addr):
+    return headers.get(ADMISSION_KEY_HEADER) or remote_addr or "unknown"
+
+def parse_mode(value):
+    mode = value or SUMMARY_MODE
+    if mode not in SUMMARY_MODES:
+        raise RequestError(f"Invalid mode. Supported modes are: {', '.join(SUMMARY_MODES)}")
+    return mode
+
+def require(value, message):
+    if not value:
+        raise RequestError(message)
+    return value
+
+# /summarize-text, from a JSON body or a form
+def summarize_request(data):
+    text = require(data.get("text", ""), "Text input cannot be empty.")
+    return text, data.get("model", DEFAULT_MODEL), parse_mode(data.get("mode"))
+
+def sentiment_request(data):
+    text = require(data.get("text_input", ""), "No text provided for sentiment analysis")
+    return text, data.get("model", DEFAULT_MODEL), use_cache(data), flag(data.get("long"))
+
+def entities_request(data):
+    text = require(data.get("text", ""), "No text provided for entity extraction")
+    return text, data.get("model", DEFAULT_MODEL), use_cache(data), flag(data.get("long"))
+
+def batch_request(data):
+    texts = data.get("texts", [])
+    try:
+        validate_batch(texts)
+    except ValueError as e:
+        raise RequestError(str(e))
+    return texts, data.get("model", DEFAULT_MODEL)
+
+def code_request(data):
+    text = require(data.get("text", ""), "No text provided for code extraction")
+    return text, data.get("model_choice", DEFAULT_MODEL), data.get("language", "python"), use_cache(data)
+
+def answer_request(data):
+    text = require(data.get("text", ""), "No text provided for generating answers")
+    return text, data.get("model", DEFAULT_MODEL), use_cache(data)
+
+def document_query_request(data):
+    query = require(data.get("query", ""), "No query provided")
+    return query, data.get("model", DEFAULT_MODEL)
+
+# numpy and FAISS load with the corpus index on its first use
+def corpus_index():
+    from controllers.corpus_index import get_corpus_index
+
+    return get_corpus_index()
+
+def parse_tags(value):
+    return [tag.strip() for tag in (value or "").split(",") if tag.strip()]
+
+# Query options shared by /corpus/search and /corpus/query
+def corpus_query_request(data):
+    query = require(data.get("query", ""), "No query provided")
+    try:
+        k = int(data.get("k", 3))
+    except (TypeError, ValueError):
+        raise RequestError("k must be an integer")
+    document_ids = data.get("document_ids") or None
+    tags = data.get("tags") or None
+    for name, values in (("document_ids", document_ids), ("tags", tags)):
+        if values is not None and not (isinstance(values, list) and all(isinstance(value, str) for value in values)):
+            raise RequestError(f"{name} must be a list of strings")
+    return query, data.get("model", DEFAULT_MODEL), k, document_ids, tags
+
+def require_multipart(content_type):
+    if not content_type or "multipart/form-data" not in content_type:
+        raise RequestError("Content-Type must be multipart/form-data", 415)
+
+# The "file" part of a multipart upload; an upload without a filename counts as missing
+def require_upload(files, missing="Please provide a document file.", unnamed=None):
+    uploaded_file = files.get("file")
+    if uploaded_file is None:
+        raise RequestError(missing)
+    if not uploaded_file.filename:
+        raise RequestError(unnamed or missing)
+    return uploaded_file
+
+def document_body(document):
+    return {
+        "document_id": document.id,
+        "filename": document.filename,
+        "characters": len(document.text),
+        "expires_in": DOCUMENT_TTL_SECONDS
+    }
+
+# Streaming is opt-in through the Accept header or ?stream=1; JSON stays the default
+def wants_stream(args, headers):
+    if flag(args.get("stream")):
+        return True
+    return "text/event-stream" in headers.get("Accept", "")
+
+# Background processing is opt-in through ?job=1 or a job form field on the document upload routes
+def wants_job(args, form):
+    return flag(args.get("job") or form.get("job"))
+
+def job_priority(args, form):
+    try:
+        return int(form.get("priority") or args.get("priority") or 0)
+    except ValueError:
+        raise RequestError("priority must be an integer")
+
+# The job with links to follow it, and its Location header
+def job_body(job):
+    body = dict(job, status_url=f"/jobs/{job['id']}", events_url=f"/jobs/{job['id']}/events")
+    return body, {"Location": body["status_url"]}
+
+# A running job stops at its next checkpoint; 202 until then
+def cancel_status(job):
+    return 200 if job["status"] in TERMINAL_STATUSES else 202
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+# The event for a job's latest state, or None when it has not changed; the stream ends after a final event
+def job_event(job, last):
+    if job is None:
+        return sse_event({"error": "Job not found or expired"}, "error"), True
+    if job["status"] in TERMINAL_STATUSES:
+        return sse_event(job, "done"), True
+    if job != last:
+        return sse_event(job, "progress"), False
+    return None, False
+
+# Forward provider tokens as server-sent events as soon as they arrive; done carries extra fields for
+# the final event, such as prompt token usage, and log receives the timing line once the stream ends
+def token_events(tokens, started, done, log):
+    first_token = None
+    try:
+        for token in tokens:
+            if first_token is None:
+                first_token = time.perf_counter()
+            yield sse_event({"token": token})
+    except AdmissionError as e:
+        # The 200 has already been sent, so the status and retry hint travel in the event
+        yield sse_event({"error": str(e), "status": e.status_code, "retry_after": e.retry_after}, "error")
+    except Exception as e:
+        yield sse_event({"error": str(e)}, "error")
+
+    finished = time.perf_counter()
+    ttfb_ms = round(((first_token or finished) - started) * 1000, 1)
+    total_ms = round((finished - started) * 1000, 1)
+    log(f"streamed: ttfb={ttfb_ms}ms total={total_ms}ms")
+    yield sse_event(dict(done or {}, ttfb_ms=ttfb_ms, total_ms=total_ms), "done")
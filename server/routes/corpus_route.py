@@ -0,0 +1,60 @@
+from flask import request, jsonify
+from controllers.rag_based_qa import answer_query_from_corpus, stream_answer_from_corpus, extract_text_from_file
+from routes.common import require_upload, parse_tags, corpus_query_request, corpus_index, json_object, HANDLED_ERRORS
+from routes.streaming import wants_stream, sse_response
+from routes.jobs_route import wants_job, submit_job
+
+# The corpus controller: documents indexed once and searched together
+def corpus_controller(app):
+    @app.route("/corpus/documents", methods=["POST"])
+    def add_corpus_document_route():
+        uploaded_file = require_upload(request.files)
+        tags = parse_tags(request.form.get("tags"))
+        document_id = request.form.get("document_id") or None
+        if wants_job():
+            return submit_job("corpus", uploaded_file, {"tags": tags, "document_id": document_id})
+
+        text = extract_text_from_file(uploaded_file)
+        try:
+            return jsonify(corpus_index().add(text, uploaded_file.filename, tags, document_id)), 201
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.route("/corpus/documents", methods=["GET"])
+    def list_corpus_documents_route():
+        limit = request.args.get("limit", 100, type=int)
+        offset = request.args.get("offset", 0, type=int)
+        return jsonify({"documents": corpus_index().documents(request.args.get("tag"), min(limit, 1000), offset)})
+
+    @app.route("/corpus/documents/<document_id>", methods=["DELETE"])
+    def remove_corpus_document_route(document_id):
+        if not corpus_index().remove(document_id):
+            return jsonify({"error": "Document not found"}), 404
+        return "", 204
+
+    @app.route("/corpus/search", methods=["POST"])
+    def search_corpus_route():
+        query, _, k, document_ids, tags = corpus_query_request(json_object(request.get_json(silent=True)))
+        return jsonify({"results": corpus_index().search(query, k, document_ids, tags)})
+
+    @app.route("/corpus/query", methods=["POST"])
+    def query_corpus_route():
+        query, model_choice, k, document_ids, tags = corpus_query_request(json_object(request.get_json(silent=True)))
+
+        try:
+            if wants_stream():
+                tokens, usage = stream_answer_from_corpus(query, model_choice, k, document_ids, tags)
+                return sse_response(tokens, done={"usage": usage})
+
+            answer, sources, usage = answer_query_from_corpus(query, model_choice, k, document_ids, tags)
+            return jsonify({"answer": answer, "sources": sources, "usage": usage})
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/corpus/stats", methods=["GET"])
+    def corpus_stats_route():
+        return jsonify(corpus_index().stats())
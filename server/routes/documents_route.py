@@ -0,0 +1,66 @@
+import time
+from flask import request, jsonify
+from controllers.rag_based_qa import answer_query_from_document, stream_answer_from_document, extract_text_from_file, process_text
+from controllers.summarizer import summarize_text
+from controllers.document_store import document_store
+from routes.common import require_upload, document_query_request, document_body, parse_mode, json_object, HANDLED_ERRORS, DEFAULT_MODEL
+from routes.streaming import wants_stream, sse_response
+from routes.jobs_route import wants_job, submit_job
+
+# The document controller: upload a file once, then query or summarize it many times
+def documents_controller(app):
+    @app.route("/documents", methods=["POST"])
+    def create_document_route():
+        uploaded_file = require_upload(request.files, "No file part in the request", "No file selected")
+        if wants_job():
+            return submit_job("index", uploaded_file, {})
+
+        try:
+            text = extract_text_from_file(uploaded_file)
+            document = document_store.add(uploaded_file.filename, text, process_text(text))
+            return jsonify(document_body(document)), 201
+
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/documents/<document_id>/query", methods=["POST"])
+    def query_document_route(document_id):
+        started = time.perf_counter()
+        document = document_store.get(document_id)
+        if document is None:
+            return jsonify({"error": "Document not found or expired"}), 404
+
+        query, model_choice = document_query_request(json_object(request.get_json(silent=True)))
+
+        try:
+            if wants_stream():
+                tokens, usage = stream_answer_from_document(document.text, query, model_choice, document.knowledgebase)
+                return sse_response(tokens, started, {"usage": usage})
+
+            answer, usage = answer_query_from_document(document.text, query, model_choice, document.knowledgebase)
+            return jsonify({"answer": answer, "usage": usage})
+        except HANDLED_ERRORS:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/documents/<document_id>/summarize", methods=["POST"])
+    def summarize_document_route(document_id):
+        document = document_store.get(document_id)
+        if document is None:
+            return jsonify({"error": "Document not found or expired"}), 404
+
+        data = json_object(request.get_json(silent=True))
+        model_choice = data.get("model", DEFAULT_MODEL)
+        mode = parse_mode(data.get("mode"))
+
+        summary = summarize_text(document.text, model_choice, document.knowledgebase, mode)
+        return jsonify({"summary": summary})
+
+    @app.route("/documents/<document_id>", methods=["DELETE"])
+    def delete_document_route(document_id):
+        if not document_store.remove(document_id):
+            return jsonify({"error": "Document not found or expired"}), 404
+        return "", 204
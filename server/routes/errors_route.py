@@ -0,0 +1,12 @@
+from flask import jsonify
+from routes.common import error_response, HANDLED_ERRORS
+
+# Client errors, unknown models, shed calls and failed chunked work are answered as JSON with their
+# status wherever they are raised (routes/common.py)
+def errors_controller(app):
+    def handle(e):
+        body, status, headers = error_response(e)
+        return jsonify(body), status, headers
+
+    for error in HANDLED_ERRORS:
+        app.register_error_handler(error, handle)
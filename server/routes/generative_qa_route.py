@@ -1,20 +1,21 @@
+import time
 from flask import request, jsonify
-from controllers.generative_qa import generate_answer
+from controllers.generative_qa import generate_answer, stream_answer
+from routes.common import answer_request, json_object
+from routes.streaming import wants_stream, sse_response
 
 # The Generative QA controller
 def generative_qa_controller(app):
     @app.route("/generate-answer", methods=["POST"])
     def generate_answer_route():
-        data = request.json
-        # Get user input from the request
-        text = data.get("text", "")
-        model_choice = data.get("model", "LLama 3.3 Meta")
+        started = time.perf_counter()
+        text, model_choice, use_cache = answer_request(json_object(request.get_json(silent=True)))
 
-        if not text:
-            return jsonify({"error": "No text provided for generating answers"}), 400
+        if wants_stream():
+            return sse_response(stream_answer(text, model_choice, use_cache), started)
 
-        # Extract entities using the selected model
-        answer = generate_answer(text, model_choice)
+        # Answer with the selected model
+        answer = generate_answer(text, model_choice, use_cache)
 
-        # Return extracted entities as JSON
-        return jsonify({"answer": answer}) 
\ No newline at end of file
+        # Return the answer as JSON
+        return jsonify({"answer": answer})
@@ -0,0 +1,72 @@
+import time
+from flask import request, jsonify
+from controllers.job_queue import get_job_queue, JOB_EVENTS_INTERVAL
+from controllers.llm_provider import resolve_model
+from routes import common
+from routes.common import require_upload, parse_mode, job_body, job_event, cancel_status, DEFAULT_MODEL
+from routes.streaming import event_stream
+
+def wants_job():
+    return common.wants_job(request.args, request.form)
+
+def job_response(job, status=200):
+    body, headers = job_body(job)
+    return jsonify(body), status, headers
+
+# Queue an upload for a job worker and answer 202 with where to follow it
+def submit_job(kind, uploaded_file, params):
+    priority = common.job_priority(request.args, request.form)
+    # Unknown models are rejected now rather than when the job runs
+    if "model" in params:
+        resolve_model(params["model"])
+    return job_response(get_job_queue().submit(kind, uploaded_file, params, priority), 202)
+
+# Poll the job's row and forward every change; the stream ends with a done event once the job finishes
+def job_events(job_id):
+    def generate():
+        queue = get_job_queue()
+        last = None
+        while True:
+            job = queue.get(job_id)
+            event, finished = job_event(job, last)
+            if event is not None:
+                yield event
+            if finished:
+                return
+            last = job
+            time.sleep(JOB_EVENTS_INTERVAL)
+
+    return event_stream(generate())
+
+# The jobs controller: long-running document work that survives the request and the process
+def jobs_controller(app):
+    @app.route("/jobs/summarize", methods=["POST"])
+    def submit_summarize_job():
+        uploaded_file = require_upload(request.files)
+        model = request.form.get("model", DEFAULT_MODEL)
+        mode = parse_mode(request.form.get("mode"))
+        return submit_job("summarize", uploaded_file, {"model": model, "mode": mode})
+
+    @app.route("/jobs/index", methods=["POST"])
+    def submit_index_job():
+        return submit_job("index", require_upload(request.files), {})
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    def get_job_route(job_id):
+        job = get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found or expired"}), 404
+        return job_response(job)
+
+    @app.route("/jobs/<job_id>/events", methods=["GET"])
+    def job_events_route(job_id):
+        if get_job_queue().get(job_id) is None:
+            return jsonify({"error": "Job not found or expired"}), 404
+        return job_events(job_id)
+
+    @app.route("/jobs/<job_id>", methods=["DELETE"])
+    def cancel_job_route(job_id):
+        job = get_job_queue().cancel(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found or expired"}), 404
+        return job_response(job, cancel_status(job))
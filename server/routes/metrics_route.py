@@ -0,0 +1,26 @@
+import time
+from flask import Response, request, g
+from controllers.metrics import start_timings, current_timings, observe_request, server_timing, render_metrics, SERVER_TIMING_ENABLED
+
+# Request timing for every route, the optional Server-Timing header, and the Prometheus scrape endpoint
+def metrics_controller(app):
+    @app.before_request
+    def start_request_timing():
+        g.request_started = time.perf_counter()
+        start_timings()
+
+    @app.after_request
+    def record_request_timing(response):
+        elapsed = time.perf_counter() - g.pop("request_started", time.perf_counter())
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        # Streamed bodies have no length yet; their LLM timings are in the final SSE event
+        observe_request(route, request.method, response.status_code, request.content_length, response.content_length, elapsed)
+        if SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = server_timing(current_timings(), elapsed)
+            response.headers["Timing-Allow-Origin"] = "*"
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_route():
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
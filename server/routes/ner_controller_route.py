@@ -1,20 +1,30 @@
 from flask import request, jsonify
-from controllers.ner_extractor import extract_entities
+from controllers.ner_extractor import extract_entities, extract_entities_batch, extract_entities_long
+from routes.common import entities_request, batch_request, json_object, RequestError
 
 # The NER controller
 def ner_controller(app):
     @app.route("/extract_entities", methods=["POST"])
     def extract_entities_route():
-        data = request.json
-        # Get user input from the request
-        text = data.get("text", "")
-        model_choice = data.get("model", "LLama 3.3 Meta")
+        text, model_choice, use_cache, long = entities_request(json_object(request.get_json(silent=True)))
 
-        if not text:
-            return jsonify({"error": "No text provided for entity extraction"}), 400
+        # Long-text mode: chunked extraction merged into typed entities with offsets
+        if long:
+            try:
+                return jsonify(extract_entities_long(text, model_choice, use_cache))
+            except ValueError as e:
+                raise RequestError(str(e))
 
         # Extract entities using the selected model
-        entities = extract_entities(text, model_choice)
+        entities = extract_entities(text, model_choice, use_cache)
 
         # Return extracted entities as JSON
-        return jsonify({"entities": entities})
\ No newline at end of file
+        return jsonify({"entities": entities})
+
+    @app.route("/extract_entities_batch", methods=["POST"])
+    def extract_entities_batch_route():
+        texts, model_choice = batch_request(json_object(request.get_json(silent=True)))
+
+        # One result or error per input text, in input order
+        results = extract_entities_batch(texts, model_choice)
+        return jsonify({"results": results})
@@ -1,31 +1,32 @@
+import time
 from flask import request, jsonify
-from controllers.rag_based_qa import answer_query_from_document, extract_text_from_file
+from controllers.rag_based_qa import answer_query_from_document, stream_answer_from_document, extract_text_from_file
+from routes.common import require_multipart, require_upload, HANDLED_ERRORS, DEFAULT_MODEL
+from routes.streaming import wants_stream, sse_response
 
 def rag_based_qa_controller(app):
     @app.route("/answer-query-from-document", methods=["POST"])
     def answer_query_from_document_route():
+        started = time.perf_counter()
         # First check if request is multipart/form-data
-        if not request.content_type or 'multipart/form-data' not in request.content_type:
-            return jsonify({"error": "Content-Type must be multipart/form-data"}), 415
-            
-        if 'file' not in request.files:
-            return jsonify({"error": "No file part in the request"}), 400
-            
-        uploaded_file = request.files['file']
-        if uploaded_file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-            
+        require_multipart(request.content_type)
+        uploaded_file = require_upload(request.files, "No file part in the request", "No file selected")
+
         # Get other form data
-        model_choice = request.form.get("model", "LLama 3.3 Meta")
+        model_choice = request.form.get("model", DEFAULT_MODEL)
         query = request.form.get("query", "")
 
         try:
             text = extract_text_from_file(uploaded_file)
-            if "Unsupported file type." in text or "Error reading file:" in text:
-                return jsonify({"error": text}), 400
-                
-            answer = answer_query_from_document(text, query, model_choice)
-            return jsonify({"answer": answer})
-            
+
+            if wants_stream():
+                tokens, usage = stream_answer_from_document(text, query, model_choice)
+                return sse_response(tokens, started, {"usage": usage})
+
+            answer, usage = answer_query_from_document(text, query, model_choice)
+            return jsonify({"answer": answer, "usage": usage})
+
+        except HANDLED_ERRORS:
+            raise
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
\ No newline at end of file
+            return jsonify({"error": str(e)}), 500
@@ -0,0 +1,8 @@
+from flask import jsonify
+from controllers.routing import router, ROUTING_ENABLED
+
+# Model routing: the rolling per-model latency and error rates behind hedging and failover
+def routing_controller(app):
+    @app.route("/routing-stats", methods=["GET"])
+    def routing_stats_route():
+        return jsonify({"enabled": ROUTING_ENABLED, "models": router.stats()})
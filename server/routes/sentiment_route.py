@@ -1,20 +1,30 @@
 from flask import request, jsonify
-from controllers.sentiment_analyzer import analyze_sentiment
+from controllers.sentiment_analyzer import analyze_sentiment, analyze_sentiment_batch, analyze_sentiment_long
+from routes.common import sentiment_request, batch_request, json_object, RequestError
 
 # The sentiment analysis controller
 def sentiment_controller(app):
     @app.route("/analyze_sentiment", methods=["POST"])
     def analyze_sentiment_route():
-        data = request.json  # Access JSON data
-        # Get user input from the request
-        text_input = data.get("text_input", "")  
-        model_choice = data.get("model", "LLama 3.3 Meta")  # Default to "LLama 3.3 Meta"
+        text_input, model_choice, use_cache, long = sentiment_request(json_object(request.get_json(silent=True)))
 
-        if not text_input:
-            return jsonify({"error": "No text provided for sentiment analysis"}), 400
+        # Long-text mode: chunked analysis aggregated with per-chunk scores
+        if long:
+            try:
+                return jsonify(analyze_sentiment_long(text_input, model_choice, use_cache))
+            except ValueError as e:
+                raise RequestError(str(e))
 
         # Analyze sentiment using the selected model
-        sentiment = analyze_sentiment(text_input, model_choice)
+        sentiment = analyze_sentiment(text_input, model_choice, use_cache)
 
         # Return sentiment result as JSON
         return jsonify({"sentiment": sentiment})
+
+    @app.route("/analyze_sentiment_batch", methods=["POST"])
+    def analyze_sentiment_batch_route():
+        texts, model_choice = batch_request(json_object(request.get_json(silent=True)))
+
+        # One result or error per input text, in input order
+        results = analyze_sentiment_batch(texts, model_choice)
+        return jsonify({"results": results})
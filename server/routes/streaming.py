@@ -0,0 +1,20 @@
+import time
+from flask import Response, request, current_app, stream_with_context
+from routes import common
+from routes.common import token_events, SSE_HEADERS
+
+def wants_stream():
+    return common.wants_stream(request.args, request.headers)
+
+# Tokens as server-sent events (routes/common.py), timed from started
+def sse_response(tokens, started=None, done=None):
+    path = request.path
+    logger = current_app.logger
+    return event_stream(token_events(tokens, started or time.perf_counter(), done, lambda line: logger.info(f"{path} {line}")))
+
+def event_stream(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS
+    )
@@ -1,39 +1,33 @@
 from flask import request, jsonify
 from controllers.summarizer import summarize_text, extract_text_from_file
+from controllers.extraction import upload_digest
+from controllers.single_flight import coalesce, flight_key
+from routes.common import summarize_request, require_upload, parse_mode, DEFAULT_MODEL
+from routes.jobs_route import wants_job, submit_job
 
 # The summarize controller
 def summarize_controller(app):
     @app.route('/summarize-text', methods=['POST'])
     def summarize_txt():
-        # Check if the request has JSON data
-        if request.is_json:
-            text_input = request.json.get("text", "")
-        else:
-            text_input = request.form.get("text", "")
-        
-        model = request.json.get("model", "LLama 3.3 Meta")
+        # JSON body, or a form when the request has none
+        data = request.get_json(silent=True)
+        text_input, model, mode = summarize_request(data if isinstance(data, dict) else request.form)
 
-        if not text_input:
-            return jsonify({"error": "Text input cannot be empty."}), 400
-        
         # Call the model and get the summary
-        summary = summarize_text(text_input, model)
-        
+        summary = summarize_text(text_input, model, mode=mode)
+
         # Return summary as JSON
         return jsonify({"summary": summary})
-    
+
     @app.route('/summarize-doc', methods=['POST'])
     def summarize_doc():
-        uploaded_file = request.files.get("file")
-        model = request.form.get("model", "LLama 3.3 Meta")  
-
-        if not uploaded_file:
-            return jsonify({"error": "Please provide a document file."}), 400
+        uploaded_file = require_upload(request.files)
+        model = request.form.get("model", DEFAULT_MODEL)
+        mode = parse_mode(request.form.get("mode"))
+        if wants_job():
+            return submit_job("summarize", uploaded_file, {"model": model, "mode": mode})
 
-        text = extract_text_from_file(uploaded_file)
-        if "Unsupported file type." in text or "Error reading file:" in text:
-            return jsonify({"error": text}), 400        
-
-        summary = summarize_text(text, model)
+        # Clients uploading the same document at once share one extraction and summary
+        key = flight_key("summarize-doc", model, mode, upload_digest(uploaded_file))
+        summary = coalesce("summarize-doc", key, lambda: summarize_text(extract_text_from_file(uploaded_file), model, mode=mode))
         return jsonify({"summary": summary})
-
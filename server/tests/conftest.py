@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+# Set before any controller module reads its configuration: fake providers and embeddings, and
+# every cache and database in a scratch directory
+_scratch = tempfile.mkdtemp(prefix="coba-tests-")
+for name, value in {
+    "LLM_BACKEND": "fake",
+    "EMBEDDING_BACKEND": "fake",
+    "TOKENIZER": "estimate",
+    "FAKE_LLM_LATENCY": "0",
+    "FAKE_LLM_TOKENS_PER_SECOND": "0",
+    "JOBS_DB": os.path.join(_scratch, "jobs.sqlite3"),
+    "JOBS_DIR": os.path.join(_scratch, "jobs"),
+    "DOCUMENT_DB": os.path.join(_scratch, "documents.sqlite3"),
+    "INDEX_CACHE_DIR": os.path.join(_scratch, "faiss"),
+    "CHUNK_STORE_DIR": os.path.join(_scratch, "chunks"),
+    "CORPUS_DIR": os.path.join(_scratch, "corpus"),
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "RESULT_CACHE_ENABLED": "false",
+}.items():
+    os.environ[name] = value
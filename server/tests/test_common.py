@@ -0,0 +1,27 @@
+import pytest
+
+from routes.common import flag, use_cache, sentiment_request, RequestError
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), (1, True), ("true", True), ("TRUE", True), ("1", True), (" 1 ", True),
+    (False, False), (0, False), (2, False), (1.5, False), ("false", False), ("0", False), ("", False), (None, False), ("yes", False)
+])
+def test_flag_accepts_true_and_1_in_json_and_string_forms(value, expected):
+    assert flag(value) is expected
+
+def test_no_cache_false_as_a_string_keeps_the_cache():
+    assert use_cache({"no_cache": "false"})
+    assert use_cache({})
+    assert not use_cache({"no_cache": True})
+    assert not use_cache({"no_cache": 1})
+    assert not use_cache({"no_cache": "1"})
+
+def test_long_mode_is_parsed_like_no_cache():
+    assert sentiment_request({"text_input": "fine", "long": "false"})[3] is False
+    assert sentiment_request({"text_input": "fine", "long": "true"})[3] is True
+    assert sentiment_request({"text_input": "fine", "long": 1})[3] is True
+
+def test_missing_text_is_a_request_error():
+    with pytest.raises(RequestError) as error:
+        sentiment_request({})
+    assert error.value.status_code == 400
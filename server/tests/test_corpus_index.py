@@ -0,0 +1,161 @@
+import os
+
+import pytest
+
+from controllers import corpus_index
+from controllers.corpus_index import CorpusIndex
+
+DOCUMENTS = 60
+
+# About five chunks per document; the fake embeddings score a chunk's own text 1.0
+def text(i, version=0):
+    return "\n".join(f"Document {i} version {version} line {j} " + "about the quarterly figures " * 3 for j in range(60))
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_index, "CORPUS_TRAIN_MIN", 256)
+    # Merges run when the test calls merge(), not in the background
+    monkeypatch.setattr(CorpusIndex, "_maybe_merge", lambda self: None)
+    return str(tmp_path)
+
+@pytest.fixture
+def corpus(directory):
+    corpus = CorpusIndex(directory)
+    for i in range(DOCUMENTS):
+        corpus.add(text(i), f"d{i}.txt", ["even" if i % 2 == 0 else "odd"], f"d{i}")
+    return corpus
+
+def chunk(corpus, document_id, position=2):
+    return corpus._conn.execute("SELECT text FROM chunks WHERE document_id = ? AND position = ?", (document_id, position)).fetchone()[0]
+
+def top(corpus, query, **filters):
+    result = corpus.search(query, 1, **filters)[0]
+    return result["document_id"], result["text"] == query, result["score"]
+
+def found(corpus, document_id, query, k=10, **filters):
+    return any(result["document_id"] == document_id for result in corpus.search(query, k, **filters))
+
+def vector_rows(corpus):
+    return corpus._rows(corpus._meta("dim"))
+
+def test_added_chunks_are_found_before_and_after_a_merge(corpus):
+    query = chunk(corpus, "d7")
+    assert corpus.stats()["index"] is None
+    assert top(corpus, query) == ("d7", True, 1.0)
+
+    corpus.merge()
+    stats = corpus.stats()
+    assert stats["index"]["vectors"] == stats["chunks"]
+    assert stats["pending_additions"] == 0
+    assert top(corpus, query) == ("d7", True, 1.0)
+
+    corpus.add(text(99), "new.txt", ["new"], "d99")
+    assert corpus.stats()["pending_additions"] > 0
+    assert top(corpus, chunk(corpus, "d99")) == ("d99", True, 1.0)
+
+def test_removed_document_is_excluded_before_and_after_a_merge(corpus):
+    query = chunk(corpus, "d7")
+    assert corpus.remove("d7")
+    assert not corpus.remove("d7")
+    assert not found(corpus, "d7", query)
+
+    corpus.merge()
+    assert not found(corpus, "d7", query)
+
+    assert corpus.remove("d8")
+    assert corpus.stats()["pending_removals"] > 0
+    assert not found(corpus, "d8", chunk(corpus, "d9"), k=50)
+    corpus.merge()
+    assert corpus.stats()["pending_removals"] == 0
+    assert corpus.stats()["documents"] == DOCUMENTS - 2
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_tag_and_document_filters(corpus, merged):
+    if merged:
+        corpus.merge()
+    query = chunk(corpus, "d7")
+
+    assert not found(corpus, "d7", query, tags=["even"])
+    assert top(corpus, query, tags=["odd"]) == ("d7", True, 1.0)
+    assert {result["document_id"] for result in corpus.search(query, 10, document_ids=["d4", "d7"])} == {"d4", "d7"}
+    assert top(corpus, query, document_ids=["d4"])[0] == "d4"
+    assert corpus.search(query, 10, tags=["missing"]) == []
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_readding_a_document_id_replaces_it(corpus, merged):
+    if merged:
+        corpus.merge()
+    old = chunk(corpus, "d7")
+
+    corpus.add(text(7, version=1), "d7-v1.txt", ["replaced"], "d7")
+
+    assert corpus.stats()["documents"] == DOCUMENTS
+    assert all(result["text"] != old for result in corpus.search(old, 10))
+    assert top(corpus, chunk(corpus, "d7")) == ("d7", True, 1.0)
+    assert [document["tags"] for document in corpus.documents() if document["document_id"] == "d7"] == [["replaced"]]
+    corpus.merge()
+    assert top(corpus, chunk(corpus, "d7")) == ("d7", True, 1.0)
+
+def test_retrain_compacts_the_vector_file(corpus):
+    corpus.merge()
+    for i in range(DOCUMENTS):
+        corpus.add(text(i, version=1), f"d{i}.txt", (), f"d{i}")
+    live = corpus.stats()["chunks"]
+    assert vector_rows(corpus) == 2 * live
+    old_file = corpus._path("vectors_file")
+
+    corpus.merge(retrain=True)
+
+    assert vector_rows(corpus) == live
+    assert not os.path.exists(old_file)
+    ids = [row[0] for row in corpus._conn.execute("SELECT id FROM chunks ORDER BY id")]
+    assert ids == list(range(live))
+    assert corpus.stats()["pending_removals"] == 0
+    assert top(corpus, chunk(corpus, "d7")) == ("d7", True, 1.0)
+
+def test_merge_compacts_once_dead_rows_outnumber_live_ones(corpus, monkeypatch):
+    monkeypatch.setattr(corpus_index, "CORPUS_DELTA_MAX", 10)
+    corpus.merge()
+    trained = corpus._meta("trained_rows")
+    for version in (1, 2):
+        for i in range(DOCUMENTS):
+            corpus.add(text(i, version), f"d{i}.txt", (), f"d{i}")
+
+    corpus.merge()
+
+    assert vector_rows(corpus) == corpus.stats()["chunks"]
+    assert corpus._meta("trained_rows") == trained
+    assert top(corpus, chunk(corpus, "d30")) == ("d30", True, 1.0)
+
+def test_chunks_added_and_removed_during_a_compacting_merge_keep_their_vectors(corpus, monkeypatch):
+    corpus.merge()
+    for i in range(DOCUMENTS):
+        corpus.add(text(i, version=1), f"d{i}.txt", (), f"d{i}")
+
+    train = corpus._train
+    def add_while_training(vectors, ids):
+        corpus.add(text(99), "new.txt", (), "d99")
+        corpus.remove("d5")
+        return train(vectors, ids)
+    monkeypatch.setattr(corpus, "_train", add_while_training)
+
+    corpus.merge(retrain=True)
+
+    assert vector_rows(corpus) == corpus.stats()["chunks"] + corpus.stats()["pending_removals"]
+    assert top(corpus, chunk(corpus, "d99")) == ("d99", True, 1.0)
+    assert top(corpus, chunk(corpus, "d6")) == ("d6", True, 1.0)
+    assert not found(corpus, "d5", text(5, version=1).splitlines()[0], k=50)
+
+# Two instances on one directory stand in for two worker processes
+def test_other_processes_reload_after_a_compacting_merge(corpus, directory):
+    other = CorpusIndex(directory)
+    query = chunk(corpus, "d7")
+    assert top(other, query) == ("d7", True, 1.0)
+
+    for i in range(DOCUMENTS):
+        corpus.add(text(i, version=1), f"d{i}.txt", (), f"d{i}")
+    corpus.merge(retrain=True)
+
+    assert all(result["text"] != query for result in other.search(query, 50))
+    assert top(other, chunk(corpus, "d7")) == ("d7", True, 1.0)
+    assert other.stats()["index"]["vectors"] == other.stats()["chunks"]
@@ -0,0 +1,39 @@
+import pytest
+
+from controllers.document_store import DocumentStore
+from controllers.index_cache import index_cache
+from controllers.rag_based_qa import process_text
+
+TEXT = "\n".join(f"Line {i} of a document about the quarterly report from the Berlin office." for i in range(200))
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "documents.sqlite3")
+
+# Two stores on one database stand in for two worker processes
+def test_document_added_in_one_process_is_served_by_another(db_path):
+    document = DocumentStore(db_path).add("report.txt", TEXT, process_text(TEXT))
+    index_cache.clear()
+
+    loaded = DocumentStore(db_path).get(document.id)
+
+    assert loaded.filename == "report.txt"
+    assert loaded.text == TEXT
+    assert loaded.knowledgebase.index.ntotal == document.knowledgebase.index.ntotal
+
+def test_removed_document_is_gone_in_every_process(db_path):
+    first, second = DocumentStore(db_path), DocumentStore(db_path)
+    document = first.add("report.txt", TEXT, process_text(TEXT))
+    assert second.get(document.id) is not None
+
+    assert first.remove(document.id)
+
+    assert second.get(document.id) is None
+    assert not second.remove(document.id)
+
+def test_idle_document_expires(db_path):
+    store = DocumentStore(db_path, ttl=60)
+    document = store.add("report.txt", TEXT, process_text(TEXT))
+    store._connection().execute("UPDATE documents SET last_access = last_access - 61")
+
+    assert store.get(document.id) is None
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# An entry script with startup side effects, like app.py under `python app.py`
+MAIN = textwrap.dedent("""
+    import os
+    import sys
+    from controllers.startup import is_pool_child
+    from controllers.extraction import get_process_pool, shutdown_process_pool
+
+    def record(name):
+        with open(os.path.join(sys.argv[1], name), "a") as f:
+            f.write(f"{os.getpid()}\\n")
+
+    record("imported")
+    if not is_pool_child(__name__):
+        record("started")
+
+    if __name__ == "__main__":
+        pool = get_process_pool()
+        pids = {pool.submit(os.getpid).result() for _ in range(8)}
+        shutdown_process_pool()
+        print(len(pids - {os.getpid()}))
+""")
+
+def lines(path):
+    with open(path) as f:
+        return f.read().split()
+
+def test_pool_workers_skip_the_entry_scripts_startup(tmp_path):
+    script = tmp_path / "main.py"
+    script.write_text(MAIN)
+    env = dict(os.environ, PYTHONPATH=SERVER_DIR, EXTRACTION_WORKERS="2")
+    result = subprocess.run([sys.executable, str(script), str(tmp_path)], env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+
+    assert int(result.stdout) >= 1
+    # The workers imported the script again, but only the parent ran its startup
+    parent, *workers = lines(tmp_path / "imported")
+    assert workers
+    assert lines(tmp_path / "started") == [parent]
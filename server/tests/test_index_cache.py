@@ -0,0 +1,22 @@
+import shutil
+
+from controllers import index_cache
+from controllers.index_cache import IndexCache
+from controllers.rag_based_qa import build_knowledgebase
+
+TEXT = "\n".join(f"Line {i} of a report from the Lisbon office." for i in range(50))
+
+def test_entry_evicted_by_another_process_during_a_hit_is_a_miss(tmp_path, monkeypatch):
+    cache = IndexCache(str(tmp_path), disk_budget=10 ** 9)
+    cache._save_disk("key", build_knowledgebase(TEXT))
+
+    def evicted(path, *args, **kwargs):
+        shutil.rmtree(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(index_cache.os, "utime", evicted)
+
+    rebuilt = []
+    knowledgebase = cache.get_or_build("key", lambda: rebuilt.append(True) or build_knowledgebase(TEXT))
+
+    assert rebuilt
+    assert knowledgebase.index.ntotal > 0
@@ -0,0 +1,186 @@
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from controllers import job_queue
+from controllers.admission import OverloadedError
+from controllers.progress import set_progress
+from controllers.job_queue import JobQueue, JOB_MAX_ATTEMPTS
+
+class Upload:
+    def __init__(self, filename="notes.txt", data=b"Some text to process."):
+        self.filename = filename
+        self.stream = io.BytesIO(data)
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # Jobs are claimed and run by the test itself, not by worker threads
+    monkeypatch.setattr(JobQueue, "start", lambda self: None)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "jobs"), workers=0)
+
+@pytest.fixture
+def handlers(monkeypatch):
+    handlers = {}
+    monkeypatch.setattr(job_queue, "JOB_HANDLERS", handlers)
+    return handlers
+
+def set_columns(queue, job_id, **columns):
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    queue._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+def column(queue, job_id, name):
+    return queue._conn.execute(f"SELECT {name} FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_claim_takes_the_highest_priority_job_first(queue):
+    low = queue.submit("summarize", Upload(), {}, priority=0)
+    high = queue.submit("summarize", Upload(), {}, priority=5)
+
+    assert queue._claim()[0] == high["id"]
+    assert queue._claim()[0] == low["id"]
+    assert queue._claim() is None
+
+    job = queue.get(high["id"])
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+
+def test_claim_skips_jobs_that_are_not_due(queue):
+    job = queue.submit("summarize", Upload(), {})
+    set_columns(queue, job["id"], not_before=time.time() + 60)
+    assert queue._claim() is None
+
+    set_columns(queue, job["id"], not_before=time.time() - 1)
+    assert queue._claim()[0] == job["id"]
+
+def test_finished_job_keeps_its_result_and_drops_its_input(queue, handlers):
+    handlers["echo"] = lambda upload, params: {"text": upload.stream.read().decode(), "filename": params["filename"]}
+    job = queue.submit("echo", Upload(), {})
+
+    queue._run(*queue._claim())
+
+    job = queue.get(job["id"])
+    assert job["status"] == "done"
+    assert job["result"] == {"text": "Some text to process.", "filename": "notes.txt"}
+    assert not os.path.exists(os.path.join(queue.directory, job["id"]))
+
+def test_failed_job_records_the_error(queue, handlers):
+    def fail(upload, params):
+        raise RuntimeError("extraction broke")
+
+    handlers["fail"] = fail
+    job = queue.submit("fail", Upload(), {})
+
+    queue._run(*queue._claim())
+
+    job = queue.get(job["id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "extraction broke"
+
+def test_job_shed_by_admission_is_requeued_without_counting_the_attempt(queue, handlers):
+    def shed(upload, params):
+        raise OverloadedError("fake is at capacity, try again shortly", 30)
+
+    handlers["shed"] = shed
+    job = queue.submit("shed", Upload(), {})
+
+    queue._run(*queue._claim())
+
+    job = queue.get(job["id"])
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+    assert column(queue, job["id"], "not_before") > time.time() + 25
+    assert os.path.exists(column(queue, job["id"], "input_path"))
+    assert queue._claim() is None
+
+def test_job_of_a_dead_process_is_requeued(queue):
+    job = queue.submit("summarize", Upload(), {})
+    queue._claim()
+    set_columns(queue, job["id"], owner=f"{socket.gethostname()}:{dead_pid()}")
+
+    queue.maintain()
+
+    assert queue.get(job["id"])["status"] == "queued"
+    assert queue._claim()[0] == job["id"]
+    assert queue.get(job["id"])["attempts"] == 2
+
+def test_job_on_another_host_is_requeued_once_its_heartbeat_is_stale(queue):
+    job = queue.submit("summarize", Upload(), {})
+    queue._claim()
+    set_columns(queue, job["id"], owner="elsewhere:1", heartbeat=time.time())
+
+    queue.maintain()
+    assert queue.get(job["id"])["status"] == "running"
+
+    set_columns(queue, job["id"], heartbeat=time.time() - job_queue.JOB_STALE_SECONDS - 1)
+    queue.maintain()
+    assert queue.get(job["id"])["status"] == "queued"
+
+def test_job_interrupted_too_often_fails(queue):
+    job = queue.submit("summarize", Upload(), {})
+    queue._claim()
+    set_columns(queue, job["id"], owner=f"{socket.gethostname()}:{dead_pid()}", attempts=JOB_MAX_ATTEMPTS)
+
+    queue.maintain()
+
+    job = queue.get(job["id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "Job was interrupted too many times."
+
+def test_cancelling_a_queued_job_removes_it_from_the_queue(queue):
+    job = queue.submit("summarize", Upload(), {})
+
+    job = queue.cancel(job["id"])
+
+    assert job["status"] == "cancelled"
+    assert not os.path.exists(os.path.join(queue.directory, job["id"]))
+    assert queue._claim() is None
+
+def run_until_cancelled(started):
+    def handler(upload, params):
+        started.set()
+        step = 0
+        while True:
+            step += 1
+            set_progress("step", step)
+            time.sleep(0.01)
+    return handler
+
+def test_cancelling_a_running_job_stops_it_at_its_next_progress_report(queue, handlers):
+    started = threading.Event()
+    handlers["loop"] = run_until_cancelled(started)
+    job = queue.submit("loop", Upload(), {})
+    worker = threading.Thread(target=queue._run, args=queue._claim())
+    worker.start()
+    assert started.wait(5)
+
+    queue.cancel(job["id"])
+    worker.join(5)
+
+    assert not worker.is_alive()
+    assert queue.get(job["id"])["status"] == "cancelled"
+
+def test_cancellation_from_another_process_is_picked_up_by_maintenance(queue, handlers, tmp_path):
+    started = threading.Event()
+    handlers["loop"] = run_until_cancelled(started)
+    job = queue.submit("loop", Upload(), {})
+    worker = threading.Thread(target=queue._run, args=queue._claim())
+    worker.start()
+    assert started.wait(5)
+
+    other = JobQueue(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "jobs"), workers=0)
+    assert other.cancel(job["id"])["status"] == "running"
+    queue.maintain()
+    worker.join(5)
+
+    assert not worker.is_alive()
+    assert queue.get(job["id"])["status"] == "cancelled"
@@ -0,0 +1,79 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from controllers import result_cache
+from controllers.result_cache import ResultCache, cached_result
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(ttl=60, db_path=str(tmp_path / "results.sqlite3"))
+
+def test_database_is_opened_on_first_use(cache):
+    assert cache.store._conn is None
+    cache.set("key", "value")
+    assert cache.store._conn is not None
+
+def test_forked_process_reopens_the_database(cache):
+    cache.set("key", "value")
+    inherited = cache.store._conn
+    cache.store._pid = -1  # as seen from a forked worker
+
+    cache._entries.clear()
+    assert cache.get("namespace", "key") == "value"
+    assert cache.store._conn is not inherited
+
+def test_disk_hit_keeps_its_original_expiry(cache):
+    cache.set("key", "value")
+    stored = time.time() - 50
+    cache.store._connection().execute("UPDATE results SET created = ?", (stored,))
+    cache._entries.clear()
+
+    assert cache.get("namespace", "key") == "value"
+    assert cache._entries["key"][1] == stored
+
+@pytest.fixture
+def shared(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(result_cache, "result_cache", ResultCache())
+
+# Starts a request whose compute() blocks until released, and waits until it is the flight's leader
+def start_leader(use_cache):
+    running, release = threading.Event(), threading.Event()
+
+    def compute():
+        running.set()
+        release.wait()
+        return "leader"
+
+    thread = threading.Thread(target=cached_result, args=("test", "text", "model", 1, compute), kwargs={"use_cache": use_cache})
+    thread.start()
+    running.wait()
+    return thread, release
+
+# Joining the blocked leader would wait until it is released, after the assertion
+def within_seconds(call, seconds=5):
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        return pool.submit(call).result(timeout=seconds)
+    finally:
+        pool.shutdown(wait=False)
+
+def test_cached_request_does_not_join_an_uncached_one(shared):
+    thread, release = start_leader(use_cache=False)
+    try:
+        assert within_seconds(lambda: cached_result("test", "text", "model", 1, lambda: "cached")) == "cached"
+    finally:
+        release.set()
+        thread.join()
+    assert result_cache.result_cache.get("test", result_cache.result_cache_key("test", "text", "model", 1)) == "cached"
+
+def test_uncached_request_does_not_join_a_cached_one(shared):
+    thread, release = start_leader(use_cache=True)
+    try:
+        assert within_seconds(lambda: cached_result("test", "text", "model", 1, lambda: "fresh", use_cache=False)) == "fresh"
+    finally:
+        release.set()
+        thread.join()
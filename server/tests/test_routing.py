@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from controllers import llm_provider, routing
+from controllers.llm_provider import FakeBackend, MODELS, BACKENDS, register_backend, register_model, _complete
+from controllers.routing import Router
+
+class ProviderDown(Exception):
+    pass
+
+def failing(model_id, prompt):
+    raise ProviderDown(f"{model_id} is down")
+
+@pytest.fixture
+def models(monkeypatch):
+    # Each test model gets its own fake backend; nothing is forced onto the shared "fake" one
+    monkeypatch.setattr(llm_provider, "LLM_BACKEND", "")
+    monkeypatch.setattr(routing, "router", Router({"primary": ["alternate"], "alternate": ["primary"]}))
+    for name in ("primary", "alternate"):
+        monkeypatch.setitem(MODELS, name, MODELS.get(name))
+        monkeypatch.setitem(BACKENDS, f"test-{name}", BACKENDS.get(f"test-{name}"))
+
+    def add(name, **backend):
+        register_backend(f"test-{name}", FakeBackend(tokens_per_second=0, **backend))
+        register_model(name, f"test-{name}", name)
+    return add
+
+def call(model="primary"):
+    return routing.routed_call(model, lambda name: _complete(name, "prompt"), MODELS)
+
+def test_slow_call_is_hedged_to_an_equivalent(models, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_HEDGE_DEFAULT_SECONDS", 0.05)
+    models("primary", latency=1.0)
+    models("alternate", latency=0, response=lambda model_id, prompt: "from alternate")
+
+    started = time.perf_counter()
+    assert call() == "from alternate"
+    assert time.perf_counter() - started < 0.5
+
+def test_fast_call_is_not_hedged(models, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_HEDGE_DEFAULT_SECONDS", 0.5)
+    models("primary", latency=0, response=lambda model_id, prompt: "from primary")
+    models("alternate", response=failing)
+
+    assert call() == "from primary"
+    assert routing.router.stats().keys() == {"primary"}
+
+def test_hedge_clock_starts_when_the_attempt_runs(models, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_HEDGE_DEFAULT_SECONDS", 0.2)
+    models("primary", latency=0.1, response=lambda model_id, prompt: "from primary")
+    models("alternate", latency=0, response=lambda model_id, prompt: "from alternate")
+
+    # Delay the primary attempt past the hedge delay before it starts, as a busy pool would
+    timed = routing._timed
+    def queued(model, attempt, clock=None):
+        time.sleep(0.3)
+        return timed(model, attempt, clock)
+    monkeypatch.setattr(routing, "_timed", queued)
+
+    assert call() == "from primary"
+
+def test_full_pool_runs_inline_without_hedging(models, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_HEDGE_DEFAULT_SECONDS", 0.05)
+    monkeypatch.setattr(routing, "ROUTING_WORKERS", 0)
+    models("primary", latency=0.2, response=lambda model_id, prompt: "from primary")
+    models("alternate", latency=0, response=lambda model_id, prompt: "from alternate")
+
+    assert call() == "from primary"
+
+@pytest.mark.parametrize("workers", [32, 0])
+def test_error_fails_over_to_an_equivalent(models, monkeypatch, workers):
+    monkeypatch.setattr(routing, "ROUTING_WORKERS", workers)
+    models("primary", response=failing)
+    models("alternate", latency=0, response=lambda model_id, prompt: "from alternate")
+
+    assert call() == "from alternate"
+    assert routing.router.stats()["primary"]["error_rate"] == 1.0
+
+def test_first_error_is_raised_when_every_candidate_fails(models):
+    models("primary", response=failing)
+    models("alternate", response=failing)
+
+    with pytest.raises(ProviderDown, match="primary is down"):
+        call()
+
+def test_failing_model_is_demoted_until_its_errors_age_out(models, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_MIN_SAMPLES", 4)
+    models("primary", response=failing)
+    models("alternate", latency=0, response=lambda model_id, prompt: "from alternate")
+    assert routing.router.candidates("primary", MODELS) == ["primary", "alternate"]
+
+    for _ in range(4):
+        assert call() == "from alternate"
+    assert not routing.router.healthy("primary")
+    assert routing.router.candidates("primary", MODELS) == ["alternate", "primary"]
+
+    monkeypatch.setattr(routing, "ROUTING_WINDOW_SECONDS", 0)
+    time.sleep(0.01)
+    assert routing.router.candidates("primary", MODELS) == ["primary", "alternate"]
@@ -0,0 +1,33 @@
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+
+from controllers import tokens
+
+def test_auto_uses_a_local_tokenizer_file(tmp_path, monkeypatch):
+    tokenizer = Tokenizer(WordLevel({"[UNK]": 0, "hello": 1, "world": 2}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    path = tmp_path / "tokenizer.json"
+    tokenizer.save(str(path))
+    monkeypatch.setattr(tokens, "TOKENIZER", "auto")
+    monkeypatch.setattr(tokens, "TOKENIZER_FILE", str(path))
+
+    name, count = tokens._load()
+
+    assert name == "huggingface:tokenizer.json"
+    assert count("hello brave new world") == 4
+
+def test_auto_estimates_without_looking_online(monkeypatch):
+    monkeypatch.setattr(tokens, "TOKENIZER", "auto")
+    monkeypatch.setattr(tokens, "TOKENIZER_FILE", "")
+    monkeypatch.setattr(tokens, "TOKENIZER_MODEL", "example/not-in-the-cache")
+
+    def download(*args, local_files_only=False, **kwargs):
+        assert local_files_only
+        raise FileNotFoundError("not cached")
+    monkeypatch.setattr("huggingface_hub.hf_hub_download", download)
+
+    name, count = tokens._load()
+
+    assert name == "estimate"
+    assert count("x" * 40) == 10